@@ -0,0 +1,38 @@
+"""add notes keyset pagination index
+
+Revision ID: 004
+Revises: 003
+Create Date: 2026-10-19
+
+"""
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "004"
+down_revision = "003"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_notes_owner_id_updated_at_id",
+            "notes",
+            ["owner_id", sa.text("updated_at DESC"), sa.text("id DESC")],
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            "ix_notes_owner_id_updated_at_id",
+            table_name="notes",
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
@@ -0,0 +1,51 @@
+"""add indexes for note listing and permission lookups
+
+Revision ID: 005
+Revises: 004
+Create Date: 2026-10-19
+
+notes.owner_id lookups (listing, note-limit counts) are served by the
+leading column of ix_notes_owner_id_updated_at_id from revision 004.
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "005"
+down_revision = "004"
+branch_labels = None
+depends_on = None
+
+
+INDEXES = [
+    (
+        "ix_note_permissions_note_id_user_id",
+        "note_permissions",
+        ["note_id", "user_id"],
+    ),
+    ("ix_note_permissions_user_id", "note_permissions", ["user_id"]),
+]
+
+
+def upgrade() -> None:
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            op.create_index(
+                name,
+                table,
+                columns,
+                postgresql_concurrently=True,
+                if_not_exists=True,
+            )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, table, _ in reversed(INDEXES):
+            op.drop_index(
+                name,
+                table_name=table,
+                postgresql_concurrently=True,
+                if_exists=True,
+            )
@@ -0,0 +1,44 @@
+"""add maintained note count to users
+
+Revision ID: 006
+Revises: 005
+Create Date: 2026-10-19
+
+"""
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "006"
+down_revision = "005"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "users",
+        sa.Column(
+            "note_count", sa.Integer(), nullable=False, server_default="0"
+        ),
+    )
+
+    # Backfill from existing notes
+    op.execute(
+        """
+        UPDATE users
+        SET note_count = counts.note_count
+        FROM (
+            SELECT owner_id, count(*) AS note_count
+            FROM notes
+            WHERE owner_id IS NOT NULL
+            GROUP BY owner_id
+        ) AS counts
+        WHERE users.id = counts.owner_id
+        """
+    )
+
+
+def downgrade() -> None:
+    op.drop_column("users", "note_count")
@@ -0,0 +1,29 @@
+"""add note revision
+
+Revision ID: 007
+Revises: 006
+Create Date: 2026-10-19
+
+"""
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "007"
+down_revision = "006"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "notes",
+        sa.Column(
+            "revision", sa.Integer(), nullable=False, server_default="1"
+        ),
+    )
+
+
+def downgrade() -> None:
+    op.drop_column("notes", "revision")
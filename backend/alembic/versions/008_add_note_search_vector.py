@@ -0,0 +1,50 @@
+"""add note full-text search vector
+
+Revision ID: 008
+Revises: 007
+Create Date: 2026-10-19
+
+Content lives in MongoDB, so existing notes are indexed by
+``python -m app.maintenance reindex-search`` rather than here.
+
+"""
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "008"
+down_revision = "007"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "notes",
+        sa.Column("search_vector", postgresql.TSVECTOR(), nullable=True),
+    )
+
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_notes_search_vector",
+            "notes",
+            ["search_vector"],
+            postgresql_using="gin",
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            "ix_notes_search_vector",
+            table_name="notes",
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
+
+    op.drop_column("notes", "search_vector")
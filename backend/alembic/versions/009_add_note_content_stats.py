@@ -0,0 +1,43 @@
+"""add note content preview and stats
+
+Revision ID: 009
+Revises: 008
+Create Date: 2026-10-19
+
+Content lives in MongoDB, so existing notes are filled in by
+``python -m app.maintenance refresh-note-stats`` rather than here.
+
+"""
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "009"
+down_revision = "008"
+branch_labels = None
+depends_on = None
+
+
+COUNT_COLUMNS = ["char_count", "line_count", "word_count"]
+
+
+def upgrade() -> None:
+    op.add_column(
+        "notes", sa.Column("content_preview", sa.String(), nullable=True)
+    )
+    for name in COUNT_COLUMNS:
+        op.add_column(
+            "notes",
+            sa.Column(name, sa.Integer(), nullable=False, server_default="0"),
+        )
+    op.add_column(
+        "notes", sa.Column("content_hash", sa.String(64), nullable=True)
+    )
+
+
+def downgrade() -> None:
+    op.drop_column("notes", "content_hash")
+    for name in reversed(COUNT_COLUMNS):
+        op.drop_column("notes", name)
+    op.drop_column("notes", "content_preview")
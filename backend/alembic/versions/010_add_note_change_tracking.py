@@ -0,0 +1,176 @@
+"""add note change tracking and tombstones
+
+Revision ID: 010
+Revises: 009
+Create Date: 2026-10-19
+
+notes.change_xid holds the id of the transaction that inserted the note or
+last bumped its revision. note_tombstones records notes leaving a user's
+list: the owner's when a note is deleted, a grantee's when a permission is
+deleted (including by cascade from the note). Both are maintained by
+triggers so every write path is covered.
+
+"""
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "010"
+down_revision = "009"
+branch_labels = None
+depends_on = None
+
+
+INDEXES = [
+    ("ix_notes_owner_id_change_xid_id", ["owner_id", "change_xid", "id"]),
+    ("ix_notes_change_xid_id", ["change_xid", "id"]),
+]
+
+CURRENT_XID = "pg_current_xact_id()::text::bigint"
+
+
+def upgrade() -> None:
+    op.add_column(
+        "notes",
+        sa.Column(
+            "change_xid", sa.BigInteger(), nullable=False, server_default="0"
+        ),
+    )
+
+    op.create_table(
+        "note_tombstones",
+        sa.Column("user_id", postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column("note_id", postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column("change_xid", sa.BigInteger(), nullable=False),
+        sa.Column("deleted_at", sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint("user_id", "note_id"),
+    )
+    op.create_index(
+        "ix_note_tombstones_user_id_change_xid",
+        "note_tombstones",
+        ["user_id", "change_xid"],
+    )
+    op.create_index(
+        "ix_note_tombstones_deleted_at", "note_tombstones", ["deleted_at"]
+    )
+
+    op.execute(
+        f"""
+        CREATE FUNCTION notes_track_change() RETURNS trigger AS $$
+        BEGIN
+            NEW.change_xid := {CURRENT_XID};
+            RETURN NEW;
+        END;
+        $$ LANGUAGE plpgsql
+        """
+    )
+    # Every change to a note's representation bumps its revision
+    op.execute(
+        """
+        CREATE TRIGGER notes_track_insert
+        BEFORE INSERT ON notes
+        FOR EACH ROW EXECUTE FUNCTION notes_track_change()
+        """
+    )
+    op.execute(
+        """
+        CREATE TRIGGER notes_track_update
+        BEFORE UPDATE ON notes
+        FOR EACH ROW WHEN (NEW.revision IS DISTINCT FROM OLD.revision)
+        EXECUTE FUNCTION notes_track_change()
+        """
+    )
+
+    op.execute(
+        f"""
+        CREATE FUNCTION note_tombstone(p_note_id uuid, p_user_id uuid)
+        RETURNS void AS $$
+            INSERT INTO note_tombstones
+                (user_id, note_id, change_xid, deleted_at)
+            VALUES (
+                p_user_id, p_note_id, {CURRENT_XID}, now() AT TIME ZONE 'utc'
+            )
+            ON CONFLICT (user_id, note_id) DO UPDATE
+            SET change_xid = EXCLUDED.change_xid,
+                deleted_at = EXCLUDED.deleted_at
+        $$ LANGUAGE sql
+        """
+    )
+    op.execute(
+        """
+        CREATE FUNCTION notes_tombstone_owner() RETURNS trigger AS $$
+        BEGIN
+            IF OLD.owner_id IS NOT NULL THEN
+                PERFORM note_tombstone(OLD.id, OLD.owner_id);
+            END IF;
+            RETURN OLD;
+        END;
+        $$ LANGUAGE plpgsql
+        """
+    )
+    op.execute(
+        """
+        CREATE TRIGGER notes_tombstone_owner
+        AFTER DELETE ON notes
+        FOR EACH ROW EXECUTE FUNCTION notes_tombstone_owner()
+        """
+    )
+    op.execute(
+        """
+        CREATE FUNCTION note_permissions_tombstone_user() RETURNS trigger AS $$
+        BEGIN
+            IF OLD.user_id IS NOT NULL THEN
+                PERFORM note_tombstone(OLD.note_id, OLD.user_id);
+            END IF;
+            RETURN OLD;
+        END;
+        $$ LANGUAGE plpgsql
+        """
+    )
+    op.execute(
+        """
+        CREATE TRIGGER note_permissions_tombstone_user
+        AFTER DELETE ON note_permissions
+        FOR EACH ROW EXECUTE FUNCTION note_permissions_tombstone_user()
+        """
+    )
+
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction
+    with op.get_context().autocommit_block():
+        for name, columns in INDEXES:
+            op.create_index(
+                name,
+                "notes",
+                columns,
+                postgresql_concurrently=True,
+                if_not_exists=True,
+            )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, _ in reversed(INDEXES):
+            op.drop_index(
+                name,
+                table_name="notes",
+                postgresql_concurrently=True,
+                if_exists=True,
+            )
+
+    op.execute(
+        "DROP TRIGGER note_permissions_tombstone_user ON note_permissions"
+    )
+    op.execute("DROP FUNCTION note_permissions_tombstone_user()")
+    op.execute("DROP TRIGGER notes_tombstone_owner ON notes")
+    op.execute("DROP FUNCTION notes_tombstone_owner()")
+    op.execute("DROP FUNCTION note_tombstone(uuid, uuid)")
+    op.execute("DROP TRIGGER notes_track_update ON notes")
+    op.execute("DROP TRIGGER notes_track_insert ON notes")
+    op.execute("DROP FUNCTION notes_track_change()")
+
+    op.drop_index("ix_note_tombstones_deleted_at", "note_tombstones")
+    op.drop_index("ix_note_tombstones_user_id_change_xid", "note_tombstones")
+    op.drop_table("note_tombstones")
+    op.drop_column("notes", "change_xid")
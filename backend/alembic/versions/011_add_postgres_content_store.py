@@ -0,0 +1,79 @@
+"""add tables for the postgres content store
+
+Revision ID: 011
+Revises: 010
+Create Date: 2026-10-19
+
+note_contents, note_versions and note_operations hold note content, its
+version history and the real-time operation log when CONTENT_STORE is
+"postgres", mirroring the MongoDB collections of the same names. They are
+empty until content is written or migrated there.
+
+"""
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "011"
+down_revision = "010"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "note_contents",
+        sa.Column("note_id", postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column("content", sa.Text(), nullable=False),
+        sa.Column("size", sa.Integer(), nullable=False),
+        sa.Column("revision", sa.Integer(), nullable=True),
+        sa.Column("history_since", sa.Integer(), nullable=True),
+        sa.Column(
+            "snapshot_revision",
+            sa.Integer(),
+            nullable=False,
+            server_default="0",
+        ),
+        sa.Column("created_at", sa.DateTime(), nullable=True),
+        sa.Column("updated_at", sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(["note_id"], ["notes.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("note_id"),
+    )
+
+    op.create_table(
+        "note_versions",
+        sa.Column("note_id", postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column("revision", sa.Integer(), nullable=False),
+        sa.Column("created_at", sa.DateTime(), nullable=False),
+        sa.Column("user_id", postgresql.UUID(as_uuid=True), nullable=True),
+        sa.Column("size", sa.Integer(), nullable=False),
+        sa.Column("ops", postgresql.JSONB(), nullable=False),
+        sa.Column(
+            "snapshot", sa.Boolean(), nullable=False, server_default="false"
+        ),
+        sa.Column("content", sa.Text(), nullable=True),
+        sa.ForeignKeyConstraint(["note_id"], ["notes.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("note_id", "revision"),
+    )
+
+    op.create_table(
+        "note_operations",
+        sa.Column("id", sa.BigInteger(), autoincrement=True, nullable=False),
+        sa.Column("note_id", postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column("operation", postgresql.JSONB(), nullable=False),
+        sa.Column("created_at", sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(["note_id"], ["notes.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(
+        "ix_note_operations_note_id", "note_operations", ["note_id"]
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_note_operations_note_id", "note_operations")
+    op.drop_table("note_operations")
+    op.drop_table("note_versions")
+    op.drop_table("note_contents")
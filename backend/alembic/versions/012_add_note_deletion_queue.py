@@ -0,0 +1,61 @@
+"""add note deletion queue
+
+Revision ID: 012
+Revises: 011
+Create Date: 2026-10-19
+
+note_deletions holds notes deleted from PostgreSQL whose content (and
+history and operation log) has not been purged from the content store
+yet. Deletes insert into it in the same statement that removes the note,
+so a note can no longer be deleted without its content being queued.
+
+The index on notes.mongodb_content_id lets the orphan sweep
+(reconcile-content) look up MongoDB documents by id in batches.
+
+"""
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "012"
+down_revision = "011"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "note_deletions",
+        sa.Column("note_id", postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column("mongodb_content_id", sa.String(), nullable=False),
+        sa.Column("deleted_at", sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint("note_id"),
+    )
+    op.create_index(
+        "ix_note_deletions_deleted_at", "note_deletions", ["deleted_at"]
+    )
+
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_notes_mongodb_content_id",
+            "notes",
+            ["mongodb_content_id"],
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            "ix_notes_mongodb_content_id",
+            table_name="notes",
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
+
+    op.drop_index("ix_note_deletions_deleted_at", "note_deletions")
+    op.drop_table("note_deletions")
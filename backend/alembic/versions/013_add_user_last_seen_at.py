@@ -0,0 +1,40 @@
+"""add users.last_seen_at
+
+Revision ID: 013
+Revises: 012
+Create Date: 2026-10-19
+
+Anonymous users are identified by signed tokens and cause no writes while
+they only read, so users.last_seen_at records when their session was last
+renewed. With their notes' updated_at it decides which anonymous users
+are stale (gc-anonymous-users). The now() default is evaluated once, so
+adding the column does not rewrite the table, and existing users count as
+seen at upgrade time: none is collected before a full retention window
+has passed.
+
+"""
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "013"
+down_revision = "012"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "users",
+        sa.Column(
+            "last_seen_at",
+            sa.DateTime(),
+            nullable=False,
+            server_default=sa.text("now()"),
+        ),
+    )
+
+
+def downgrade() -> None:
+    op.drop_column("users", "last_seen_at")
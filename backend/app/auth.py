@@ -1,5 +1,12 @@
+import base64
+import hashlib
+import hmac
+import json
+import time
 import uuid
-from typing import Optional
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import AsyncIterator, Optional
 
 from fastapi import (
     Depends,
@@ -12,11 +19,12 @@ from fastapi import (
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
 from jose import JWTError, jwt
 from keycloak import KeycloakOpenID
-from sqlalchemy import func, select
+from sqlalchemy import select, union_all, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.config import settings
-from app.database import get_db
+from app.database import READ_ONLY, AsyncSessionLocal, get_read_db
 from app.models import User
 
 security = HTTPBearer(auto_error=False)
@@ -29,17 +37,176 @@ keycloak_openid = KeycloakOpenID(
     client_secret_key=settings.KEYCLOAK_CLIENT_SECRET,
 )
 
+# Anonymous session transport
+ANONYMOUS_TOKEN_HEADER = "X-Anonymous-Token"
+ANONYMOUS_TOKEN_COOKIE = "anonymous_token"
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+
+def _sign(payload: str) -> str:
+    digest = hmac.new(
+        settings.ANONYMOUS_TOKEN_SECRET.encode(),
+        payload.encode(),
+        hashlib.sha256,
+    ).digest()
+    return _b64encode(digest)
+
+
+def issue_anonymous_token(user: User) -> str:
+    """
+    Issue an HMAC-signed token carrying an anonymous user's identity.
+    Format: base64url(JSON claims) "." base64url(HMAC-SHA256 signature)
+    """
+    created_at = user.created_at or datetime.utcnow()
+    claims = {
+        "sub": str(user.id),
+        "anon": True,
+        "premium": bool(user.is_premium),
+        "created_at": int((created_at - datetime(1970, 1, 1)).total_seconds()),
+        "iat": int(time.time()),
+    }
+    payload = _b64encode(json.dumps(claims, separators=(",", ":")).encode())
+    return f"{payload}.{_sign(payload)}"
+
+
+def verify_anonymous_token(token: str) -> Optional[dict]:
+    """
+    Verify an anonymous token and return its claims, or None if the
+    signature is wrong, the payload is malformed or the token expired.
+    """
+    payload, _, signature = token.partition(".")
+    # Compared as bytes: compare_digest rejects non-ASCII str arguments
+    if not payload or not hmac.compare_digest(
+        signature.encode(), _sign(payload).encode()
+    ):
+        return None
+
+    try:
+        claims = json.loads(_b64decode(payload))
+        uuid.UUID(claims["sub"])
+        issued_at = int(claims["iat"])
+    except (ValueError, KeyError, TypeError):
+        return None
+
+    if not claims.get("anon"):
+        return None
+    if time.time() - issued_at > settings.ANONYMOUS_TOKEN_MAX_AGE:
+        return None
+
+    return claims
+
+
+def new_anonymous_user() -> User:
+    """
+    Build a fresh anonymous identity without touching the database.
+    The row is created lazily by get_or_create_anonymous_user on first write.
+    """
+    return User(
+        id=uuid.uuid4(),
+        is_anonymous=True,
+        is_premium=False,
+        created_at=datetime.utcnow(),
+    )
+
+
+def set_anonymous_session(response: Response, user: User) -> str:
+    """
+    Attach a freshly signed anonymous token to the response as both a
+    cookie and a header (for clients that keep it in localStorage).
+    """
+    token = issue_anonymous_token(user)
+    response.set_cookie(
+        key=ANONYMOUS_TOKEN_COOKIE,
+        value=token,
+        httponly=True,
+        max_age=settings.ANONYMOUS_TOKEN_MAX_AGE,
+        samesite="lax",
+    )
+    response.headers[ANONYMOUS_TOKEN_HEADER] = token
+    return token
+
+
+def _anonymous_user_from_claims(claims: dict) -> User:
+    """Rebuild a transient (not persisted) User from token claims."""
+    return User(
+        id=uuid.UUID(claims["sub"]),
+        is_anonymous=True,
+        is_premium=bool(claims.get("premium", False)),
+        created_at=datetime.utcfromtimestamp(
+            claims.get("created_at", claims["iat"])
+        ),
+    )
+
+
+@asynccontextmanager
+async def _writable(db: AsyncSession) -> AsyncIterator[AsyncSession]:
+    """
+    db itself, or a primary session when db is a read-only one: users are
+    looked up on replicas, but provisioned and touched on the primary.
+    """
+    if db.info.get(READ_ONLY):
+        async with AsyncSessionLocal() as session:
+            yield session
+    else:
+        yield db
+
+
+def _decode_keycloak_token(token: str) -> dict:
+    """
+    Verify a Keycloak access token against the realm's public key and
+    return its claims. Raises JWTError if the token is invalid.
+    """
+    pub_key = keycloak_openid.public_key()
+    KEYCLOAK_PUBLIC_KEY = (
+        f"-----BEGIN PUBLIC KEY-----\n"
+        f"{pub_key}\n"
+        f"-----END PUBLIC KEY-----"
+    )
+    return jwt.decode(
+        token,
+        KEYCLOAK_PUBLIC_KEY,
+        algorithms=[settings.JWT_ALGORITHM],
+        options={
+            "verify_aud": False
+        },  # Keycloak tokens might not have audience
+    )
+
+
+def _keycloak_id(payload: dict) -> Optional[str]:
+    """Keycloak id of a token's user; email when sub is missing."""
+    keycloak_id = payload.get("sub")
+    email = payload.get("email")
+    if keycloak_id is None and email:
+        keycloak_id = f"email:{email}"
+    return keycloak_id
+
 
 async def get_current_user(
     request: Request,
     response: Response,
     credentials: Optional[HTTPAuthorizationCredentials] = Depends(security),
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
 ) -> Optional[User]:
     """
     Get current user from JWT token or return None for anonymous.
-    Anonymous users are tracked via X-Anonymous-User-Id header or cookie.
-    Priority: JWT token > anonymous header > anonymous cookie
+    Users are looked up on a read session (a replica, unless the client
+    wrote recently); only provisioning and session renewals use the
+    primary. The returned User therefore need not belong to the request's
+    get_db session: persist changes to it with explicit statements.
+    Anonymous users are tracked via a signed token (X-Anonymous-Token header
+    or anonymous_token cookie) and verified without a database round trip;
+    the returned User is transient and may not have a row yet.
+    Legacy raw IDs (X-Anonymous-User-Id header or cookie) are looked up in
+    the database and upgraded to a signed token only while
+    ANONYMOUS_LEGACY_IDS is enabled.
+    Priority: JWT token > anonymous token > legacy anonymous ID
     """
     # DEBUG: Check what we received
     auth_header = request.headers.get("Authorization")
@@ -52,18 +219,7 @@ async def get_current_user(
         token = credentials.credentials
 
         try:
-            # Decode JWT token
-            pub_key = keycloak_openid.public_key()
-            KEYCLOAK_PUBLIC_KEY = (
-                f"-----BEGIN PUBLIC KEY-----\n"
-                f"{pub_key}\n"
-                f"-----END PUBLIC KEY-----"
-            )
-
             # First decode without verification to see what's in the token
-            import base64
-            import json
-
             parts = token.split(".")
             if len(parts) >= 2:
                 payload_part = parts[1]
@@ -77,28 +233,13 @@ async def get_current_user(
                 print(f"DEBUG: Raw JWT payload: {decoded_payload}")
 
             # Decode with verification, but don't require audience
-            payload = jwt.decode(
-                token,
-                KEYCLOAK_PUBLIC_KEY,
-                algorithms=[settings.JWT_ALGORITHM],
-                options={
-                    "verify_aud": False
-                },  # Keycloak tokens might not have audience
-            )
+            payload = _decode_keycloak_token(token)
 
-            keycloak_id: str = payload.get("sub")
+            # If sub is missing, email is the unique identifier
+            keycloak_id = _keycloak_id(payload)
             email: str = payload.get("email")
             username: str = payload.get("preferred_username")
 
-            # If sub is missing, use email as unique identifier
-            if keycloak_id is None and email:
-                # Use email as the keycloak_id fallback
-                keycloak_id = f"email:{email}"
-                print(
-                    f"DEBUG: No 'sub' claim found, "
-                    f"using email: {keycloak_id}"
-                )
-
             print(
                 f"DEBUG: JWT decoded - "
                 f"keycloak_id={keycloak_id}, "
@@ -113,48 +254,13 @@ async def get_current_user(
                 )
                 pass
             else:
-                # Get or create user
-                result = await db.execute(
-                    select(User).where(User.keycloak_id == keycloak_id)
+                user = await get_or_create_keycloak_user(
+                    db, keycloak_id, email, username
                 )
-                user = result.scalar_one_or_none()
-
-                if not user:
-                    # Create new user
-                    user = User(
-                        keycloak_id=keycloak_id,
-                        email=email,
-                        username=username,
-                        is_anonymous=False,
-                    )
-                    db.add(user)
-                    try:
-                        await db.commit()
-                        await db.refresh(user)
-                    except Exception:
-                        # Handle duplicate - user exists with different ID
-                        await db.rollback()
-                        # Try to find by email instead
-                        if email:
-                            result = await db.execute(
-                                select(User).where(
-                                    User.email == email,
-                                    User.is_anonymous.is_(False),
-                                )
-                            )
-                            user = result.scalar_one_or_none()
-                        if user:
-                            # Update keycloak_id for existing user
-                            user.keycloak_id = keycloak_id
-                            if username:
-                                user.username = username
-                            await db.commit()
-                            await db.refresh(user)
-                        else:
-                            raise
-
-                # Clear anonymous cookie when authenticated
+
+                # Clear anonymous cookies when authenticated
                 response.delete_cookie(key="anonymous_user_id")
+                response.delete_cookie(key=ANONYMOUS_TOKEN_COOKIE)
 
                 return user
 
@@ -162,13 +268,32 @@ async def get_current_user(
             # Invalid token, fall through to anonymous
             pass
 
-    # Priority 2: No token provided or invalid token, check for anonymous user
-    # Check for anonymous user ID from header (frontend localStorage)
-    anonymous_user_id = request.headers.get("X-Anonymous-User-Id")
-
-    # Fallback to cookie if header not present
-    if not anonymous_user_id:
-        anonymous_user_id = request.cookies.get("anonymous_user_id")
+    # Priority 2: No token provided or invalid token, check for a signed
+    # anonymous token (header from frontend localStorage, then cookie)
+    anonymous_token = request.headers.get(
+        ANONYMOUS_TOKEN_HEADER
+    ) or request.cookies.get(ANONYMOUS_TOKEN_COOKIE)
+
+    if anonymous_token:
+        claims = verify_anonymous_token(anonymous_token)
+        if claims is not None:
+            user = _anonymous_user_from_claims(claims)
+            # Slide the session once the token is past half its lifetime
+            token_age = time.time() - int(claims["iat"])
+            if token_age > settings.ANONYMOUS_TOKEN_MAX_AGE / 2:
+                set_anonymous_session(response, user)
+                await _touch_anonymous_user(db, user.id)
+            return user
+
+    # Priority 3: Legacy raw anonymous user ID (header, then cookie), only
+    # during the migration window (deprecated, see ANONYMOUS_LEGACY_IDS)
+    anonymous_user_id = None
+    if settings.ANONYMOUS_LEGACY_IDS:
+        anonymous_user_id = request.headers.get("X-Anonymous-User-Id")
+
+        # Fallback to cookie if header not present
+        if not anonymous_user_id:
+            anonymous_user_id = request.cookies.get("anonymous_user_id")
 
     if anonymous_user_id:
         try:
@@ -180,6 +305,9 @@ async def get_current_user(
             )
             user = result.scalar_one_or_none()
             if user:
+                # Upgrade the client to a signed token
+                set_anonymous_session(response, user)
+                await _touch_anonymous_user(db, user.id)
                 return user
         except (ValueError, AttributeError):
             pass
@@ -188,6 +316,23 @@ async def get_current_user(
     return None
 
 
+async def _touch_anonymous_user(db: AsyncSession, user_id: uuid.UUID):
+    """
+    Record that an anonymous user's session was renewed. Tokens are
+    renewed at most once per half lifetime, so this is the only write
+    anonymous reads cause; it keeps active users out of the stale
+    anonymous user collection (gc-anonymous-users).
+    """
+    async with _writable(db) as session:
+        await session.execute(
+            update(User)
+            .where(User.id == user_id, User.is_anonymous.is_(True))
+            .values(last_seen_at=datetime.utcnow())
+            .execution_options(synchronize_session=False)
+        )
+        await session.commit()
+
+
 async def get_current_user_required(
     user: Optional[User] = Depends(get_current_user),
 ) -> User:
@@ -202,6 +347,105 @@ async def get_current_user_required(
     return user
 
 
+async def _provision_user(
+    db: AsyncSession, values: dict, *criteria
+) -> Optional[User]:
+    """
+    Insert a user or fetch the existing one in a single statement.
+
+    Runs ``INSERT ... ON CONFLICT DO NOTHING RETURNING`` in a CTE and
+    UNIONs it with a lookup on ``criteria``, so both the create and the
+    already-exists case cost one round trip. Returns None when the insert
+    conflicted on a row that does not match ``criteria``.
+    """
+    now = datetime.utcnow()
+    values = {
+        "id": uuid.uuid4(),
+        "is_premium": False,
+        "created_at": now,
+        "updated_at": now,
+        "last_seen_at": now,
+        **values,
+    }
+    inserted = (
+        pg_insert(User)
+        .values(**values)
+        .on_conflict_do_nothing()
+        .returning(*User.__table__.c)
+        .cte("inserted")
+    )
+    stmt = union_all(
+        select(inserted),
+        select(User.__table__).where(*criteria),
+    ).limit(1)
+
+    # A concurrent insert committed after this statement's snapshot makes
+    # the conflict invisible to the lookup branch; a second attempt sees it.
+    user = None
+    for _ in range(2):
+        result = await db.execute(select(User).from_statement(stmt))
+        user = result.scalar_one_or_none()
+        if user is not None:
+            break
+    await db.commit()
+    return user
+
+
+async def get_or_create_keycloak_user(
+    db: AsyncSession,
+    keycloak_id: str,
+    email: Optional[str],
+    username: Optional[str],
+) -> User:
+    """
+    Get the user of a Keycloak identity, creating it on first login.
+    Known users cost one SELECT, which may run on a read-only session;
+    only a miss runs the upsert, on the primary.
+    """
+    result = await db.execute(
+        select(User).where(User.keycloak_id == keycloak_id)
+    )
+    user = result.scalar_one_or_none()
+    if user is not None:
+        return user
+
+    async with _writable(db) as session:
+        user = await _provision_user(
+            session,
+            {
+                "keycloak_id": keycloak_id,
+                "email": email,
+                "username": username,
+                "is_anonymous": False,
+            },
+            User.keycloak_id == keycloak_id,
+        )
+
+        if user is None and email:
+            # Email already belongs to an account that was created under a
+            # different Keycloak id: relink it
+            values = {"keycloak_id": keycloak_id}
+            if username:
+                values["username"] = username
+            result = await session.execute(
+                select(User).from_statement(
+                    update(User)
+                    .where(User.email == email, User.is_anonymous.is_(False))
+                    .values(**values)
+                    .returning(User)
+                )
+            )
+            user = result.scalar_one_or_none()
+            await session.commit()
+
+    if user is None:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="User account conflict",
+        )
+    return user
+
+
 async def get_or_create_anonymous_user(
     db: AsyncSession, user_id: Optional[str] = None
 ) -> User:
@@ -209,140 +453,66 @@ async def get_or_create_anonymous_user(
     Create an anonymous user for unauthenticated access.
     If user_id is provided from frontend, use it to maintain consistency.
     """
-    print(f"DEBUG: get_or_create_anonymous_user called with user_id={user_id}")
-
+    user_uuid = None
     if user_id:
-        print(f"DEBUG: Checking for existing anonymous user: {user_id}")
         try:
             user_uuid = uuid.UUID(user_id)
-            print(f"DEBUG: Parsed UUID: {user_uuid}")
-
-            # Debug: Check if we can query any users at all
-            test_result = await db.execute(select(func.count(User.id)))
-            total_users = test_result.scalar()
-            print(f"DEBUG: Total users in database: {total_users}")
-
-            # Check if user already exists
-            result = await db.execute(select(User).where(User.id == user_uuid))
-            user_check = result.scalar_one_or_none()
-            is_anon = user_check.is_anonymous if user_check else "N/A"
-            print(
-                f"DEBUG: User with that ID exists: "
-                f"{user_check is not None}, is_anonymous={is_anon}"
-            )
-
-            result = await db.execute(
-                select(User).where(
-                    User.id == user_uuid, User.is_anonymous.is_(True)
-                )
-            )
-            existing_user = result.scalar_one_or_none()
-            if existing_user:
-                print(
-                    f"DEBUG: Found existing anonymous user: "
-                    f"{existing_user.id}"
-                )
-                return existing_user
-            print(
-                f"DEBUG: User {user_id} not found in database, "
-                f"will create new user"
-            )
-            # Create user with provided ID
-            user = User(
-                id=user_uuid,
-                is_anonymous=True,
-            )
         except (ValueError, AttributeError):
-            # Invalid UUID, create new one
-            user = User(
-                id=uuid.uuid4(),
-                is_anonymous=True,
-            )
-    else:
-        user = User(
-            id=uuid.uuid4(),
-            is_anonymous=True,
-        )
+            pass
 
-    db.add(user)
-    try:
-        await db.commit()
-        await db.refresh(user)
-        return user
-    except Exception:
-        # Handle race condition: user was created between check and insert
-        await db.rollback()
-        if user_id:
-            try:
-                user_uuid = uuid.UUID(user_id)
-                result = await db.execute(
-                    select(User).where(
-                        User.id == user_uuid, User.is_anonymous.is_(True)
-                    )
-                )
-                existing_user = result.scalar_one_or_none()
-                if existing_user:
-                    return existing_user
-                # If user doesn't exist, create new anonymous user
-                # with different ID
-                new_user = User(
-                    id=uuid.uuid4(),
-                    is_anonymous=True,
-                )
-                db.add(new_user)
-                await db.commit()
-                await db.refresh(new_user)
-                return new_user
-            except (ValueError, AttributeError):
-                pass
-        # If no user_id provided or invalid, create new anonymous user
-        new_user = User(
-            id=uuid.uuid4(),
-            is_anonymous=True,
+    if user_uuid is not None:
+        user = await _provision_user(
+            db,
+            {"id": user_uuid, "is_anonymous": True},
+            User.id == user_uuid,
+            User.is_anonymous.is_(True),
         )
-        db.add(new_user)
-        await db.commit()
-        await db.refresh(new_user)
-        return new_user
+        if user is not None:
+            return user
+
+    # No usable ID, or it belongs to a registered account: start fresh
+    user_uuid = uuid.uuid4()
+    user = await _provision_user(
+        db,
+        {"id": user_uuid, "is_anonymous": True},
+        User.id == user_uuid,
+    )
+    assert user is not None
+    return user
 
 
 async def get_current_user_ws(
     websocket: WebSocket,
+    db: AsyncSession,
     token: Optional[str] = None,
-    db: AsyncSession = Depends(get_db),
+    anonymous_token: Optional[str] = None,
 ) -> Optional[User]:
     """
-    Get current user from WebSocket connection.
+    Get the user of a WebSocket connection, verified like get_current_user:
+    a Keycloak token, else a signed anonymous token (query parameter, then
+    cookie). Raw anonymous user ids are never accepted here; clients that
+    still use one are issued a signed token by their first HTTP request.
     """
-    if not token:
-        return None
-
-    try:
-        pub_key = keycloak_openid.public_key()
-        KEYCLOAK_PUBLIC_KEY = (
-            f"-----BEGIN PUBLIC KEY-----\n"
-            f"{pub_key}\n"
-            f"-----END PUBLIC KEY-----"
-        )
-
-        payload = jwt.decode(
-            token,
-            KEYCLOAK_PUBLIC_KEY,
-            algorithms=[settings.JWT_ALGORITHM],
-            audience=settings.KEYCLOAK_CLIENT_ID,
-        )
-
-        keycloak_id: str = payload.get("sub")
-
-        if keycloak_id is None:
-            return None
-
-        result = await db.execute(
-            select(User).where(User.keycloak_id == keycloak_id)
-        )
-        user = result.scalar_one_or_none()
+    if token:
+        try:
+            payload = _decode_keycloak_token(token)
+        except JWTError:
+            payload = {}
+        keycloak_id = _keycloak_id(payload)
+        if keycloak_id is not None:
+            return await get_or_create_keycloak_user(
+                db,
+                keycloak_id,
+                payload.get("email"),
+                payload.get("preferred_username"),
+            )
 
-        return user
+    anonymous_token = anonymous_token or websocket.cookies.get(
+        ANONYMOUS_TOKEN_COOKIE
+    )
+    if anonymous_token:
+        claims = verify_anonymous_token(anonymous_token)
+        if claims is not None:
+            return _anonymous_user_from_claims(claims)
 
-    except JWTError:
-        return None
+    return None
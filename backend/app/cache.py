@@ -0,0 +1,243 @@
+"""
+Read-through response cache with pluggable backends.
+
+Every key has a generation that invalidation bumps. A load records the
+generation before it starts and its result is stored only if the
+generation is unchanged, checked atomically by the backend, so a value
+loaded before an invalidation on any process is never cached after it.
+"""
+
+import asyncio
+import itertools
+import json
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+import redis.asyncio as aioredis
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class CacheBackend:
+    """Interface for cache storage. Values must be JSON-serializable."""
+
+    async def get(self, key: str) -> Optional[Any]:
+        raise NotImplementedError
+
+    async def generation(self, key: str) -> Optional[int]:
+        """Current generation of a key, or None if it can't be read."""
+        raise NotImplementedError
+
+    async def set(self, key: str, value: Any, ttl: int, generation: int):
+        """Store a value, unless the key's generation is no longer this."""
+        raise NotImplementedError
+
+    async def delete(self, key: str):
+        """Drop a key's value and bump its generation."""
+        raise NotImplementedError
+
+    async def close(self):
+        pass
+
+
+class NullCacheBackend(CacheBackend):
+    """Disables caching while keeping request coalescing."""
+
+    async def get(self, key: str) -> Optional[Any]:
+        return None
+
+    async def generation(self, key: str) -> Optional[int]:
+        return 0
+
+    async def set(self, key: str, value: Any, ttl: int, generation: int):
+        pass
+
+    async def delete(self, key: str):
+        pass
+
+
+class MemoryCacheBackend(CacheBackend):
+    """In-process LRU with per-entry expiry."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        # Generations are drawn from one counter, so a key whose entry was
+        # evicted never returns to a generation a load may have recorded
+        self._generations: "OrderedDict[str, int]" = OrderedDict()
+        self._counter = itertools.count(1)
+
+    async def get(self, key: str) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    async def generation(self, key: str) -> Optional[int]:
+        return self._generations.get(key, 0)
+
+    async def set(self, key: str, value: Any, ttl: int, generation: int):
+        if self._generations.get(key, 0) != generation:
+            return
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def delete(self, key: str):
+        self._entries.pop(key, None)
+        self._generations[key] = next(self._counter)
+        self._generations.move_to_end(key)
+        while len(self._generations) > self.max_entries:
+            self._generations.popitem(last=False)
+
+
+class RedisCacheBackend(CacheBackend):
+    """
+    Cache shared by all backend pods, stored as JSON in Redis. A key's
+    generation is a counter in "<key>:generation"; a Lua script compares
+    it and stores the value in one step, so an invalidation from another
+    pod can't slip in between.
+    """
+
+    # Generation counters outlive any load in flight by far
+    GENERATION_TTL = 60 * 60
+
+    SET_IF_GENERATION = """
+    if (redis.call('GET', KEYS[2]) or '0') ~= ARGV[1] then
+        return 0
+    end
+    redis.call('SET', KEYS[1], ARGV[2], 'EX', ARGV[3])
+    return 1
+    """
+
+    def __init__(self, url: str):
+        self.client = aioredis.from_url(url)
+        self._set_if_generation = self.client.register_script(
+            self.SET_IF_GENERATION
+        )
+
+    @staticmethod
+    def _generation_key(key: str) -> str:
+        return f"{key}:generation"
+
+    async def get(self, key: str) -> Optional[Any]:
+        try:
+            raw = await self.client.get(key)
+        except aioredis.RedisError as e:
+            logger.error(f"Cache read failed for {key}: {e}")
+            return None
+        return json.loads(raw) if raw is not None else None
+
+    async def generation(self, key: str) -> Optional[int]:
+        try:
+            raw = await self.client.get(self._generation_key(key))
+        except aioredis.RedisError as e:
+            logger.error(f"Cache read failed for {key}: {e}")
+            return None
+        return int(raw) if raw is not None else 0
+
+    async def set(self, key: str, value: Any, ttl: int, generation: int):
+        try:
+            await self._set_if_generation(
+                keys=[key, self._generation_key(key)],
+                args=[generation, json.dumps(value), ttl],
+            )
+        except aioredis.RedisError as e:
+            logger.error(f"Cache write failed for {key}: {e}")
+
+    async def delete(self, key: str):
+        generation_key = self._generation_key(key)
+        try:
+            async with self.client.pipeline(transaction=True) as pipe:
+                pipe.incr(generation_key)
+                pipe.expire(generation_key, self.GENERATION_TTL)
+                pipe.delete(key)
+                await pipe.execute()
+        except aioredis.RedisError as e:
+            logger.error(f"Cache invalidation failed for {key}: {e}")
+
+    async def close(self):
+        await self.client.aclose()
+
+
+def create_cache_backend(name: str) -> CacheBackend:
+    if name == "redis":
+        return RedisCacheBackend(settings.REDIS_URL)
+    if name == "memory":
+        return MemoryCacheBackend(settings.SHARED_NOTE_CACHE_MAX_ENTRIES)
+    return NullCacheBackend()
+
+
+class ResponseCache:
+    """
+    Read-through cache that coalesces concurrent misses for the same key:
+    a stampede triggers a single loader call whose result every waiter
+    shares. Loaders returning None (e.g. not found) are not cached.
+    """
+
+    def __init__(self, backend: CacheBackend, prefix: str, ttl: int):
+        self.backend = backend
+        self.prefix = prefix
+        self.ttl = ttl
+        self._inflight: Dict[str, asyncio.Task] = {}
+
+    async def get_or_load(
+        self, key: str, loader: Callable[[], Awaitable[Optional[Any]]]
+    ) -> Optional[Any]:
+        cache_key = self.prefix + key
+        cached = await self.backend.get(cache_key)
+        if cached is not None:
+            return cached
+
+        task = self._inflight.get(cache_key)
+        if task is None:
+            task = asyncio.ensure_future(self._load(cache_key, loader))
+            self._inflight[cache_key] = task
+            task.add_done_callback(lambda done: self._forget(cache_key, done))
+
+        # A disconnecting client must not cancel the load for the others
+        return await asyncio.shield(task)
+
+    async def _load(
+        self, cache_key: str, loader: Callable[[], Awaitable[Optional[Any]]]
+    ) -> Optional[Any]:
+        generation = await self.backend.generation(cache_key)
+        value = await loader()
+        # The backend drops the value if the key was invalidated, by any
+        # process, while it was loading
+        if value is not None and generation is not None:
+            await self.backend.set(cache_key, value, self.ttl, generation)
+        return value
+
+    def _forget(self, cache_key: str, task: asyncio.Task):
+        if self._inflight.get(cache_key) is task:
+            del self._inflight[cache_key]
+
+    async def invalidate(self, key: Optional[str]):
+        if not key:
+            return
+        cache_key = self.prefix + key
+        # Later requests start a fresh load instead of joining a stale one
+        self._inflight.pop(cache_key, None)
+        await self.backend.delete(cache_key)
+
+    async def close(self):
+        await self.backend.close()
+
+
+# Rendered GET /api/notes/shared/{share_token} responses
+shared_note_cache = ResponseCache(
+    create_cache_backend(settings.SHARED_NOTE_CACHE_BACKEND),
+    prefix="shared_note:",
+    ttl=settings.SHARED_NOTE_CACHE_TTL,
+)
@@ -1,14 +1,62 @@
 import json
-from typing import List
+from typing import List, Optional
 
+from pydantic import model_validator
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
+# Defaults of the connection pool settings per ENVIRONMENT; settings given
+# explicitly (environment variables, .env) take precedence
+ENVIRONMENT_PROFILES = {
+    "development": {
+        "DATABASE_POOL_SIZE": 5,
+        "DATABASE_MAX_OVERFLOW": 10,
+        "DATABASE_POOL_TIMEOUT": 30.0,
+        "DATABASE_POOL_RECYCLE": 1800,
+        "DATABASE_POOL_PRE_PING": True,
+        "DATABASE_STATEMENT_CACHE_SIZE": 100,
+        "MONGODB_MAX_POOL_SIZE": 20,
+        "MONGODB_MIN_POOL_SIZE": 0,
+        "MONGODB_MAX_IDLE_TIME_MS": 60_000,
+        "MONGODB_WAIT_QUEUE_TIMEOUT_MS": 30_000,
+    },
+    "test": {
+        "DATABASE_POOL_SIZE": 2,
+        "DATABASE_MAX_OVERFLOW": 0,
+        "DATABASE_POOL_TIMEOUT": 10.0,
+        "DATABASE_POOL_RECYCLE": 1800,
+        "DATABASE_POOL_PRE_PING": False,
+        "DATABASE_STATEMENT_CACHE_SIZE": 100,
+        "MONGODB_MAX_POOL_SIZE": 5,
+        "MONGODB_MIN_POOL_SIZE": 0,
+        "MONGODB_MAX_IDLE_TIME_MS": 60_000,
+        "MONGODB_WAIT_QUEUE_TIMEOUT_MS": 10_000,
+    },
+    "production": {
+        "DATABASE_POOL_SIZE": 20,
+        "DATABASE_MAX_OVERFLOW": 10,
+        "DATABASE_POOL_TIMEOUT": 10.0,
+        "DATABASE_POOL_RECYCLE": 1800,
+        "DATABASE_POOL_PRE_PING": True,
+        "DATABASE_STATEMENT_CACHE_SIZE": 500,
+        "MONGODB_MAX_POOL_SIZE": 100,
+        "MONGODB_MIN_POOL_SIZE": 10,
+        "MONGODB_MAX_IDLE_TIME_MS": 300_000,
+        "MONGODB_WAIT_QUEUE_TIMEOUT_MS": 10_000,
+    },
+}
+
+# Signs anonymous sessions in development and test when no secret is set;
+# rejected in production
+DEVELOPMENT_ANONYMOUS_SECRET = "development-only-anonymous-token-secret"
+
 
 class Settings(BaseSettings):
     # Application
     APP_NAME: str = "SyncPad API"
     APP_VERSION: str = "1.0.0"
     DEBUG: bool = True
+    # "development", "test" or "production"; selects ENVIRONMENT_PROFILES
+    ENVIRONMENT: str = "development"
 
     # Database
     DATABASE_URL: str = (
@@ -20,9 +68,75 @@ class Settings(BaseSettings):
     )
     MONGODB_DB_NAME: str = "syncpad"
 
+    # Log every SQL statement with its parameters; off unless explicitly
+    # enabled, whatever DEBUG and ENVIRONMENT say
+    DATABASE_ECHO: bool = False
+    # Connection pools; unset values come from the ENVIRONMENT profile
+    # Connections kept per process, and extra ones opened under load
+    DATABASE_POOL_SIZE: Optional[int] = None
+    DATABASE_MAX_OVERFLOW: Optional[int] = None
+    # Seconds to wait for a free connection before failing
+    DATABASE_POOL_TIMEOUT: Optional[float] = None
+    # Connections older than this many seconds are replaced, before
+    # server or proxy idle timeouts drop them
+    DATABASE_POOL_RECYCLE: Optional[int] = None
+    # Test connections on checkout, so dropped ones are replaced unseen
+    DATABASE_POOL_PRE_PING: Optional[bool] = None
+    # Prepared statements cached per connection; 0 behind PgBouncer in
+    # transaction pooling mode, which cannot keep them
+    DATABASE_STATEMENT_CACHE_SIZE: Optional[int] = None
+    MONGODB_MAX_POOL_SIZE: Optional[int] = None
+    MONGODB_MIN_POOL_SIZE: Optional[int] = None
+    MONGODB_MAX_IDLE_TIME_MS: Optional[int] = None
+    MONGODB_WAIT_QUEUE_TIMEOUT_MS: Optional[int] = None
+
+    # Read replicas: comma-separated (or JSON array) PostgreSQL URLs for
+    # read-only endpoints, and the MongoDB read preference of their content
+    # reads (e.g. "secondaryPreferred")
+    DATABASE_REPLICA_URLS: str = ""
+    MONGODB_READ_PREFERENCE: str = "primary"
+    # Clients that wrote within this many seconds read from the primaries,
+    # so replication lag never hides their own writes
+    READ_YOUR_WRITES_SECONDS: int = 5
+
+    # Where note content and history live: "mongo", "postgres" or "memory"
+    CONTENT_STORE: str = "mongo"
+    # Store to read notes from that are not yet in CONTENT_STORE, while
+    # moving content between backends (see migrate-content)
+    CONTENT_STORE_FALLBACK: Optional[str] = None
+    # Note content above this many bytes is stored zlib-compressed
+    CONTENT_COMPRESSION_THRESHOLD: int = 16 * 1024
+    CONTENT_COMPRESSION_LEVEL: int = 6
+    # Note content of this many bytes or more is stored in blocks of about
+    # CONTENT_BLOCK_SIZE bytes, so saves and range reads touch only the
+    # blocks they need
+    CONTENT_BLOCK_THRESHOLD: int = 1024 * 1024
+    CONTENT_BLOCK_SIZE: int = 256 * 1024
+    # Blocks a save stops referencing stay readable this long, for reads
+    # of the previous version in flight (see collect-content-blocks)
+    CONTENT_BLOCK_GRACE_SECONDS: int = 60 * 60
+    # Real-time edits are written to MongoDB after this much quiet time
+    CONTENT_FLUSH_DELAY_SECONDS: float = 2.0
+    # Chunk size for streamed raw content responses
+    CONTENT_STREAM_CHUNK_SIZE: int = 64 * 1024
+    # Bytes read from the database per query when streaming content stored
+    # in PostgreSQL
+    CONTENT_STREAM_PAGE_SIZE: int = 1024 * 1024
+
+    # Responses above this many bytes are gzip-compressed when accepted
+    GZIP_MINIMUM_SIZE: int = 1024
+
     # Redis
     REDIS_URL: str = "redis://localhost:6379"
 
+    # Shared-note response cache: "redis" (shared by all processes),
+    # "memory" (per-process LRU, only for a single process: other processes
+    # never see its invalidations and serve stale notes until the TTL) or
+    # "none"
+    SHARED_NOTE_CACHE_BACKEND: str = "redis"
+    SHARED_NOTE_CACHE_TTL: int = 60  # seconds
+    SHARED_NOTE_CACHE_MAX_ENTRIES: int = 1000
+
     # Keycloak
     KEYCLOAK_URL: str = "http://localhost:8090"
     KEYCLOAK_REALM: str = "syncpad"
@@ -35,11 +149,113 @@ class Settings(BaseSettings):
     # JWT
     JWT_ALGORITHM: str = "RS256"
 
+    # Anonymous sessions (HMAC-signed tokens, no database lookup). The
+    # secret is required outside development and test: anyone knowing it
+    # can sign a session for any anonymous user. Generate one with
+    # ``openssl rand -hex 32``
+    ANONYMOUS_TOKEN_SECRET: str = ""
+    ANONYMOUS_TOKEN_MAX_AGE: int = 30 * 24 * 60 * 60  # 30 days
+    # Deprecated: also accept the raw anonymous user ids of clients from
+    # before signed tokens (X-Anonymous-User-Id / anonymous_user_id cookie)
+    # and upgrade them to a token. They are unsigned, so anyone who knows
+    # an anonymous user's id can act as them: enable only for the migration
+    # window (the deploy configs enable it; see DEPLOYMENT.md for the
+    # rollout). This setting and the legacy path are removed in 1.2
+    ANONYMOUS_LEGACY_IDS: bool = False
+    # Anonymous users inactive this long are deleted with their notes by
+    # gc-anonymous-users; never less than ANONYMOUS_TOKEN_MAX_AGE,
+    # so no session that could still come back is collected
+    ANONYMOUS_USER_RETENTION_DAYS: int = 60
+
+    # Full-text search (PostgreSQL text search configuration); content
+    # beyond SEARCH_MAX_CONTENT_CHARS is not indexed
+    SEARCH_TEXT_CONFIG: str = "english"
+    SEARCH_MAX_CONTENT_CHARS: int = 200_000
+
+    # Length of the content preview stored on notes for listings
+    NOTE_PREVIEW_LENGTH: int = 200
+
+    # Deletion tombstones for the change feed are kept this long; older
+    # sync tokens must refetch the note list
+    SYNC_TOKEN_MAX_AGE_DAYS: int = 30
+
+    # Version history stores the full content every this many revisions,
+    # bounding the deltas replayed to rebuild an earlier revision
+    HISTORY_SNAPSHOT_INTERVAL: int = 50
+
+    # Bulk export / import: notes per PostgreSQL + MongoDB round trip,
+    # largest accepted record, and ZIP uploads kept in memory up to
+    # IMPORT_SPOOL_MAX_MEMORY bytes before spilling to a temporary file,
+    # and rejected (413) beyond IMPORT_MAX_UPLOAD_BYTES
+    EXPORT_BATCH_SIZE: int = 200
+    IMPORT_BATCH_SIZE: int = 200
+    IMPORT_MAX_RECORD_BYTES: int = 16 * 1024 * 1024
+    IMPORT_SPOOL_MAX_MEMORY: int = 8 * 1024 * 1024
+    IMPORT_MAX_UPLOAD_BYTES: int = 256 * 1024 * 1024
+
+    # Deleted notes' content is purged in the background, this many notes
+    # per batch; the queue is also polled this often for missed wakeups
+    NOTE_PURGE_BATCH_SIZE: int = 500
+    NOTE_PURGE_INTERVAL_SECONDS: float = 60.0
+
+    # Free tier
+    FREE_NOTE_LIMIT: int = 3
+
+    # Stripe HTTP client (set STRIPE_API_BASE to stripe-mock for local runs)
+    STRIPE_SECRET_KEY: Optional[str] = None
+    STRIPE_API_BASE: str = "https://api.stripe.com"
+    STRIPE_TIMEOUT_SECONDS: float = 10.0
+    STRIPE_MAX_CONNECTIONS: int = 20
+    # Retries of connection errors and retryable responses; POSTs reuse
+    # their idempotency key, so a retry never repeats a write
+    STRIPE_MAX_RETRIES: int = 2
+
     # WebSocket
     WS_MESSAGE_QUEUE: str = "syncpad:messages"
 
     model_config = SettingsConfigDict(env_file=".env", case_sensitive=True)
 
+    @model_validator(mode="after")
+    def apply_environment_profile(self) -> "Settings":
+        """Fill pool settings left unset from the ENVIRONMENT profile"""
+        if self.ENVIRONMENT not in ENVIRONMENT_PROFILES:
+            raise ValueError(
+                f"ENVIRONMENT must be one of {', '.join(ENVIRONMENT_PROFILES)}"
+            )
+        for name, value in ENVIRONMENT_PROFILES[self.ENVIRONMENT].items():
+            if getattr(self, name) is None:
+                setattr(self, name, value)
+        return self
+
+    @model_validator(mode="after")
+    def check_anonymous_token_secret(self) -> "Settings":
+        """Refuse to sign anonymous sessions with a known key"""
+        if self.ENVIRONMENT in ("development", "test"):
+            if not self.ANONYMOUS_TOKEN_SECRET:
+                self.ANONYMOUS_TOKEN_SECRET = DEVELOPMENT_ANONYMOUS_SECRET
+        elif (
+            len(self.ANONYMOUS_TOKEN_SECRET) < 32
+            or self.ANONYMOUS_TOKEN_SECRET == DEVELOPMENT_ANONYMOUS_SECRET
+            or "change-me"
+            in self.ANONYMOUS_TOKEN_SECRET.lower().replace("_", "-")
+        ):
+            raise ValueError(
+                "ANONYMOUS_TOKEN_SECRET must be set to a random value of at "
+                f"least 32 characters when ENVIRONMENT={self.ENVIRONMENT}"
+            )
+        return self
+
+    def get_database_replica_urls(self) -> List[str]:
+        """Parse replica URLs like CORS_ORIGINS"""
+        try:
+            return json.loads(self.DATABASE_REPLICA_URLS)
+        except (json.JSONDecodeError, TypeError):
+            return [
+                url.strip()
+                for url in self.DATABASE_REPLICA_URLS.split(",")
+                if url.strip()
+            ]
+
     def get_cors_origins(self) -> List[str]:
         """Parse CORS origins from string to list"""
         try:
@@ -0,0 +1,275 @@
+"""
+Block storage for very large note content.
+
+Content of CONTENT_BLOCK_THRESHOLD bytes or more is split into blocks kept
+in the ``note_content_blocks`` collection, and its content document holds
+only an index: the ``blocks`` codec and a ``blocks`` list of
+{"h": sha1, "size": bytes} in content order. Blocks end at line
+boundaries picked from each line's own hash (content-defined chunking),
+so an edit changes only the blocks around it: a save writes just the
+blocks that are new, and a range read fetches just the blocks it
+overlaps. Blocks are addressed by content document and hash, and are
+themselves stored with the usual codec.
+
+Blocks a save no longer references are not deleted right away: readers
+may still hold the previous index. They are marked ``released_at`` and
+deleted by collect_released_blocks once CONTENT_BLOCK_GRACE_SECONDS have
+passed, unless a later save referenced them again.
+"""
+
+import hashlib
+import zlib
+from datetime import datetime, timedelta
+from typing import AsyncIterator, Iterable, List, Optional
+
+from bson.objectid import ObjectId
+from pymongo.errors import BulkWriteError
+
+from app.config import settings
+from app.content_codec import (
+    CODEC_BLOCKS,
+    LOADED_BLOCKS,
+    content_update,
+    decode_content,
+    encode_content,
+)
+
+# Duplicate key: the block was written by a concurrent save
+_DUPLICATE_KEY = 11000
+
+
+def split_blocks(content: str) -> List[str]:
+    """
+    Split content into blocks of about CONTENT_BLOCK_SIZE characters. A
+    block ends after a line once it holds a quarter of the target, with a
+    probability proportional to the line's length decided by the line's
+    hash, so boundaries depend only on nearby text. A block never exceeds
+    four times the target, cutting inside a line if it must.
+    """
+    target = settings.CONTENT_BLOCK_SIZE
+    minimum, maximum = target // 4, target * 4
+    spread = target - minimum
+
+    blocks = []
+    start = size = 0
+    for line in content.splitlines(keepends=True):
+        while size + len(line) > maximum:
+            cut = maximum - size
+            blocks.append(content[start : start + size + cut])
+            start += size + cut
+            line = line[cut:]
+            size = 0
+        size += len(line)
+        if size >= minimum:
+            digest = zlib.crc32(line.encode("utf-8"))
+            if digest % spread < len(line):
+                blocks.append(content[start : start + size])
+                start += size
+                size = 0
+    if size:
+        blocks.append(content[start:])
+    return blocks
+
+
+def _block_id(content_id: str, digest: str) -> str:
+    return f"{content_id}:{digest}"
+
+
+def _index(doc: Optional[dict]) -> List[dict]:
+    if not doc or doc.get("codec") != CODEC_BLOCKS:
+        return []
+    return doc.get("blocks", [])
+
+
+async def store_content(mongo_db, content_id: str, content: str) -> dict:
+    """
+    Write the blocks content needs, if any, and return the MongoDB update
+    document for its content document. Blocks that already exist are not
+    written again.
+    """
+    if len(content.encode("utf-8")) < settings.CONTENT_BLOCK_THRESHOLD:
+        return content_update(content)
+
+    index = []
+    blocks = {}
+    for block in split_blocks(content):
+        raw = block.encode("utf-8")
+        digest = hashlib.sha1(raw).hexdigest()
+        index.append({"h": digest, "size": len(raw)})
+        blocks[_block_id(content_id, digest)] = block
+
+    # Reclaim released blocks before relying on them, so the collector,
+    # which only deletes blocks still marked, cannot take them away
+    await mongo_db.note_content_blocks.update_many(
+        {"_id": {"$in": list(blocks)}, "released_at": {"$exists": True}},
+        {"$unset": {"released_at": ""}},
+    )
+    cursor = mongo_db.note_content_blocks.find(
+        {"_id": {"$in": list(blocks)}}, {"_id": 1}
+    )
+    existing = {doc["_id"] async for doc in cursor}
+    missing = [
+        {"_id": block_id, "content_id": content_id, **encode_content(block)}
+        for block_id, block in blocks.items()
+        if block_id not in existing
+    ]
+    if missing:
+        try:
+            await mongo_db.note_content_blocks.insert_many(
+                missing, ordered=False
+            )
+        except BulkWriteError as e:
+            if any(
+                error["code"] != _DUPLICATE_KEY
+                for error in e.details["writeErrors"]
+            ):
+                raise
+
+    return {
+        "$set": {
+            "codec": CODEC_BLOCKS,
+            "blocks": index,
+            "size": sum(entry["size"] for entry in index),
+        },
+        "$unset": {"content": "", "content_z": ""},
+    }
+
+
+async def release_blocks(mongo_db, previous: Optional[dict], update: dict):
+    """
+    Mark the blocks of a content document's previous version that its new
+    version (the update from store_content) no longer references, for
+    collect_released_blocks to delete after the grace period.
+    """
+    old = {entry["h"] for entry in _index(previous)}
+    new = {entry["h"] for entry in update["$set"].get("blocks", [])}
+    stale = old - new
+    if stale:
+        content_id = str(previous["_id"])
+        await mongo_db.note_content_blocks.update_many(
+            {"_id": {"$in": [_block_id(content_id, h) for h in stale]}},
+            {"$set": {"released_at": datetime.utcnow()}},
+        )
+
+
+async def collect_released_blocks(
+    mongo_db,
+    grace_seconds: float = settings.CONTENT_BLOCK_GRACE_SECONDS,
+    batch_size: int = 1000,
+) -> int:
+    """
+    Delete blocks released more than grace_seconds ago that their content
+    document's current index does not reference. Returns the number
+    deleted.
+    """
+    cutoff = datetime.utcnow() - timedelta(seconds=grace_seconds)
+    deleted = 0
+    last_id = None
+    while True:
+        query = {"released_at": {"$lt": cutoff}}
+        if last_id is not None:
+            query["_id"] = {"$gt": last_id}
+        cursor = (
+            mongo_db.note_content_blocks.find(query, {"content_id": 1})
+            .sort("_id", 1)
+            .limit(batch_size)
+        )
+        candidates = await cursor.to_list(length=batch_size)
+        if not candidates:
+            break
+        last_id = candidates[-1]["_id"]
+
+        content_ids = {doc["content_id"] for doc in candidates}
+        cursor = mongo_db.note_contents.find(
+            {"_id": {"$in": [ObjectId(i) for i in content_ids]}},
+            {"codec": 1, "blocks": 1},
+        )
+        referenced = {
+            _block_id(str(doc["_id"]), entry["h"])
+            async for doc in cursor
+            for entry in _index(doc)
+        }
+        stale = [
+            doc["_id"] for doc in candidates if doc["_id"] not in referenced
+        ]
+        if stale:
+            # Still marked: a save reclaiming a block unmarks it first
+            result = await mongo_db.note_content_blocks.delete_many(
+                {"_id": {"$in": stale}, "released_at": {"$lt": cutoff}}
+            )
+            deleted += result.deleted_count
+    return deleted
+
+
+async def delete_blocks(mongo_db, content_ids: Iterable[str]):
+    await mongo_db.note_content_blocks.delete_many(
+        {
+            "content_id": {
+                "$in": [str(content_id) for content_id in content_ids]
+            }
+        }
+    )
+
+
+async def _fetch_blocks(mongo_db, block_ids: List[str]) -> dict:
+    cursor = mongo_db.note_content_blocks.find({"_id": {"$in": block_ids}})
+    blocks = {doc["_id"]: decode_content(doc) async for doc in cursor}
+    if len(blocks) != len(set(block_ids)):
+        raise ValueError("Content blocks are missing")
+    return blocks
+
+
+async def load_blocks(mongo_db, docs: Iterable[Optional[dict]]):
+    """
+    Attach the block texts of block-stored content documents, with one
+    query for all of them, so decode_content can read them.
+    """
+    pending = [doc for doc in docs if _index(doc) and LOADED_BLOCKS not in doc]
+    if not pending:
+        return
+
+    ids = {
+        id(doc): [
+            _block_id(str(doc["_id"]), entry["h"]) for entry in _index(doc)
+        ]
+        for doc in pending
+    }
+    blocks = await _fetch_blocks(
+        mongo_db, list({i for block_ids in ids.values() for i in block_ids})
+    )
+    for doc in pending:
+        doc[LOADED_BLOCKS] = [blocks[i] for i in ids[id(doc)]]
+
+
+async def iter_block_content(
+    mongo_db,
+    doc: dict,
+    start: int = 0,
+    end: Optional[int] = None,
+    chunk_size: int = settings.CONTENT_STREAM_CHUNK_SIZE,
+    batch_size: int = 8,
+) -> AsyncIterator[bytes]:
+    """
+    Yield bytes [start, end) of block-stored content, fetching only the
+    blocks that overlap the range, batch_size blocks at a time.
+    """
+    content_id = str(doc["_id"])
+    wanted = []
+    offset = 0
+    for entry in _index(doc):
+        block_end = offset + entry["size"]
+        if block_end > start and (end is None or offset < end):
+            wanted.append((offset, _block_id(content_id, entry["h"])))
+        offset = block_end
+
+    for i in range(0, len(wanted), batch_size):
+        batch = wanted[i : i + batch_size]
+        blocks = await _fetch_blocks(
+            mongo_db, [block_id for _, block_id in batch]
+        )
+        for offset, block_id in batch:
+            raw = blocks[block_id].encode("utf-8")
+            first = max(start - offset, 0)
+            last = len(raw) if end is None else min(end - offset, len(raw))
+            for j in range(first, last, chunk_size):
+                yield raw[j : min(j + chunk_size, last)]
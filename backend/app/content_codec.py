@@ -0,0 +1,138 @@
+"""
+Storage encoding for note content in MongoDB.
+
+Content above CONTENT_COMPRESSION_THRESHOLD bytes is stored zlib-compressed
+in ``content_z`` with a ``codec`` marker; smaller content stays a plain
+string in ``content``. Documents without a codec are plain. ``size`` holds
+the UTF-8 length of the content (absent on older documents).
+
+Very large content uses the ``blocks`` codec (see app.content_blocks): the
+document holds only a block index, and the blocks must be loaded into it
+before it can be decoded here.
+"""
+
+import zlib
+from typing import Iterator, List, Optional
+
+from bson.binary import Binary
+
+from app.config import settings
+
+CODEC_ZLIB = "zlib"
+CODEC_BLOCKS = "blocks"
+
+# Key under which app.content_blocks attaches loaded block texts
+LOADED_BLOCKS = "_blocks"
+
+
+def encode_content(content: str) -> dict:
+    """Content fields for a MongoDB document."""
+    raw = content.encode("utf-8")
+    if len(raw) >= settings.CONTENT_COMPRESSION_THRESHOLD:
+        return {
+            "content_z": Binary(
+                zlib.compress(raw, settings.CONTENT_COMPRESSION_LEVEL)
+            ),
+            "codec": CODEC_ZLIB,
+            "size": len(raw),
+        }
+    return {"content": content, "size": len(raw)}
+
+
+def content_update(content: str) -> dict:
+    """
+    MongoDB update document replacing a note's content, clearing the fields
+    of whichever encoding is not used.
+    """
+    fields = encode_content(content)
+    unset = {
+        field: ""
+        for field in ("content", "content_z", "codec", "blocks")
+        if field not in fields
+    }
+    update: dict = {"$set": fields}
+    if unset:
+        update["$unset"] = unset
+    return update
+
+
+def decode_content(doc: Optional[dict]) -> str:
+    """Plain-text content of a MongoDB content document."""
+    if not doc:
+        return ""
+    codec = doc.get("codec")
+    if codec is None:
+        return doc.get("content", "")
+    if codec == CODEC_ZLIB:
+        return zlib.decompress(doc["content_z"]).decode("utf-8")
+    if codec == CODEC_BLOCKS:
+        return "".join(_loaded_blocks(doc))
+    raise ValueError(f"Unknown content codec: {codec}")
+
+
+def _loaded_blocks(doc: dict) -> List[str]:
+    if LOADED_BLOCKS not in doc:
+        raise ValueError("Content blocks have not been loaded")
+    return doc[LOADED_BLOCKS]
+
+
+def content_size(doc: dict) -> int:
+    """UTF-8 length of a content document's content."""
+    if "size" in doc:
+        return doc["size"]
+    return len(decode_content(doc).encode("utf-8"))
+
+
+def _iter_raw(doc: dict, chunk_size: int) -> Iterator[bytes]:
+    codec = doc.get("codec")
+    if codec is None:
+        raw = doc.get("content", "").encode("utf-8")
+        for i in range(0, len(raw), chunk_size):
+            yield raw[i : i + chunk_size]
+        return
+
+    if codec == CODEC_ZLIB:
+        data = doc["content_z"]
+        decompressor = zlib.decompressobj()
+        for i in range(0, len(data), chunk_size):
+            pending = data[i : i + chunk_size]
+            # Bound each output chunk, however well the input compressed
+            while pending:
+                chunk = decompressor.decompress(pending, chunk_size)
+                if chunk:
+                    yield chunk
+                pending = decompressor.unconsumed_tail
+        tail = decompressor.flush()
+        if tail:
+            yield tail
+        return
+
+    if codec == CODEC_BLOCKS:
+        for block in _loaded_blocks(doc):
+            raw = block.encode("utf-8")
+            for i in range(0, len(raw), chunk_size):
+                yield raw[i : i + chunk_size]
+        return
+
+    raise ValueError(f"Unknown content codec: {codec}")
+
+
+def iter_content(
+    doc: dict,
+    start: int = 0,
+    end: Optional[int] = None,
+    chunk_size: int = settings.CONTENT_STREAM_CHUNK_SIZE,
+) -> Iterator[bytes]:
+    """
+    Yield bytes [start, end) of the UTF-8 content in chunks, decompressing
+    incrementally instead of materializing the whole string.
+    """
+    offset = 0
+    for chunk in _iter_raw(doc, chunk_size):
+        chunk_end = offset + len(chunk)
+        if chunk_end > start:
+            stop = None if end is None else end - offset
+            yield chunk[max(start - offset, 0) : stop]
+        offset = chunk_end
+        if end is not None and offset >= end:
+            break
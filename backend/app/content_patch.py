@@ -0,0 +1,150 @@
+"""
+Server-side application of note content deltas.
+
+Two formats are accepted: a list of positional edits using the same
+insert/delete/replace vocabulary as WebSocket edit messages, or a unified
+diff. Both raise PatchError for a malformed delta, and its subclass
+PatchConflict when a well-formed delta does not match the given content.
+"""
+
+import re
+from typing import Iterable, Iterator, List, Tuple
+
+from app.schemas import ContentEdit
+
+_HUNK_HEADER = re.compile(r"^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@")
+
+
+class PatchError(ValueError):
+    pass
+
+
+class PatchConflict(PatchError):
+    pass
+
+
+def apply_edits(content: str, edits: Iterable[ContentEdit]) -> str:
+    """
+    Apply positional edits in order; each position refers to the content
+    as left by the previous edit.
+    """
+    for edit in edits:
+        pos = edit.position
+        length = edit.length or 0
+        if pos > len(content) or pos + length > len(content):
+            raise PatchConflict(f"Edit at position {pos} is out of range")
+
+        if edit.operation == "insert":
+            content = content[:pos] + (edit.content or "") + content[pos:]
+        elif edit.operation == "delete":
+            content = content[:pos] + content[pos + length :]
+        elif edit.operation == "replace":
+            content = (
+                content[:pos] + (edit.content or "") + content[pos + length :]
+            )
+    return content
+
+
+def _split_lines(text: str) -> List[str]:
+    """Split on "\\n" only, keeping line endings (unlike str.splitlines)."""
+    lines = text.split("\n")
+    last = lines.pop()
+    result = [line + "\n" for line in lines]
+    if last:
+        result.append(last)
+    return result
+
+
+def _strip_newline(body: List[Tuple[str, str]]):
+    """Apply a "\\ No newline at end of file" marker to the last line."""
+    if not body:
+        raise PatchError("Misplaced no-newline marker")
+    tag, text = body[-1]
+    body[-1] = (tag, text[:-1])
+
+
+def _parse_hunks(
+    diff: str,
+) -> Iterator[Tuple[int, int, List[Tuple[str, str]]]]:
+    """Yield (old_start, old_length, [(tag, line), ...]) for each hunk."""
+    lines = diff.split("\n")
+    i = 0
+    while i < len(lines):
+        header = _HUNK_HEADER.match(lines[i])
+        i += 1
+        if not header:
+            # File headers ("---", "+++") and anything before the first hunk
+            continue
+
+        old_start = int(header.group(1))
+        old_length = int(header.group(2) or 1)
+        new_length = int(header.group(4) or 1)
+        old_seen = new_seen = 0
+        body: List[Tuple[str, str]] = []
+
+        while old_seen < old_length or new_seen < new_length:
+            if i >= len(lines):
+                raise PatchError("Diff hunk is truncated")
+            line = lines[i]
+            i += 1
+            tag, text = (line[:1] or " "), line[1:] + "\n"
+            if tag == "\\":
+                _strip_newline(body)
+                continue
+            if tag not in " -+":
+                raise PatchError(f"Invalid diff line: {line!r}")
+            body.append((tag, text))
+            if tag in " -":
+                old_seen += 1
+            if tag in " +":
+                new_seen += 1
+
+        if old_seen != old_length or new_seen != new_length:
+            raise PatchError("Diff hunk does not match its header")
+
+        # A marker may follow the hunk's last line
+        while i < len(lines) and lines[i].startswith("\\"):
+            _strip_newline(body)
+            i += 1
+
+        yield old_start, old_length, body
+
+
+def apply_unified_diff(content: str, diff: str) -> str:
+    """
+    Apply a unified diff (as produced by ``diff -u`` or difflib). Context
+    and removed lines must match exactly; no fuzz is applied.
+    """
+    source = _split_lines(content)
+    result: List[str] = []
+    cursor = 0
+    hunks = 0
+
+    for old_start, old_length, body in _parse_hunks(diff):
+        hunks += 1
+        # A hunk with no old lines inserts after line old_start
+        start = old_start - 1 if old_length else old_start
+        if start < cursor:
+            raise PatchError(f"Diff hunk at line {old_start} is out of order")
+        if start > len(source):
+            raise PatchConflict(
+                f"Diff hunk at line {old_start} is past the end of the content"
+            )
+
+        result.extend(source[cursor:start])
+        cursor = start
+        for tag, text in body:
+            if tag in " -":
+                if cursor >= len(source) or source[cursor] != text:
+                    raise PatchConflict(
+                        f"Diff does not apply at line {cursor + 1}"
+                    )
+                cursor += 1
+            if tag in " +":
+                result.append(text)
+
+    if not hunks:
+        raise PatchError("Diff contains no hunks")
+
+    result.extend(source[cursor:])
+    return "".join(result)
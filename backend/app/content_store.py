@@ -0,0 +1,1054 @@
+"""
+Pluggable storage for note content.
+
+Routes read and write note content through ``content_store`` instead of a
+particular database. Backends, chosen with CONTENT_STORE:
+
+- "mongo": the MongoDB note_contents and note_versions collections, with
+  block storage for very large content (see app.content_blocks).
+- "postgres": the note_contents, note_versions and note_operations tables,
+  written in the request's own session, so content commits or rolls back
+  with the note's metadata and reads need no second database.
+- "memory": process-local dictionaries, for tests and benchmarks.
+
+To move between backends online, run with CONTENT_STORE set to the new
+backend and CONTENT_STORE_FALLBACK to the old one: notes not yet moved are
+read from the fallback, and moved on their first write, while
+``python -m app.maintenance migrate-content`` copies the rest.
+"""
+
+import logging
+from datetime import datetime
+from typing import (
+    AsyncIterator,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+    Union,
+)
+from uuid import UUID
+
+from bson.objectid import ObjectId
+from fastapi.encoders import jsonable_encoder
+from pymongo import ReturnDocument
+from pymongo.errors import PyMongoError
+from sqlalchemy import delete, func, insert, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.content_blocks import (
+    delete_blocks,
+    iter_block_content,
+    load_blocks,
+    release_blocks,
+    store_content,
+)
+from app.content_codec import (
+    CODEC_BLOCKS,
+    content_size,
+    decode_content,
+    encode_content,
+    iter_content,
+)
+from app.database import READ_ONLY, AsyncSessionLocal, MongoDatabase, mongo_db
+from app.models import Note, NoteContent, NoteOperation, NoteVersion
+
+logger = logging.getLogger(__name__)
+
+Chunks = Union[Iterator[bytes], AsyncIterator[bytes]]
+
+
+class ContentRef(NamedTuple):
+    """
+    Address of a note's content. content_id is the MongoDB document id
+    (notes.mongodb_content_id); without it MongoDB looks up by note_id.
+    """
+
+    note_id: UUID
+    content_id: Optional[str] = None
+
+
+class ContentRecord(NamedTuple):
+    """A note's content with its version history bookkeeping."""
+
+    content: str
+    # Revision of the last content save, None before history was recorded
+    revision: Optional[int] = None
+    # Oldest revision the history can rebuild
+    history_since: Optional[int] = None
+    # Revision of the latest full snapshot in the history
+    snapshot_revision: int = 0
+
+
+class ContentStream(NamedTuple):
+    """UTF-8 size of a note's content, and a reader for byte ranges."""
+
+    size: int
+    read: Callable[[int, Optional[int]], Chunks]
+
+
+def content_ref(note: Note) -> ContentRef:
+    return ContentRef(note.id, note.mongodb_content_id)
+
+
+def _utf8_size(content: str) -> int:
+    return len(content.encode("utf-8"))
+
+
+class ContentStore:
+    """
+    Interface for note content storage. ``db`` is the caller's PostgreSQL
+    session, used by stores that keep content in PostgreSQL.
+
+    Version entries are dicts of revision, created_at, user_id, size, ops
+    (reverse delta, see app.note_history) and snapshot, plus content for
+    snapshots when requested.
+    """
+
+    # Whether the store works in the caller's session, so its calls must
+    # not run concurrently with other queries on it and content must be
+    # written after the note row
+    shares_session = False
+
+    async def get(
+        self, db: AsyncSession, ref: ContentRef
+    ) -> Optional[ContentRecord]:
+        raise NotImplementedError
+
+    async def get_many(
+        self, db: AsyncSession, refs: Sequence[ContentRef]
+    ) -> Dict[UUID, str]:
+        """Content of several notes, by note id; missing notes are left out."""
+        raise NotImplementedError
+
+    async def existing(
+        self, db: AsyncSession, refs: Sequence[ContentRef]
+    ) -> Set[UUID]:
+        """Ids of the notes whose content is in this store."""
+        raise NotImplementedError
+
+    async def open_stream(
+        self, db: AsyncSession, ref: ContentRef
+    ) -> Optional[ContentStream]:
+        raise NotImplementedError
+
+    async def insert_many(
+        self,
+        db: AsyncSession,
+        items: Sequence[Tuple[ContentRef, str]],
+        now: datetime,
+    ):
+        """Store the content of new notes, as their revision 1."""
+        raise NotImplementedError
+
+    async def put(
+        self,
+        db: AsyncSession,
+        ref: ContentRef,
+        record: ContentRecord,
+        now: datetime,
+    ) -> bool:
+        """Store a record unless the note already has content here."""
+        raise NotImplementedError
+
+    async def replace(
+        self,
+        db: AsyncSession,
+        ref: ContentRef,
+        content: str,
+        revision: int,
+        now: datetime,
+        previous: Optional[ContentRecord] = None,
+    ) -> Optional[ContentRecord]:
+        """
+        Replace a note's content as of revision, returning the record it
+        replaced (previous, when the caller has already read it), or None
+        if the note has no content here.
+        """
+        raise NotImplementedError
+
+    async def set_history_fields(
+        self, db: AsyncSession, ref: ContentRef, **fields
+    ):
+        raise NotImplementedError
+
+    async def append_operation(
+        self, db: AsyncSession, ref: ContentRef, operation: dict
+    ):
+        raise NotImplementedError
+
+    async def delete_many(self, db: AsyncSession, refs: Sequence[ContentRef]):
+        """Delete the content, history and operations of notes."""
+        raise NotImplementedError
+
+    async def add_version(self, db: AsyncSession, ref: ContentRef, version):
+        raise NotImplementedError
+
+    async def find_snapshot(
+        self, db: AsyncSession, ref: ContentRef, low: int, high: int
+    ) -> Optional[dict]:
+        """Oldest snapshot version in [low, high], with its content."""
+        raise NotImplementedError
+
+    async def find_versions(
+        self,
+        db: AsyncSession,
+        ref: ContentRef,
+        after: int,
+        through: Optional[int] = None,
+        with_content: bool = False,
+    ) -> List[dict]:
+        """Versions in (after, through], newest first."""
+        raise NotImplementedError
+
+    async def first_version_after(
+        self, db: AsyncSession, ref: ContentRef, at: datetime
+    ) -> Optional[int]:
+        """Revision of the first version saved after at."""
+        raise NotImplementedError
+
+    async def list_versions(
+        self,
+        db: AsyncSession,
+        ref: ContentRef,
+        before: Optional[int],
+        limit: int,
+    ) -> List[dict]:
+        """Versions below before, newest first, without ops or content."""
+        raise NotImplementedError
+
+
+class MongoContentStore(ContentStore):
+    # Content document fields of a record
+    RECORD_PROJECTION = {
+        "content": 1,
+        "content_z": 1,
+        "codec": 1,
+        "blocks": 1,
+        "revision": 1,
+        "history_since": 1,
+        "snapshot_revision": 1,
+    }
+    STREAM_PROJECTION = {
+        "content": 1,
+        "content_z": 1,
+        "codec": 1,
+        "size": 1,
+        "blocks": 1,
+    }
+    # Version entry fields other than snapshot content
+    VERSION_PROJECTION = {"content": 0, "content_z": 0, "codec": 0}
+
+    def __init__(self, database: MongoDatabase):
+        self.database = database
+
+    @property
+    def mongo(self):
+        return self.database.db
+
+    def _reader(self, db: Optional[AsyncSession]):
+        """Database to read from: read-only sessions may use secondaries."""
+        if db is not None and db.info.get(READ_ONLY):
+            return self.database.read_db
+        return self.mongo
+
+    async def _find(self, db, query: dict, projection: dict) -> List[dict]:
+        """
+        Content documents with their blocks loaded. A secondary may hold
+        an index whose blocks it lacks, or whose blocks the primary has
+        released, so block content read there is reread on the primary.
+        """
+        reader = self._reader(db)
+        cursor = reader.note_contents.find(query, projection)
+        docs = await cursor.to_list(length=None)
+        try:
+            await load_blocks(reader, docs)
+        except ValueError:
+            if reader is self.mongo:
+                raise
+            return await self._find(None, query, projection)
+        return docs
+
+    @staticmethod
+    def _query(ref: ContentRef) -> dict:
+        if ref.content_id is None:
+            return {"note_id": str(ref.note_id)}
+        return {"_id": ObjectId(ref.content_id)}
+
+    @staticmethod
+    def _record(doc: dict) -> ContentRecord:
+        return ContentRecord(
+            decode_content(doc),
+            doc.get("revision"),
+            doc.get("history_since"),
+            doc.get("snapshot_revision", 0),
+        )
+
+    @staticmethod
+    def _version(doc: dict, with_content: bool) -> dict:
+        version = {
+            "revision": doc["revision"],
+            "created_at": doc["created_at"],
+            "user_id": doc.get("user_id"),
+            "size": doc["size"],
+            "ops": doc.get("ops", []),
+            "snapshot": doc.get("snapshot", False),
+        }
+        if with_content and version["snapshot"]:
+            version["content"] = decode_content(doc)
+        return version
+
+    async def get(self, db, ref):
+        docs = await self._find(db, self._query(ref), self.RECORD_PROJECTION)
+        return self._record(docs[0]) if docs else None
+
+    @staticmethod
+    def _query_many(
+        refs: Sequence[ContentRef],
+    ) -> Tuple[dict, Callable[[dict], UUID]]:
+        """
+        Query for the content documents of several notes, and a function
+        giving a found document's note id. Refs without a content id are
+        looked up by note_id, as in _query.
+        """
+        by_content_id = {
+            ref.content_id: ref.note_id
+            for ref in refs
+            if ref.content_id is not None
+        }
+        by_note_id = {
+            str(ref.note_id): ref.note_id
+            for ref in refs
+            if ref.content_id is None
+        }
+        clauses = []
+        if by_content_id:
+            clauses.append(
+                {"_id": {"$in": [ObjectId(i) for i in by_content_id]}}
+            )
+        if by_note_id:
+            clauses.append({"note_id": {"$in": list(by_note_id)}})
+        query = clauses[0] if len(clauses) == 1 else {"$or": clauses}
+
+        def note_id(doc: dict) -> UUID:
+            found = by_content_id.get(str(doc["_id"]))
+            return found if found is not None else by_note_id[doc["note_id"]]
+
+        return query, note_id
+
+    async def get_many(self, db, refs):
+        if not refs:
+            return {}
+        query, note_id = self._query_many(refs)
+        docs = await self._find(
+            db, query, {**self.STREAM_PROJECTION, "note_id": 1}
+        )
+        return {note_id(doc): decode_content(doc) for doc in docs}
+
+    async def existing(self, db, refs):
+        if not refs:
+            return set()
+        query, note_id = self._query_many(refs)
+        cursor = self.mongo.note_contents.find(query, {"note_id": 1})
+        return {note_id(doc) async for doc in cursor}
+
+    async def open_stream(self, db, ref):
+        reader = self._reader(db)
+        doc = await reader.note_contents.find_one(
+            self._query(ref), self.STREAM_PROJECTION
+        )
+        if doc is not None and doc.get("codec") == CODEC_BLOCKS:
+            # Blocks are streamed from the primary, with an index to match
+            reader = self.mongo
+            doc = await reader.note_contents.find_one(
+                self._query(ref), self.STREAM_PROJECTION
+            )
+        if doc is None:
+            return None
+
+        def read(start: int = 0, end: Optional[int] = None) -> Chunks:
+            if doc.get("codec") == CODEC_BLOCKS:
+                # Fetches only the blocks overlapping the range
+                return iter_block_content(reader, doc, start, end)
+            return iter_content(doc, start, end)
+
+        return ContentStream(content_size(doc), read)
+
+    async def insert_many(self, db, items, now):
+        if not items:
+            return
+        docs = []
+        for ref, content in items:
+            fields = await store_content(self.mongo, ref.content_id, content)
+            docs.append(
+                {
+                    "_id": ObjectId(ref.content_id),
+                    "note_id": str(ref.note_id),
+                    **fields["$set"],
+                    "revision": 1,
+                    "history_since": 1,
+                    "created_at": now,
+                    "updated_at": now,
+                    "operations": [],  # For operational transformation
+                }
+            )
+        await self.mongo.note_contents.insert_many(docs, ordered=False)
+
+    async def put(self, db, ref, record, now):
+        fields = await store_content(
+            self.mongo, ref.content_id, record.content
+        )
+        fields["$set"].update(
+            note_id=str(ref.note_id),
+            revision=record.revision,
+            history_since=record.history_since,
+            snapshot_revision=record.snapshot_revision,
+            created_at=now,
+            updated_at=now,
+            operations=[],
+        )
+        result = await self.mongo.note_contents.update_one(
+            self._query(ref), {"$setOnInsert": fields["$set"]}, upsert=True
+        )
+        return result.upserted_id is not None
+
+    async def replace(self, db, ref, content, revision, now, previous=None):
+        changes = await store_content(self.mongo, ref.content_id, content)
+        changes["$set"]["updated_at"] = now
+        changes["$set"]["revision"] = revision
+        doc = await self.mongo.note_contents.find_one_and_update(
+            self._query(ref),
+            changes,
+            # Only the block index is needed when previous is known
+            projection=(
+                self.RECORD_PROJECTION
+                if previous is None
+                else {"codec": 1, "blocks": 1}
+            ),
+            return_document=ReturnDocument.BEFORE,
+        )
+        if doc is None:
+            return None
+        if previous is None:
+            await load_blocks(self.mongo, [doc])
+            previous = self._record(doc)
+        await release_blocks(self.mongo, doc, changes)
+        return previous
+
+    async def set_history_fields(self, db, ref, **fields):
+        await self.mongo.note_contents.update_one(
+            self._query(ref), {"$set": fields}
+        )
+
+    async def append_operation(self, db, ref, operation):
+        await self.mongo.note_contents.update_one(
+            self._query(ref),
+            {
+                "$push": {"operations": operation},
+                "$set": {"updated_at": datetime.utcnow()},
+            },
+        )
+
+    async def delete_many(self, db, refs):
+        if not refs:
+            return
+        content_ids = [ref.content_id for ref in refs]
+        await self.mongo.note_contents.delete_many(
+            {"_id": {"$in": [ObjectId(i) for i in content_ids]}}
+        )
+        await delete_blocks(self.mongo, content_ids)
+        await self.mongo.note_versions.delete_many(
+            {
+                "note_id": {
+                    "$in": [str(ref.note_id) for ref in refs if ref.note_id]
+                }
+            }
+        )
+
+    async def add_version(self, db, ref, version):
+        doc = {"note_id": str(ref.note_id), **version}
+        content = doc.pop("content", None)
+        if version["snapshot"]:
+            doc.update(encode_content(content))
+            doc["size"] = version["size"]
+        # Content is already saved; a lost entry only shortens the history
+        try:
+            await self.mongo.note_versions.insert_one(doc)
+        except PyMongoError as e:
+            logger.error(
+                f"Error recording revision {version['revision']} "
+                f"of {ref.note_id}: {e}"
+            )
+
+    async def find_snapshot(self, db, ref, low, high):
+        doc = await self._reader(db).note_versions.find_one(
+            {
+                "note_id": str(ref.note_id),
+                "revision": {"$gte": low, "$lte": high},
+                "snapshot": True,
+            },
+            sort=[("revision", 1)],
+        )
+        return None if doc is None else self._version(doc, True)
+
+    async def find_versions(
+        self, db, ref, after, through=None, with_content=False
+    ):
+        revision: dict = {"$gt": after}
+        if through is not None:
+            revision["$lte"] = through
+        cursor = (
+            self._reader(db)
+            .note_versions.find(
+                {"note_id": str(ref.note_id), "revision": revision},
+                None if with_content else self.VERSION_PROJECTION,
+            )
+            .sort("revision", -1)
+        )
+        return [
+            self._version(doc, with_content)
+            for doc in await cursor.to_list(length=None)
+        ]
+
+    async def first_version_after(self, db, ref, at):
+        doc = await self._reader(db).note_versions.find_one(
+            {"note_id": str(ref.note_id), "created_at": {"$gt": at}},
+            {"revision": 1},
+            sort=[("revision", 1)],
+        )
+        return None if doc is None else doc["revision"]
+
+    async def list_versions(self, db, ref, before, limit):
+        query: dict = {"note_id": str(ref.note_id)}
+        if before is not None:
+            query["revision"] = {"$lt": before}
+        cursor = (
+            self._reader(db)
+            .note_versions.find(query, {**self.VERSION_PROJECTION, "ops": 0})
+            .sort("revision", -1)
+            .limit(limit)
+        )
+        return [
+            self._version(doc, False)
+            for doc in await cursor.to_list(length=limit)
+        ]
+
+
+class PostgresContentStore(ContentStore):
+    shares_session = True
+
+    RECORD_COLUMNS = (
+        NoteContent.content,
+        NoteContent.revision,
+        NoteContent.history_since,
+        NoteContent.snapshot_revision,
+    )
+    VERSION_COLUMNS = (
+        NoteVersion.revision,
+        NoteVersion.created_at,
+        NoteVersion.user_id,
+        NoteVersion.size,
+        NoteVersion.ops,
+        NoteVersion.snapshot,
+    )
+
+    async def get(self, db, ref):
+        result = await db.execute(
+            select(*self.RECORD_COLUMNS).where(
+                NoteContent.note_id == ref.note_id
+            )
+        )
+        row = result.one_or_none()
+        return None if row is None else ContentRecord(*row)
+
+    async def get_many(self, db, refs):
+        if not refs:
+            return {}
+        result = await db.execute(
+            select(NoteContent.note_id, NoteContent.content).where(
+                NoteContent.note_id.in_([ref.note_id for ref in refs])
+            )
+        )
+        return dict(result.all())
+
+    async def existing(self, db, refs):
+        result = await db.execute(
+            select(NoteContent.note_id).where(
+                NoteContent.note_id.in_([ref.note_id for ref in refs])
+            )
+        )
+        return set(result.scalars())
+
+    async def open_stream(self, db, ref):
+        result = await db.execute(
+            select(NoteContent.size).where(NoteContent.note_id == ref.note_id)
+        )
+        size = result.scalar_one_or_none()
+        if size is None:
+            return None
+
+        async def read(
+            start: int = 0, end: Optional[int] = None
+        ) -> AsyncIterator[bytes]:
+            # Runs after the request's session has been closed, so opens
+            # its own on the same database. The range is fetched a page at
+            # a time, so only one page is held in memory, from a single
+            # snapshot, so a save meanwhile cannot tear the content.
+            raw = func.convert_to(NoteContent.content, "UTF8")
+            stop = size if end is None else end
+            page_size = settings.CONTENT_STREAM_PAGE_SIZE
+            chunk_size = settings.CONTENT_STREAM_CHUNK_SIZE
+            async with AsyncSessionLocal(
+                bind=db.bind, info=dict(db.info)
+            ) as session:
+                await session.connection(
+                    execution_options={"isolation_level": "REPEATABLE READ"}
+                )
+                position = start
+                while position < stop:
+                    result = await session.execute(
+                        select(
+                            func.substring(
+                                raw,
+                                position + 1,
+                                min(page_size, stop - position),
+                            )
+                        ).where(NoteContent.note_id == ref.note_id)
+                    )
+                    data = result.scalar_one_or_none()
+                    if not data:
+                        break
+                    position += len(data)
+                    for i in range(0, len(data), chunk_size):
+                        yield data[i : i + chunk_size]
+
+        return ContentStream(size, read)
+
+    async def insert_many(self, db, items, now):
+        if not items:
+            return
+        await db.execute(
+            insert(NoteContent),
+            [
+                {
+                    "note_id": ref.note_id,
+                    "content": content,
+                    "size": _utf8_size(content),
+                    "revision": 1,
+                    "history_since": 1,
+                    "created_at": now,
+                    "updated_at": now,
+                }
+                for ref, content in items
+            ],
+        )
+
+    async def put(self, db, ref, record, now):
+        result = await db.execute(
+            pg_insert(NoteContent)
+            .values(
+                note_id=ref.note_id,
+                content=record.content,
+                size=_utf8_size(record.content),
+                revision=record.revision,
+                history_since=record.history_since,
+                snapshot_revision=record.snapshot_revision,
+                created_at=now,
+                updated_at=now,
+            )
+            .on_conflict_do_nothing(index_elements=[NoteContent.note_id])
+            .returning(NoteContent.note_id)
+        )
+        return result.scalar_one_or_none() is not None
+
+    async def replace(self, db, ref, content, revision, now, previous=None):
+        values = {
+            "content": content,
+            "size": _utf8_size(content),
+            "revision": revision,
+            "updated_at": now,
+        }
+        if previous is not None:
+            result = await db.execute(
+                update(NoteContent)
+                .where(NoteContent.note_id == ref.note_id)
+                .values(**values)
+                .returning(NoteContent.note_id)
+                .execution_options(synchronize_session=False)
+            )
+            return previous if result.scalar_one_or_none() else None
+
+        # The previous record comes back from the update itself
+        old = (
+            select(NoteContent.note_id, *self.RECORD_COLUMNS)
+            .where(NoteContent.note_id == ref.note_id)
+            .with_for_update()
+            .subquery("old")
+        )
+        result = await db.execute(
+            update(NoteContent)
+            .where(NoteContent.note_id == old.c.note_id)
+            .values(**values)
+            .returning(
+                old.c.content,
+                old.c.revision,
+                old.c.history_since,
+                old.c.snapshot_revision,
+            )
+            .execution_options(synchronize_session=False)
+        )
+        row = result.one_or_none()
+        return None if row is None else ContentRecord(*row)
+
+    async def set_history_fields(self, db, ref, **fields):
+        await db.execute(
+            update(NoteContent)
+            .where(NoteContent.note_id == ref.note_id)
+            .values(**fields)
+            .execution_options(synchronize_session=False)
+        )
+
+    async def append_operation(self, db, ref, operation):
+        await db.execute(
+            insert(NoteOperation).values(
+                note_id=ref.note_id,
+                operation=jsonable_encoder(operation),
+                created_at=datetime.utcnow(),
+            )
+        )
+
+    async def delete_many(self, db, refs):
+        if not refs:
+            return
+        note_ids = [ref.note_id for ref in refs]
+        for model in (NoteOperation, NoteVersion, NoteContent):
+            await db.execute(
+                delete(model)
+                .where(model.note_id.in_(note_ids))
+                .execution_options(synchronize_session=False)
+            )
+
+    async def add_version(self, db, ref, version):
+        await db.execute(
+            insert(NoteVersion).values(
+                note_id=ref.note_id,
+                **{"content": None, **version},
+            )
+        )
+
+    async def find_snapshot(self, db, ref, low, high):
+        result = await db.execute(
+            select(*self.VERSION_COLUMNS, NoteVersion.content)
+            .where(
+                NoteVersion.note_id == ref.note_id,
+                NoteVersion.revision.between(low, high),
+                NoteVersion.snapshot.is_(True),
+            )
+            .order_by(NoteVersion.revision)
+            .limit(1)
+        )
+        row = result.one_or_none()
+        return None if row is None else dict(row._mapping)
+
+    async def find_versions(
+        self, db, ref, after, through=None, with_content=False
+    ):
+        columns = self.VERSION_COLUMNS
+        if with_content:
+            columns += (NoteVersion.content,)
+        query = select(*columns).where(
+            NoteVersion.note_id == ref.note_id, NoteVersion.revision > after
+        )
+        if through is not None:
+            query = query.where(NoteVersion.revision <= through)
+        result = await db.execute(query.order_by(NoteVersion.revision.desc()))
+        return [dict(row._mapping) for row in result]
+
+    async def first_version_after(self, db, ref, at):
+        result = await db.execute(
+            select(NoteVersion.revision)
+            .where(
+                NoteVersion.note_id == ref.note_id, NoteVersion.created_at > at
+            )
+            .order_by(NoteVersion.revision)
+            .limit(1)
+        )
+        return result.scalar_one_or_none()
+
+    async def list_versions(self, db, ref, before, limit):
+        query = select(
+            NoteVersion.revision,
+            NoteVersion.created_at,
+            NoteVersion.user_id,
+            NoteVersion.size,
+            NoteVersion.snapshot,
+        ).where(NoteVersion.note_id == ref.note_id)
+        if before is not None:
+            query = query.where(NoteVersion.revision < before)
+        result = await db.execute(
+            query.order_by(NoteVersion.revision.desc()).limit(limit)
+        )
+        return [dict(row._mapping) for row in result]
+
+
+class MemoryContentStore(ContentStore):
+    """Keeps everything in process memory; content is lost on restart."""
+
+    def __init__(self):
+        self.records: Dict[UUID, ContentRecord] = {}
+        self.versions: Dict[UUID, Dict[int, dict]] = {}
+        self.operations: Dict[UUID, List[dict]] = {}
+
+    async def get(self, db, ref):
+        return self.records.get(ref.note_id)
+
+    async def get_many(self, db, refs):
+        return {
+            ref.note_id: self.records[ref.note_id].content
+            for ref in refs
+            if ref.note_id in self.records
+        }
+
+    async def existing(self, db, refs):
+        return {ref.note_id for ref in refs if ref.note_id in self.records}
+
+    async def open_stream(self, db, ref):
+        record = self.records.get(ref.note_id)
+        if record is None:
+            return None
+        raw = record.content.encode("utf-8")
+
+        def read(start: int = 0, end: Optional[int] = None) -> Chunks:
+            stop = len(raw) if end is None else end
+            chunk_size = settings.CONTENT_STREAM_CHUNK_SIZE
+            return (
+                raw[i : min(i + chunk_size, stop)]
+                for i in range(start, stop, chunk_size)
+            )
+
+        return ContentStream(len(raw), read)
+
+    async def insert_many(self, db, items, now):
+        for ref, content in items:
+            self.records[ref.note_id] = ContentRecord(content, 1, 1)
+
+    async def put(self, db, ref, record, now):
+        if ref.note_id in self.records:
+            return False
+        self.records[ref.note_id] = record
+        return True
+
+    async def replace(self, db, ref, content, revision, now, previous=None):
+        record = self.records.get(ref.note_id)
+        if record is None:
+            return None
+        self.records[ref.note_id] = record._replace(
+            content=content, revision=revision
+        )
+        return previous or record
+
+    async def set_history_fields(self, db, ref, **fields):
+        record = self.records.get(ref.note_id)
+        if record is not None:
+            self.records[ref.note_id] = record._replace(**fields)
+
+    async def append_operation(self, db, ref, operation):
+        self.operations.setdefault(ref.note_id, []).append(operation)
+
+    async def delete_many(self, db, refs):
+        for ref in refs:
+            self.records.pop(ref.note_id, None)
+            self.versions.pop(ref.note_id, None)
+            self.operations.pop(ref.note_id, None)
+
+    def _versions(self, ref: ContentRef) -> List[dict]:
+        versions = self.versions.get(ref.note_id, {})
+        return [versions[r] for r in sorted(versions, reverse=True)]
+
+    async def add_version(self, db, ref, version):
+        self.versions.setdefault(ref.note_id, {})[version["revision"]] = dict(
+            version
+        )
+
+    async def find_snapshot(self, db, ref, low, high):
+        snapshots = [
+            version
+            for version in self._versions(ref)
+            if version["snapshot"] and low <= version["revision"] <= high
+        ]
+        return dict(snapshots[-1]) if snapshots else None
+
+    async def find_versions(
+        self, db, ref, after, through=None, with_content=False
+    ):
+        return [
+            {
+                key: value
+                for key, value in version.items()
+                if with_content or key != "content"
+            }
+            for version in self._versions(ref)
+            if version["revision"] > after
+            and (through is None or version["revision"] <= through)
+        ]
+
+    async def first_version_after(self, db, ref, at):
+        later = [
+            version["revision"]
+            for version in self._versions(ref)
+            if version["created_at"] > at
+        ]
+        return min(later) if later else None
+
+    async def list_versions(self, db, ref, before, limit):
+        return [
+            {
+                key: value
+                for key, value in version.items()
+                if key not in ("ops", "content")
+            }
+            for version in self._versions(ref)
+            if before is None or version["revision"] < before
+        ][:limit]
+
+
+async def migrate_note(
+    source: ContentStore,
+    target: ContentStore,
+    db: AsyncSession,
+    ref: ContentRef,
+    now: datetime,
+) -> bool:
+    """
+    Copy a note's content and version history from source to target,
+    unless target already has it. Returns False if source has no content
+    for the note either.
+    """
+    record = await source.get(db, ref)
+    if record is None:
+        return False
+    if await target.put(db, ref, record, now):
+        versions = await source.find_versions(db, ref, 0, with_content=True)
+        for version in reversed(versions):
+            await target.add_version(db, ref, version)
+    return True
+
+
+class FallbackContentStore(ContentStore):
+    """
+    Serves notes from primary, falling back to the store content is being
+    moved from. Writes go to primary, moving a note there first if needed.
+    """
+
+    def __init__(self, primary: ContentStore, fallback: ContentStore):
+        self.primary = primary
+        self.fallback = fallback
+        self.shares_session = primary.shares_session or fallback.shares_session
+
+    async def _holder(self, db, ref: ContentRef) -> ContentStore:
+        if await self.primary.existing(db, [ref]):
+            return self.primary
+        return self.fallback
+
+    async def get(self, db, ref):
+        record = await self.primary.get(db, ref)
+        if record is None:
+            record = await self.fallback.get(db, ref)
+        return record
+
+    async def get_many(self, db, refs):
+        contents = await self.primary.get_many(db, refs)
+        missing = [ref for ref in refs if ref.note_id not in contents]
+        if missing:
+            contents.update(await self.fallback.get_many(db, missing))
+        return contents
+
+    async def existing(self, db, refs):
+        found = await self.primary.existing(db, refs)
+        missing = [ref for ref in refs if ref.note_id not in found]
+        if missing:
+            found |= await self.fallback.existing(db, missing)
+        return found
+
+    async def open_stream(self, db, ref):
+        stream = await self.primary.open_stream(db, ref)
+        if stream is None:
+            stream = await self.fallback.open_stream(db, ref)
+        return stream
+
+    async def insert_many(self, db, items, now):
+        await self.primary.insert_many(db, items, now)
+
+    async def put(self, db, ref, record, now):
+        return await self.primary.put(db, ref, record, now)
+
+    async def replace(self, db, ref, content, revision, now, previous=None):
+        replaced = await self.primary.replace(
+            db, ref, content, revision, now, previous
+        )
+        if replaced is not None:
+            return replaced
+        if not await migrate_note(self.fallback, self.primary, db, ref, now):
+            return None
+        return await self.primary.replace(
+            db, ref, content, revision, now, previous
+        )
+
+    async def set_history_fields(self, db, ref, **fields):
+        await self.primary.set_history_fields(db, ref, **fields)
+
+    async def append_operation(self, db, ref, operation):
+        store = await self._holder(db, ref)
+        await store.append_operation(db, ref, operation)
+
+    async def delete_many(self, db, refs):
+        await self.primary.delete_many(db, refs)
+        await self.fallback.delete_many(db, refs)
+
+    async def add_version(self, db, ref, version):
+        await self.primary.add_version(db, ref, version)
+
+    async def find_snapshot(self, db, ref, low, high):
+        store = await self._holder(db, ref)
+        return await store.find_snapshot(db, ref, low, high)
+
+    async def find_versions(
+        self, db, ref, after, through=None, with_content=False
+    ):
+        store = await self._holder(db, ref)
+        return await store.find_versions(db, ref, after, through, with_content)
+
+    async def first_version_after(self, db, ref, at):
+        store = await self._holder(db, ref)
+        return await store.first_version_after(db, ref, at)
+
+    async def list_versions(self, db, ref, before, limit):
+        store = await self._holder(db, ref)
+        return await store.list_versions(db, ref, before, limit)
+
+
+def create_content_store(name: str) -> ContentStore:
+    if name == "postgres":
+        return PostgresContentStore()
+    if name == "memory":
+        return MemoryContentStore()
+    return MongoContentStore(mongo_db)
+
+
+def _configured_store() -> ContentStore:
+    store = create_content_store(settings.CONTENT_STORE)
+    if settings.CONTENT_STORE_FALLBACK:
+        store = FallbackContentStore(
+            store, create_content_store(settings.CONTENT_STORE_FALLBACK)
+        )
+    return store
+
+
+content_store = _configured_store()
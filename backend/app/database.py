@@ -1,4 +1,13 @@
+import logging
+import random
+
+from fastapi import Request
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo.read_preferences import (
+    make_read_preference,
+    read_pref_mode_from_name,
+)
+from sqlalchemy.engine import make_url
 from sqlalchemy.ext.asyncio import (
     AsyncSession,
     async_sessionmaker,
@@ -8,12 +17,35 @@ from sqlalchemy.orm import declarative_base
 
 from app.config import settings
 
+logger = logging.getLogger(__name__)
+
+
+def _create_engine(url: str):
+    cache_size = settings.DATABASE_STATEMENT_CACHE_SIZE
+    # SQLAlchemy keeps its own prepared statement cache on top of asyncpg's
+    url = make_url(
+        url.replace("postgresql://", "postgresql+asyncpg://")
+    ).update_query_dict({"prepared_statement_cache_size": str(cache_size)})
+    return create_async_engine(
+        url,
+        echo=settings.DATABASE_ECHO,
+        future=True,
+        pool_size=settings.DATABASE_POOL_SIZE,
+        max_overflow=settings.DATABASE_MAX_OVERFLOW,
+        pool_timeout=settings.DATABASE_POOL_TIMEOUT,
+        pool_recycle=settings.DATABASE_POOL_RECYCLE,
+        pool_pre_ping=settings.DATABASE_POOL_PRE_PING,
+        connect_args={"statement_cache_size": cache_size},
+    )
+
+
 # PostgreSQL
-engine = create_async_engine(
-    settings.DATABASE_URL.replace("postgresql://", "postgresql+asyncpg://"),
-    echo=settings.DEBUG,
-    future=True,
-)
+engine = _create_engine(settings.DATABASE_URL)
+
+# Read replicas, used by read-only sessions (see read_session)
+replica_engines = [
+    _create_engine(url) for url in settings.get_database_replica_urls()
+]
 
 AsyncSessionLocal = async_sessionmaker(
     engine,
@@ -25,6 +57,63 @@ AsyncSessionLocal = async_sessionmaker(
 
 Base = declarative_base()
 
+# Session.info key of read-only sessions, which may see replication lag;
+# content stores route their reads for such sessions to replicas too
+READ_ONLY = "read_only"
+
+# Whether any reads are served by replicas
+READ_REPLICAS_ENABLED = (
+    bool(replica_engines) or settings.MONGODB_READ_PREFERENCE != "primary"
+)
+
+# Set on responses to writes for READ_YOUR_WRITES_SECONDS; clients that
+# send it back read from the primaries, so they see their own writes
+PRIMARY_PIN_COOKIE = "read_primary"
+
+# Request.state attribute set by read_only_request: the request only
+# reads, so its response does not pin the client to the primaries, even
+# for a POST
+READ_ONLY_REQUEST = "read_only_request"
+
+
+def log_pool_settings():
+    """Log the effective connection pool settings, once at startup."""
+    logger.info(
+        f"PostgreSQL pool ({settings.ENVIRONMENT}): "
+        f"size={settings.DATABASE_POOL_SIZE}, "
+        f"max_overflow={settings.DATABASE_MAX_OVERFLOW}, "
+        f"timeout={settings.DATABASE_POOL_TIMEOUT}s, "
+        f"recycle={settings.DATABASE_POOL_RECYCLE}s, "
+        f"pre_ping={settings.DATABASE_POOL_PRE_PING}, "
+        f"statement_cache_size={settings.DATABASE_STATEMENT_CACHE_SIZE}, "
+        f"echo={settings.DATABASE_ECHO}, "
+        f"replicas={len(replica_engines)}"
+    )
+    logger.info(
+        f"MongoDB pool ({settings.ENVIRONMENT}): "
+        f"max={settings.MONGODB_MAX_POOL_SIZE}, "
+        f"min={settings.MONGODB_MIN_POOL_SIZE}, "
+        f"max_idle={settings.MONGODB_MAX_IDLE_TIME_MS}ms, "
+        f"wait_queue_timeout={settings.MONGODB_WAIT_QUEUE_TIMEOUT_MS}ms, "
+        f"read_preference={settings.MONGODB_READ_PREFERENCE}"
+    )
+
+
+def read_session(primary: bool = False) -> AsyncSession:
+    """
+    Session for read-only work, on a random read replica when any are
+    configured. primary keeps it on the primary, for clients that must
+    see their recent writes.
+    """
+    if primary:
+        return AsyncSessionLocal()
+    bind = random.choice(replica_engines) if replica_engines else engine
+    return AsyncSessionLocal(bind=bind, info={READ_ONLY: True})
+
+
+def reads_from_primary(request: Request) -> bool:
+    return PRIMARY_PIN_COOKIE in request.cookies
+
 
 # MongoDB
 class MongoDatabase:
@@ -33,10 +122,34 @@ class MongoDatabase:
     def __init__(self):
         self.client = None
         self.db = None
+        # Same database with MONGODB_READ_PREFERENCE, for read-only sessions
+        self.read_db = None
 
     async def connect(self):
-        self.client = AsyncIOMotorClient(settings.MONGODB_URL)
+        self.client = AsyncIOMotorClient(
+            settings.MONGODB_URL,
+            maxPoolSize=settings.MONGODB_MAX_POOL_SIZE,
+            minPoolSize=settings.MONGODB_MIN_POOL_SIZE,
+            maxIdleTimeMS=settings.MONGODB_MAX_IDLE_TIME_MS,
+            waitQueueTimeoutMS=settings.MONGODB_WAIT_QUEUE_TIMEOUT_MS,
+        )
         self.db = self.client[settings.MONGODB_DB_NAME]
+        self.read_db = self.client.get_database(
+            settings.MONGODB_DB_NAME,
+            read_preference=make_read_preference(
+                read_pref_mode_from_name(settings.MONGODB_READ_PREFERENCE),
+                None,
+            ),
+        )
+        # Content is looked up by note_id alongside the Postgres query
+        await self.db.note_contents.create_index("note_id")
+        await self.db.note_content_blocks.create_index("content_id")
+        await self.db.note_content_blocks.create_index(
+            "released_at", sparse=True
+        )
+        await self.db.note_versions.create_index(
+            [("note_id", 1), ("revision", -1)], unique=True
+        )
 
     async def disconnect(self):
         if self.client:
@@ -58,5 +171,25 @@ async def get_db():
             await session.close()
 
 
+async def get_read_db(request: Request):
+    """
+    Session for read-only endpoints: on a replica, unless the client wrote
+    recently (see PRIMARY_PIN_COOKIE).
+    """
+    async with read_session(primary=reads_from_primary(request)) as session:
+        try:
+            yield session
+        finally:
+            await session.close()
+
+
+def read_only_request(request: Request):
+    """
+    Route dependency declaring that a non-GET endpoint only reads (e.g. a
+    POST taking its query in the body), so it does not pin to primary.
+    """
+    setattr(request.state, READ_ONLY_REQUEST, True)
+
+
 def get_mongo_db():
     return mongo_db.db
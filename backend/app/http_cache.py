@@ -0,0 +1,181 @@
+"""
+HTTP conditional request helpers (ETag / Last-Modified) for note reads.
+"""
+
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Optional, Tuple
+
+from fastapi import Request, Response, status
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.models import Note
+
+# Suffix of the strong ETag of a gzip-encoded representation
+GZIP_ETAG_SUFFIX = "-gzip"
+
+
+def note_etag(note: Note) -> str:
+    """Strong ETag for a note's representation, derived from its revision."""
+    return f'"{note.id.hex}.{note.revision}"'
+
+
+def _identity_etag(tag: str) -> str:
+    """The ETag of the identity representation a tag was derived from."""
+    if tag.startswith("W/"):
+        tag = tag[2:]
+    suffix = GZIP_ETAG_SUFFIX + '"'
+    if tag.endswith(suffix):
+        tag = tag[: -len(suffix)] + '"'
+    return tag
+
+
+class EncodedETagMiddleware:
+    """
+    Give gzip-encoded responses their own strong ETag. A strong validator
+    must change with the representation (RFC 9110 8.8.1), and GZipMiddleware
+    keeps the identity ETag, so a strong ETag of a compressed response gets
+    GZIP_ETAG_SUFFIX, as mod_deflate does. Add it outside GZipMiddleware.
+    If-None-Match accepts either form (is_not_modified); If-Range only the
+    identity one, since byte ranges refer to the identity encoding.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        async def send_with_etag(message: Message):
+            if message["type"] == "http.response.start":
+                headers = MutableHeaders(scope=message)
+                etag = headers.get("etag")
+                if (
+                    etag
+                    and etag.startswith('"')
+                    and headers.get("content-encoding") == "gzip"
+                ):
+                    headers["etag"] = f'{etag[:-1]}{GZIP_ETAG_SUFFIX}"'
+            await send(message)
+
+        await self.app(scope, receive, send_with_etag)
+
+
+def http_date(value: datetime) -> str:
+    return format_datetime(value.replace(tzinfo=timezone.utc), usegmt=True)
+
+
+def cache_headers(
+    etag: str, last_modified: Optional[datetime], public: bool
+) -> dict:
+    """
+    Validators plus Cache-Control. Responses may be stored but must be
+    revalidated, which turns repeated polls into cheap 304s.
+    """
+    headers = {
+        "ETag": etag,
+        "Cache-Control": f"{'public' if public else 'private'}, no-cache",
+    }
+    if last_modified is not None:
+        headers["Last-Modified"] = http_date(last_modified)
+    return headers
+
+
+def is_not_modified(
+    request: Request, etag: str, last_modified: Optional[datetime]
+) -> bool:
+    """
+    Evaluate If-None-Match (preferred) or If-Modified-Since against the
+    current validators.
+    """
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        candidates = [tag.strip() for tag in if_none_match.split(",")]
+        # If-None-Match uses weak comparison, which also treats the gzip
+        # variant of the ETag as the same
+        return "*" in candidates or etag in [
+            _identity_etag(tag) for tag in candidates
+        ]
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and last_modified is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=timezone.utc)
+        # HTTP dates have one-second resolution
+        modified = last_modified.replace(tzinfo=timezone.utc, microsecond=0)
+        return modified <= since
+
+    return False
+
+
+def not_modified_response(headers: dict) -> Response:
+    return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+
+def if_range_matches(
+    request: Request, etag: str, last_modified: Optional[datetime]
+) -> bool:
+    """
+    Whether a Range header may be honoured: without If-Range, or when
+    If-Range still matches the current representation.
+    """
+    if_range = request.headers.get("if-range")
+    if not if_range:
+        return True
+    if if_range.startswith('"'):
+        # If-Range requires strong comparison
+        return if_range == etag
+    if last_modified is None:
+        return False
+    try:
+        since = parsedate_to_datetime(if_range)
+    except (TypeError, ValueError):
+        return False
+    if since.tzinfo is None:
+        since = since.replace(tzinfo=timezone.utc)
+    modified = last_modified.replace(tzinfo=timezone.utc, microsecond=0)
+    return modified == since
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """
+    Parse a single byte range into inclusive (first, last) offsets.
+    Returns None when there is no usable Range header (including
+    multi-range requests, which are answered with the full body), and
+    raises ValueError when the range cannot be satisfied.
+    """
+    if not header or not header.startswith("bytes="):
+        return None
+    spec = header[len("bytes=") :].strip()
+    if "," in spec or "-" not in spec:
+        return None
+
+    first, _, last = spec.partition("-")
+    try:
+        start = int(first) if first else None
+        end = int(last) if last else None
+    except ValueError:
+        return None
+    if end is not None and end < 0:
+        return None
+
+    if start is None:
+        # Suffix range: the final N bytes
+        if end is None:
+            return None
+        if end == 0 or size == 0:
+            raise ValueError("Unsatisfiable range")
+        return max(size - end, 0), size - 1
+
+    if end is not None and end < start:
+        return None
+    if start >= size:
+        raise ValueError("Unsatisfiable range")
+    return start, size - 1 if end is None else min(end, size - 1)
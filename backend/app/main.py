@@ -1,12 +1,27 @@
 import logging
 from contextlib import asynccontextmanager
 
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
 
+from app.auth import ANONYMOUS_TOKEN_HEADER
+from app.cache import shared_note_cache
 from app.config import settings
-from app.database import engine, mongo_db
+from app.database import (
+    PRIMARY_PIN_COOKIE,
+    READ_ONLY_REQUEST,
+    READ_REPLICAS_ENABLED,
+    engine,
+    log_pool_settings,
+    mongo_db,
+    replica_engines,
+)
+from app.http_cache import EncodedETagMiddleware
+from app.note_purge import note_purger
+from app.pagination import NEXT_CURSOR_HEADER
 from app.routes import notes, subscription, websocket
+from app.stripe_client import close_stripe_client
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -20,11 +35,20 @@ async def lifespan(app: FastAPI):
     """
     # Startup
     logger.info("Starting application...")
+    log_pool_settings()
+    if settings.ANONYMOUS_LEGACY_IDS:
+        logger.warning(
+            "ANONYMOUS_LEGACY_IDS is enabled: unsigned anonymous user ids "
+            "are accepted. It is deprecated and removed in 1.2"
+        )
 
     # Connect to MongoDB
     await mongo_db.connect()
     logger.info("Connected to MongoDB")
 
+    # Purge content of deleted notes in the background
+    note_purger.start()
+
     # Note: Database migrations are handled by Alembic in entrypoint.sh
     logger.info("Database ready (migrations run via Alembic)")
 
@@ -32,8 +56,14 @@ async def lifespan(app: FastAPI):
 
     # Shutdown
     logger.info("Shutting down application...")
+    await websocket.manager.flush_all()
+    await note_purger.stop()
     await mongo_db.disconnect()
     await engine.dispose()
+    for replica in replica_engines:
+        await replica.dispose()
+    await close_stripe_client()
+    await shared_note_cache.close()
     logger.info("Disconnected from databases")
 
 
@@ -44,6 +74,11 @@ app = FastAPI(
     lifespan=lifespan,
 )
 
+# Compress large responses for clients that accept it, with an ETag of
+# their own
+app.add_middleware(GZipMiddleware, minimum_size=settings.GZIP_MINIMUM_SIZE)
+app.add_middleware(EncodedETagMiddleware)
+
 # Configure CORS
 app.add_middleware(
     CORSMiddleware,
@@ -51,8 +86,39 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[
+        ANONYMOUS_TOKEN_HEADER,
+        NEXT_CURSOR_HEADER,
+        "Content-Range",
+        "ETag",
+    ],
 )
 
+
+@app.middleware("http")
+async def pin_writers_to_primary(request: Request, call_next):
+    """
+    After a successful write, have the client read from the primaries for
+    READ_YOUR_WRITES_SECONDS, so replica lag never hides its own changes.
+    POSTs declared read-only (read_only_request) are not writes.
+    """
+    response = await call_next(request)
+    if (
+        READ_REPLICAS_ENABLED
+        and request.method not in ("GET", "HEAD", "OPTIONS")
+        and not getattr(request.state, READ_ONLY_REQUEST, False)
+        and response.status_code < 400
+    ):
+        response.set_cookie(
+            key=PRIMARY_PIN_COOKIE,
+            value="1",
+            max_age=settings.READ_YOUR_WRITES_SECONDS,
+            httponly=True,
+            samesite="lax",
+        )
+    return response
+
+
 # Include routers
 app.include_router(notes.router)
 app.include_router(websocket.router)
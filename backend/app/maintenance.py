@@ -0,0 +1,853 @@
+"""
+Maintenance jobs, run as ``python -m app.maintenance <command>``.
+"""
+
+import argparse
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Tuple
+from uuid import UUID
+
+from bson.objectid import ObjectId
+from pymongo import UpdateOne
+from sqlalchemy import (
+    Integer,
+    String,
+    column,
+    delete,
+    func,
+    select,
+    tuple_,
+    update,
+    values,
+)
+from sqlalchemy.dialects.postgresql import UUID as PG_UUID
+
+from app.config import settings
+from app.content_blocks import (
+    collect_released_blocks,
+    release_blocks,
+    store_content,
+)
+from app.content_codec import CODEC_BLOCKS, content_update, decode_content
+from app.content_store import (
+    ContentRef,
+    content_store,
+    create_content_store,
+    migrate_note,
+)
+from app.database import AsyncSessionLocal, mongo_db
+from app.models import (
+    Note,
+    NoteDeletion,
+    NoteTombstone,
+    Subscription,
+    User,
+)
+from app.note_purge import delete_notes_query, purge_deleted_notes
+from app.note_stats import content_stats
+from app.search import index_notes, plain_text
+
+logger = logging.getLogger(__name__)
+
+
+async def reconcile_note_counts(batch_size: int = 1000) -> int:
+    """
+    Repair drift between users.note_count and the actual number of owned
+    notes. Walks users in primary-key batches, committing after each one so
+    no long-running lock is held. Returns the number of users corrected.
+
+    Each batch's user rows are locked before notes are counted. Note
+    inserts and deletes update their owner's row in the same transaction,
+    so once the lock is held none of them is in flight for these users,
+    and the count (taken by a later statement, with a fresh snapshot) can
+    not overwrite a concurrent increment or decrement.
+    """
+    fixed = 0
+    last_id = None
+
+    async with AsyncSessionLocal() as db:
+        while True:
+            query = (
+                select(User.id)
+                .order_by(User.id)
+                .limit(batch_size)
+                .with_for_update()
+            )
+            if last_id is not None:
+                query = query.where(User.id > last_id)
+            result = await db.execute(query)
+            user_ids = result.scalars().all()
+            if not user_ids:
+                break
+
+            actual = (
+                select(func.count(Note.id))
+                .where(Note.owner_id == User.id)
+                .scalar_subquery()
+            )
+            result = await db.execute(
+                update(User)
+                .where(User.id.in_(user_ids), User.note_count != actual)
+                .values(note_count=actual)
+                .execution_options(synchronize_session=False)
+            )
+            await db.commit()
+
+            fixed += result.rowcount
+            last_id = user_ids[-1]
+
+    logger.info(f"Reconciled note counts: {fixed} users corrected")
+    return fixed
+
+
+async def backfill_content_note_ids(batch_size: int = 1000) -> int:
+    """
+    Store note_id on content documents created before it was written at
+    note creation, so reads can fetch content without the Postgres row.
+    Returns the number of documents updated.
+    """
+    await mongo_db.connect()
+    updated = 0
+    last_id = None
+
+    try:
+        async with AsyncSessionLocal() as db:
+            while True:
+                query = (
+                    select(Note.id, Note.mongodb_content_id)
+                    .order_by(Note.id)
+                    .limit(batch_size)
+                )
+                if last_id is not None:
+                    query = query.where(Note.id > last_id)
+                result = await db.execute(query)
+                rows = result.all()
+                if not rows:
+                    break
+
+                bulk = await mongo_db.db.note_contents.bulk_write(
+                    [
+                        UpdateOne(
+                            {
+                                "_id": ObjectId(content_id),
+                                "note_id": {"$exists": False},
+                            },
+                            {"$set": {"note_id": str(note_id)}},
+                        )
+                        for note_id, content_id in rows
+                    ],
+                    ordered=False,
+                )
+                updated += bulk.modified_count
+                last_id = rows[-1][0]
+    finally:
+        await mongo_db.disconnect()
+
+    logger.info(f"Backfilled note_id on {updated} content documents")
+    return updated
+
+
+async def compress_content(batch_size: int = 500) -> int:
+    """
+    Rewrite plain content documents above CONTENT_COMPRESSION_THRESHOLD
+    bytes in compressed form. A document modified since it was read is
+    skipped. Returns the number of documents compressed.
+    """
+    await mongo_db.connect()
+    compressed = 0
+
+    async def flush(batch: list) -> int:
+        if not batch:
+            return 0
+        result = await mongo_db.db.note_contents.bulk_write(
+            batch, ordered=False
+        )
+        return result.modified_count
+
+    try:
+        cursor = mongo_db.db.note_contents.find(
+            {
+                "codec": {"$exists": False},
+                "content": {"$type": "string"},
+                "$expr": {
+                    "$gte": [
+                        {"$strLenBytes": "$content"},
+                        settings.CONTENT_COMPRESSION_THRESHOLD,
+                    ]
+                },
+            },
+            {"content": 1, "updated_at": 1},
+        ).batch_size(batch_size)
+
+        batch = []
+        async for doc in cursor:
+            batch.append(
+                UpdateOne(
+                    {"_id": doc["_id"], "updated_at": doc.get("updated_at")},
+                    content_update(doc["content"]),
+                )
+            )
+            if len(batch) >= batch_size:
+                compressed += await flush(batch)
+                batch = []
+        compressed += await flush(batch)
+    finally:
+        await mongo_db.disconnect()
+
+    logger.info(f"Compressed {compressed} content documents")
+    return compressed
+
+
+async def block_content(batch_size: int = 100) -> int:
+    """
+    Move content documents of CONTENT_BLOCK_THRESHOLD bytes or more into
+    block storage. A document modified since it was read is left as it is
+    (its next save stores it in blocks). Returns the number of documents
+    converted.
+    """
+    await mongo_db.connect()
+    converted = 0
+
+    try:
+        cursor = mongo_db.db.note_contents.find(
+            {
+                "codec": {"$ne": CODEC_BLOCKS},
+                "size": {"$gte": settings.CONTENT_BLOCK_THRESHOLD},
+            },
+            {"operations": 0},
+        ).batch_size(batch_size)
+
+        async for doc in cursor:
+            update = await store_content(
+                mongo_db.db, str(doc["_id"]), decode_content(doc)
+            )
+            result = await mongo_db.db.note_contents.update_one(
+                {"_id": doc["_id"], "updated_at": doc.get("updated_at")},
+                update,
+            )
+            if result.modified_count:
+                converted += 1
+            else:
+                # Release the blocks written here, unless a concurrent save
+                # stored the same ones
+                current = await mongo_db.db.note_contents.find_one(
+                    {"_id": doc["_id"]}, {"blocks": 1}
+                )
+                await release_blocks(
+                    mongo_db.db,
+                    {"_id": doc["_id"], **update["$set"]},
+                    {"$set": current or {}},
+                )
+    finally:
+        await mongo_db.disconnect()
+
+    logger.info(f"Moved {converted} content documents to block storage")
+    return converted
+
+
+async def collect_content_blocks(
+    grace_minutes: int = settings.CONTENT_BLOCK_GRACE_SECONDS // 60,
+) -> int:
+    """
+    Delete content blocks that saves released more than grace_minutes ago
+    and that are still unreferenced. Returns the number deleted.
+    """
+    await mongo_db.connect()
+    try:
+        deleted = await collect_released_blocks(
+            mongo_db.db, grace_seconds=grace_minutes * 60
+        )
+    finally:
+        await mongo_db.disconnect()
+    logger.info(f"Deleted {deleted} released content blocks")
+    return deleted
+
+
+async def _note_content_batches(db, batch_size: int, *criteria):
+    """
+    Yield notes in primary-key batches as (id, title, note_type, content)
+    rows, with content read from the content store in one call per batch.
+    """
+    last_id = None
+    while True:
+        query = (
+            select(
+                Note.id, Note.title, Note.note_type, Note.mongodb_content_id
+            )
+            .where(*criteria)
+            .order_by(Note.id)
+            .limit(batch_size)
+        )
+        if last_id is not None:
+            query = query.where(Note.id > last_id)
+        result = await db.execute(query)
+        rows = result.all()
+        if not rows:
+            return
+
+        contents = await content_store.get_many(
+            db,
+            [
+                ContentRef(note_id, content_id)
+                for note_id, _, _, content_id in rows
+            ],
+        )
+
+        yield [
+            (note_id, title, note_type, contents.get(note_id, ""))
+            for note_id, title, note_type, _ in rows
+        ]
+        last_id = rows[-1][0]
+
+
+async def reindex_search(batch_size: int = 500, missing_only: bool = False):
+    """
+    Rebuild notes.search_vector from titles and MongoDB content, walking
+    notes in primary-key batches. Returns the number of notes indexed.
+    """
+    await mongo_db.connect()
+    indexed = 0
+    criteria = [Note.search_vector.is_(None)] if missing_only else []
+
+    try:
+        async with AsyncSessionLocal() as db:
+            async for batch in _note_content_batches(
+                db, batch_size, *criteria
+            ):
+                await index_notes(
+                    db,
+                    [
+                        (note_id, title, plain_text(content, note_type))
+                        for note_id, title, note_type, content in batch
+                    ],
+                )
+                await db.commit()
+                indexed += len(batch)
+    finally:
+        await mongo_db.disconnect()
+
+    logger.info(f"Indexed {indexed} notes for search")
+    return indexed
+
+
+async def refresh_note_stats(
+    batch_size: int = 500, missing_only: bool = False
+) -> int:
+    """
+    Recompute the content preview, counts and hash stored on notes from
+    MongoDB content. Returns the number of notes refreshed.
+    """
+    await mongo_db.connect()
+    refreshed = 0
+    criteria = [Note.content_hash.is_(None)] if missing_only else []
+
+    try:
+        async with AsyncSessionLocal() as db:
+            async for batch in _note_content_batches(
+                db, batch_size, *criteria
+            ):
+                data = values(
+                    column("id", PG_UUID(as_uuid=True)),
+                    column("content_preview", String),
+                    column("char_count", Integer),
+                    column("line_count", Integer),
+                    column("word_count", Integer),
+                    column("content_hash", String),
+                    name="stats",
+                ).data(
+                    [
+                        (note_id, *content_stats(content, note_type).values())
+                        for note_id, _, note_type, content in batch
+                    ]
+                )
+                await db.execute(
+                    update(Note)
+                    .where(Note.id == data.c.id)
+                    .values(
+                        content_preview=data.c.content_preview,
+                        char_count=data.c.char_count,
+                        line_count=data.c.line_count,
+                        word_count=data.c.word_count,
+                        content_hash=data.c.content_hash,
+                        updated_at=Note.updated_at,
+                    )
+                    .execution_options(synchronize_session=False)
+                )
+                await db.commit()
+                refreshed += len(batch)
+    finally:
+        await mongo_db.disconnect()
+
+    logger.info(f"Refreshed content stats on {refreshed} notes")
+    return refreshed
+
+
+async def prune_tombstones(batch_size: int = 5000) -> int:
+    """
+    Delete change-feed tombstones older than SYNC_TOKEN_MAX_AGE_DAYS (sync
+    tokens that old are rejected anyway), in batches. Returns the number
+    of tombstones deleted.
+    """
+    cutoff = datetime.utcnow() - timedelta(
+        days=settings.SYNC_TOKEN_MAX_AGE_DAYS
+    )
+    pruned = 0
+
+    async with AsyncSessionLocal() as db:
+        while True:
+            expired = (
+                select(NoteTombstone.user_id, NoteTombstone.note_id)
+                .where(NoteTombstone.deleted_at < cutoff)
+                .limit(batch_size)
+            )
+            result = await db.execute(
+                delete(NoteTombstone).where(
+                    tuple_(NoteTombstone.user_id, NoteTombstone.note_id).in_(
+                        expired
+                    )
+                )
+            )
+            await db.commit()
+            pruned += result.rowcount
+            if result.rowcount < batch_size:
+                break
+
+    logger.info(f"Pruned {pruned} note tombstones")
+    return pruned
+
+
+async def reconcile_content(
+    batch_size: int = 1000, min_age_minutes: int = 60, dry_run: bool = False
+) -> Tuple[int, int]:
+    """
+    Sweep for content and notes that lost each other. MongoDB content
+    documents that no note references and that are not queued for purging
+    are deleted with their blocks and history, once older than
+    min_age_minutes (younger ones may belong to a create in flight).
+    Notes whose content is missing from the content store are logged; they
+    cannot be repaired. Returns (orphaned documents, notes without content).
+    """
+    cutoff = datetime.utcnow() - timedelta(minutes=min_age_minutes)
+    mongo_store = create_content_store("mongo")
+    await mongo_db.connect()
+    orphaned = missing = 0
+
+    try:
+        async with AsyncSessionLocal() as db:
+            last_id = None
+            while True:
+                query = {} if last_id is None else {"_id": {"$gt": last_id}}
+                cursor = (
+                    mongo_db.db.note_contents.find(query, {"note_id": 1})
+                    .sort("_id", 1)
+                    .limit(batch_size)
+                )
+                docs = await cursor.to_list(length=batch_size)
+                if not docs:
+                    break
+                last_id = docs[-1]["_id"]
+
+                content_ids = [str(doc["_id"]) for doc in docs]
+                result = await db.execute(
+                    select(Note.mongodb_content_id)
+                    .where(Note.mongodb_content_id.in_(content_ids))
+                    .union_all(
+                        select(NoteDeletion.mongodb_content_id).where(
+                            NoteDeletion.mongodb_content_id.in_(content_ids)
+                        )
+                    )
+                )
+                referenced = set(result.scalars())
+                await db.rollback()
+
+                orphans = [
+                    ContentRef(
+                        UUID(doc["note_id"]) if doc.get("note_id") else None,
+                        str(doc["_id"]),
+                    )
+                    for doc in docs
+                    if str(doc["_id"]) not in referenced
+                    and doc["_id"].generation_time.replace(tzinfo=None)
+                    < cutoff
+                ]
+                orphaned += len(orphans)
+                if orphans and not dry_run:
+                    await mongo_store.delete_many(db, orphans)
+
+            last_note_id = None
+            while True:
+                query = (
+                    select(Note.id, Note.mongodb_content_id)
+                    .order_by(Note.id)
+                    .limit(batch_size)
+                )
+                if last_note_id is not None:
+                    query = query.where(Note.id > last_note_id)
+                result = await db.execute(query)
+                refs = [ContentRef(*row) for row in result.all()]
+                if not refs:
+                    break
+                last_note_id = refs[-1].note_id
+
+                present = await content_store.existing(db, refs)
+                for ref in refs:
+                    if ref.note_id not in present:
+                        missing += 1
+                        logger.warning(f"Note {ref.note_id} has no content")
+                await db.rollback()
+    finally:
+        await mongo_db.disconnect()
+
+    action = "Found" if dry_run else "Deleted"
+    logger.info(
+        f"{action} {orphaned} orphaned content documents; "
+        f"{missing} notes have no content"
+    )
+    return orphaned, missing
+
+
+async def purge_notes(batch_size: int = 500) -> int:
+    """Drain the deleted-note purge queue (normally done by the app)."""
+    await mongo_db.connect()
+    try:
+        purged = await purge_deleted_notes(batch_size=batch_size)
+    finally:
+        await mongo_db.disconnect()
+    logger.info(f"Purged content of {purged} deleted notes")
+    return purged
+
+
+async def collect_anonymous_users(
+    batch_size: int = 500,
+    retention_days: int = settings.ANONYMOUS_USER_RETENTION_DAYS,
+    dry_run: bool = False,
+) -> Tuple[int, int]:
+    """
+    Delete anonymous users inactive for retention_days, with their notes:
+    no session renewal (last_seen_at) and no note update since. Users who
+    paid or subscribed are kept. Each batch of users is locked with SKIP
+    LOCKED and deleted in one short transaction; the notes' content is
+    queued and purged at the end, as for any other delete. Returns
+    (users, notes) deleted, or that would be with dry_run.
+    """
+    min_days = settings.ANONYMOUS_TOKEN_MAX_AGE / (24 * 60 * 60)
+    if retention_days < min_days:
+        # Sessions last this long without any write, so users seen more
+        # recently may still come back
+        logger.warning(
+            f"Retention of {retention_days} days is shorter than the "
+            f"anonymous session lifetime; using {min_days:g} days"
+        )
+        retention_days = min_days
+    cutoff = datetime.utcnow() - timedelta(days=retention_days)
+
+    active_notes = select(Note.id).where(
+        Note.owner_id == User.id, Note.updated_at >= cutoff
+    )
+    subscriptions = select(Subscription.id).where(
+        Subscription.user_id == User.id
+    )
+    stale = (
+        select(User.id)
+        .where(
+            User.is_anonymous.is_(True),
+            User.is_premium.is_not(True),
+            User.stripe_customer_id.is_(None),
+            User.last_seen_at < cutoff,
+            ~active_notes.exists(),
+            ~subscriptions.exists(),
+        )
+        .order_by(User.id)
+        .limit(batch_size)
+        .with_for_update(of=User, skip_locked=True)
+    )
+
+    users = notes = chars = 0
+    async with AsyncSessionLocal() as db:
+        last_id = None
+        while True:
+            query = stale
+            if last_id is not None:
+                query = query.where(User.id > last_id)
+            result = await db.execute(query)
+            user_ids = result.scalars().all()
+            if not user_ids:
+                await db.rollback()
+                break
+            last_id = user_ids[-1]
+            owned = Note.owner_id.in_(user_ids)
+
+            if dry_run:
+                result = await db.execute(
+                    select(
+                        func.count(),
+                        func.coalesce(func.sum(Note.char_count), 0),
+                    ).where(owned)
+                )
+                count, size = result.one()
+                await db.rollback()
+                users += len(user_ids)
+                notes += count
+                chars += size
+                continue
+
+            result = await db.execute(delete_notes_query(owned))
+            notes += len(result.all())
+            # Deleting the notes wrote change-feed tombstones for their
+            # owners, who are about to go too
+            await db.execute(
+                delete(NoteTombstone).where(
+                    NoteTombstone.user_id.in_(user_ids)
+                )
+            )
+            await db.execute(delete(User).where(User.id.in_(user_ids)))
+            await db.commit()
+            users += len(user_ids)
+            logger.info(f"Deleted {users} anonymous users so far")
+
+    if dry_run:
+        logger.info(
+            f"Would delete {users} anonymous users inactive for "
+            f"{retention_days:g} days, with {notes} notes "
+            f"({chars} characters)"
+        )
+        return users, notes
+
+    if notes:
+        await mongo_db.connect()
+        try:
+            await purge_deleted_notes()
+        finally:
+            await mongo_db.disconnect()
+    logger.info(
+        f"Deleted {users} anonymous users inactive for {retention_days:g} "
+        f"days, with {notes} notes"
+    )
+    return users, notes
+
+
+async def migrate_content(
+    source_name: str, target_name: str, batch_size: int = 200
+) -> int:
+    """
+    Copy note content and version history from one content store backend
+    to another, skipping notes the target already has, so it can be rerun
+    and can run while the app serves with CONTENT_STORE=target and
+    CONTENT_STORE_FALLBACK=source. Returns the number of notes copied.
+    """
+    source = create_content_store(source_name)
+    target = create_content_store(target_name)
+    await mongo_db.connect()
+    copied = 0
+    try:
+        async with AsyncSessionLocal() as db:
+            last_id = None
+            while True:
+                query = (
+                    select(Note.id, Note.mongodb_content_id)
+                    .order_by(Note.id)
+                    .limit(batch_size)
+                )
+                if last_id is not None:
+                    query = query.where(Note.id > last_id)
+                result = await db.execute(query)
+                refs = [ContentRef(*row) for row in result.all()]
+                if not refs:
+                    break
+                last_id = refs[-1].note_id
+
+                present = await target.existing(db, refs)
+                now = datetime.utcnow()
+                for ref in refs:
+                    if ref.note_id in present:
+                        continue
+                    if await migrate_note(source, target, db, ref, now):
+                        copied += 1
+                    else:
+                        logger.warning(f"No content for note {ref.note_id}")
+                await db.commit()
+                logger.info(f"Copied {copied} notes so far")
+    finally:
+        await mongo_db.disconnect()
+
+    logger.info(f"Copied {copied} notes from {source_name} to {target_name}")
+    return copied
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+
+    parser = argparse.ArgumentParser(description="SyncPad maintenance jobs")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    reconcile = commands.add_parser(
+        "reconcile-note-counts",
+        help="Repair users.note_count drift",
+    )
+    reconcile.add_argument("--batch-size", type=int, default=1000)
+
+    backfill = commands.add_parser(
+        "backfill-content-note-ids",
+        help="Store note_id on legacy MongoDB content documents",
+    )
+    backfill.add_argument("--batch-size", type=int, default=1000)
+
+    compress = commands.add_parser(
+        "compress-content",
+        help="Compress large plain MongoDB content documents",
+    )
+    compress.add_argument("--batch-size", type=int, default=500)
+
+    blocks = commands.add_parser(
+        "block-content",
+        help="Move very large content documents to block storage",
+    )
+    blocks.add_argument("--batch-size", type=int, default=100)
+
+    collect = commands.add_parser(
+        "collect-content-blocks",
+        help="Delete content blocks released by saves",
+    )
+    collect.add_argument(
+        "--grace-minutes",
+        type=int,
+        default=settings.CONTENT_BLOCK_GRACE_SECONDS // 60,
+        help="Keep blocks released more recently than this",
+    )
+
+    reindex = commands.add_parser(
+        "reindex-search",
+        help="Rebuild full-text search vectors from note content",
+    )
+    reindex.add_argument("--batch-size", type=int, default=500)
+    reindex.add_argument(
+        "--missing-only",
+        action="store_true",
+        help="Only index notes that have no search vector yet",
+    )
+
+    stats = commands.add_parser(
+        "refresh-note-stats",
+        help="Recompute content previews and stats stored on notes",
+    )
+    stats.add_argument("--batch-size", type=int, default=500)
+    stats.add_argument(
+        "--missing-only",
+        action="store_true",
+        help="Only refresh notes that have no content hash yet",
+    )
+
+    prune = commands.add_parser(
+        "prune-tombstones",
+        help="Delete expired change-feed tombstones",
+    )
+    prune.add_argument("--batch-size", type=int, default=5000)
+
+    purge = commands.add_parser(
+        "purge-deleted-notes",
+        help="Purge the content of deleted notes still queued",
+    )
+    purge.add_argument("--batch-size", type=int, default=500)
+
+    sweep = commands.add_parser(
+        "reconcile-content",
+        help="Delete content without a note and report notes without content",
+    )
+    sweep.add_argument("--batch-size", type=int, default=1000)
+    sweep.add_argument(
+        "--min-age-minutes",
+        type=int,
+        default=60,
+        help="Leave orphaned documents younger than this",
+    )
+    sweep.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="Only report what would be deleted",
+    )
+
+    gc = commands.add_parser(
+        "gc-anonymous-users",
+        help="Delete long-inactive anonymous users and their notes",
+    )
+    gc.add_argument("--batch-size", type=int, default=500)
+    gc.add_argument(
+        "--retention-days",
+        type=int,
+        default=settings.ANONYMOUS_USER_RETENTION_DAYS,
+        help="Keep anonymous users active within this many days",
+    )
+    gc.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="Only report what would be deleted",
+    )
+
+    migrate = commands.add_parser(
+        "migrate-content",
+        help="Copy note content from one content store backend to another",
+    )
+    migrate.add_argument(
+        "--from", dest="source", required=True, choices=("mongo", "postgres")
+    )
+    migrate.add_argument(
+        "--to", dest="target", required=True, choices=("mongo", "postgres")
+    )
+    migrate.add_argument("--batch-size", type=int, default=200)
+
+    args = parser.parse_args()
+
+    if args.command == "reconcile-note-counts":
+        asyncio.run(reconcile_note_counts(batch_size=args.batch_size))
+    elif args.command == "backfill-content-note-ids":
+        asyncio.run(backfill_content_note_ids(batch_size=args.batch_size))
+    elif args.command == "compress-content":
+        asyncio.run(compress_content(batch_size=args.batch_size))
+    elif args.command == "block-content":
+        asyncio.run(block_content(batch_size=args.batch_size))
+    elif args.command == "collect-content-blocks":
+        asyncio.run(collect_content_blocks(grace_minutes=args.grace_minutes))
+    elif args.command == "reindex-search":
+        asyncio.run(
+            reindex_search(
+                batch_size=args.batch_size, missing_only=args.missing_only
+            )
+        )
+    elif args.command == "refresh-note-stats":
+        asyncio.run(
+            refresh_note_stats(
+                batch_size=args.batch_size, missing_only=args.missing_only
+            )
+        )
+    elif args.command == "prune-tombstones":
+        asyncio.run(prune_tombstones(batch_size=args.batch_size))
+    elif args.command == "purge-deleted-notes":
+        asyncio.run(purge_notes(batch_size=args.batch_size))
+    elif args.command == "reconcile-content":
+        asyncio.run(
+            reconcile_content(
+                batch_size=args.batch_size,
+                min_age_minutes=args.min_age_minutes,
+                dry_run=args.dry_run,
+            )
+        )
+    elif args.command == "gc-anonymous-users":
+        asyncio.run(
+            collect_anonymous_users(
+                batch_size=args.batch_size,
+                retention_days=args.retention_days,
+                dry_run=args.dry_run,
+            )
+        )
+    elif args.command == "migrate-content":
+        asyncio.run(
+            migrate_content(
+                args.source, args.target, batch_size=args.batch_size
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
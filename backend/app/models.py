@@ -2,11 +2,11 @@ import enum
 import uuid
 from datetime import datetime
 
-from sqlalchemy import Boolean, Column, DateTime
+from sqlalchemy import BigInteger, Boolean, Column, DateTime
 from sqlalchemy import Enum as SQLEnum
-from sqlalchemy import ForeignKey, String
-from sqlalchemy.dialects.postgresql import UUID
-from sqlalchemy.orm import relationship
+from sqlalchemy import ForeignKey, Index, Integer, String, Text, func
+from sqlalchemy.dialects.postgresql import JSONB, TSVECTOR, UUID
+from sqlalchemy.orm import deferred, relationship
 
 from app.database import Base
 
@@ -39,10 +39,20 @@ class User(Base):
     is_anonymous = Column(Boolean, default=False)
     is_premium = Column(Boolean, default=False)
     stripe_customer_id = Column(String, unique=True, nullable=True)
+    # Denormalized count of owned notes, maintained with note writes
+    note_count = Column(Integer, nullable=False, default=0, server_default="0")
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(
         DateTime, default=datetime.utcnow, onupdate=datetime.utcnow
     )
+    # Last anonymous session renewal (only tracked for anonymous users);
+    # with their note updates, marks them active for gc-anonymous-users
+    last_seen_at = Column(
+        DateTime,
+        nullable=False,
+        default=datetime.utcnow,
+        server_default=func.now(),
+    )
 
     # Relationships
     owned_notes = relationship(
@@ -77,11 +87,44 @@ class Note(Base):
     mongodb_content_id = Column(
         String, nullable=False
     )  # Reference to MongoDB document
+    # Bumped on every change to the note's representation (ETags)
+    revision = Column(Integer, nullable=False, default=1, server_default="1")
+    # Denormalized from the content for listings (see app.note_stats)
+    content_preview = Column(String, nullable=True)
+    char_count = Column(Integer, nullable=False, default=0, server_default="0")
+    line_count = Column(Integer, nullable=False, default=0, server_default="0")
+    word_count = Column(Integer, nullable=False, default=0, server_default="0")
+    content_hash = Column(String(64), nullable=True)
+    # Transaction id of the last insert or revision bump, set by a trigger
+    # (migration 010); drives GET /api/notes/changes
+    change_xid = Column(
+        BigInteger, nullable=False, default=0, server_default="0"
+    )
+    # Title and content text for full-text search (see app.search)
+    search_vector = deferred(Column(TSVECTOR, nullable=True))
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(
         DateTime, default=datetime.utcnow, onupdate=datetime.utcnow
     )
 
+    __table_args__ = (
+        # Keyset pagination of a user's notes by (updated_at, id)
+        Index(
+            "ix_notes_owner_id_updated_at_id",
+            owner_id,
+            updated_at.desc(),
+            id.desc(),
+        ),
+        Index(
+            "ix_notes_search_vector", "search_vector", postgresql_using="gin"
+        ),
+        # Change feeds: a user's own notes, and notes shared with them
+        Index("ix_notes_owner_id_change_xid_id", owner_id, change_xid, id),
+        Index("ix_notes_change_xid_id", change_xid, id),
+        # Orphaned content sweep (reconcile-content)
+        Index("ix_notes_mongodb_content_id", mongodb_content_id),
+    )
+
     # Relationships
     owner = relationship(
         "User", back_populates="owned_notes", foreign_keys=[owner_id]
@@ -110,11 +153,115 @@ class NotePermission(Base):
     )
     granted_at = Column(DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        Index("ix_note_permissions_note_id_user_id", note_id, user_id),
+        Index("ix_note_permissions_user_id", user_id),
+    )
+
     # Relationships
     note = relationship("Note", back_populates="permissions")
     user = relationship("User", back_populates="permissions")
 
 
+class NoteTombstone(Base):
+    """
+    Records that a note left a user's list (deleted, or access revoked),
+    written by triggers (migration 010) for the change feed.
+    """
+
+    __tablename__ = "note_tombstones"
+
+    user_id = Column(UUID(as_uuid=True), primary_key=True)
+    note_id = Column(UUID(as_uuid=True), primary_key=True)
+    change_xid = Column(BigInteger, nullable=False)
+    deleted_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index("ix_note_tombstones_user_id_change_xid", user_id, change_xid),
+        Index("ix_note_tombstones_deleted_at", deleted_at),
+    )
+
+
+class NoteDeletion(Base):
+    """
+    Queue of deleted notes whose content is still to be purged. Written in
+    the same statement that deletes the note, and drained in batches by
+    app.note_purge.
+    """
+
+    __tablename__ = "note_deletions"
+
+    note_id = Column(UUID(as_uuid=True), primary_key=True)
+    mongodb_content_id = Column(String, nullable=False)
+    deleted_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (Index("ix_note_deletions_deleted_at", deleted_at),)
+
+
+class NoteContent(Base):
+    """
+    Note content when CONTENT_STORE is "postgres" (see app.content_store),
+    mirroring the MongoDB note_contents documents.
+    """
+
+    __tablename__ = "note_contents"
+
+    note_id = Column(
+        UUID(as_uuid=True),
+        ForeignKey("notes.id", ondelete="CASCADE"),
+        primary_key=True,
+    )
+    content = Column(Text, nullable=False, default="")
+    # UTF-8 length of content
+    size = Column(Integer, nullable=False, default=0)
+    # Version history bookkeeping (see app.note_history)
+    revision = Column(Integer, nullable=True)
+    history_since = Column(Integer, nullable=True)
+    snapshot_revision = Column(
+        Integer, nullable=False, default=0, server_default="0"
+    )
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+
+class NoteVersion(Base):
+    """Version history entry of a note in the "postgres" content store."""
+
+    __tablename__ = "note_versions"
+
+    note_id = Column(
+        UUID(as_uuid=True),
+        ForeignKey("notes.id", ondelete="CASCADE"),
+        primary_key=True,
+    )
+    revision = Column(Integer, primary_key=True)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    user_id = Column(UUID(as_uuid=True), nullable=True)
+    size = Column(Integer, nullable=False)
+    ops = Column(JSONB, nullable=False)
+    snapshot = Column(
+        Boolean, nullable=False, default=False, server_default="false"
+    )
+    content = Column(Text, nullable=True)
+
+
+class NoteOperation(Base):
+    """Real-time edit operation log in the "postgres" content store."""
+
+    __tablename__ = "note_operations"
+
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    note_id = Column(
+        UUID(as_uuid=True),
+        ForeignKey("notes.id", ondelete="CASCADE"),
+        nullable=False,
+    )
+    operation = Column(JSONB, nullable=False)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (Index("ix_note_operations_note_id", note_id),)
+
+
 class Subscription(Base):
     __tablename__ = "subscriptions"
 
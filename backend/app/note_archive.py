@@ -0,0 +1,196 @@
+"""
+Serialization of notes for bulk export and import.
+
+Exports are NDJSON (one note per line) or a ZIP archive holding a
+metadata file and a content file per note. Both are produced entry by
+entry so an archive is never held in memory, and imports read either
+format back record by record.
+"""
+
+import io
+import json
+import posixpath
+import zipfile
+from typing import IO, AsyncIterator, Iterator, List, Optional, Tuple, Union
+
+from app.models import Note, NoteType
+
+# Extension of a note's content file in ZIP exports
+CONTENT_EXTENSIONS = {
+    NoteType.STANDARD: "html",
+    NoteType.CODE: "txt",
+}
+
+
+class ArchiveError(ValueError):
+    pass
+
+
+Record = Union[dict, ArchiveError]
+
+
+def note_record(note: Note, content: str) -> dict:
+    return {
+        "id": str(note.id),
+        "title": note.title,
+        "note_type": note.note_type.value,
+        "is_public": note.is_public,
+        "created_at": note.created_at.isoformat(),
+        "updated_at": note.updated_at.isoformat(),
+        "content": content,
+    }
+
+
+def ndjson_line(record: dict) -> bytes:
+    return (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
+
+
+class _WriteBuffer(io.RawIOBase):
+    """Unseekable sink that hands written bytes back on drain()."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+class ZipStream:
+    """
+    Write a ZIP archive incrementally. Each call returns the bytes
+    produced so far; since the sink is unseekable, zipfile writes sizes
+    in data descriptors instead of seeking back to the local headers.
+    """
+
+    def __init__(self):
+        self._buffer = _WriteBuffer()
+        self._zip = zipfile.ZipFile(
+            self._buffer, "w", compression=zipfile.ZIP_DEFLATED
+        )
+
+    def add(self, record: dict) -> bytes:
+        metadata = {k: v for k, v in record.items() if k != "content"}
+        extension = CONTENT_EXTENSIONS[NoteType(record["note_type"])]
+        name = f"notes/{record['id']}"
+        self._zip.writestr(f"{name}.json", json.dumps(metadata, indent=2))
+        self._zip.writestr(f"{name}.{extension}", record["content"])
+        return self._buffer.drain()
+
+    def close(self) -> bytes:
+        # Writes the central directory
+        self._zip.close()
+        return self._buffer.drain()
+
+
+async def iter_ndjson_records(
+    chunks: AsyncIterator[bytes], max_bytes: int
+) -> AsyncIterator[Tuple[str, Record]]:
+    """
+    Parse an NDJSON byte stream into (label, record) pairs, labelled by
+    line number. Blank lines are skipped; lines longer than max_bytes are
+    discarded without being buffered. A line is kept as the list of its
+    chunks and joined once, when its newline arrives.
+    """
+    parts: List[bytes] = []
+    size = 0
+    line_no = 0
+
+    def parse(line: bytes) -> Record:
+        try:
+            record = json.loads(line)
+        except ValueError:
+            return ArchiveError("Invalid JSON")
+        if not isinstance(record, dict):
+            return ArchiveError("Record must be a JSON object")
+        return record
+
+    def complete() -> Optional[Record]:
+        if size > max_bytes:
+            return ArchiveError("Record is too large")
+        line = b"".join(parts)
+        return parse(line) if line.strip() else None
+
+    async for chunk in chunks:
+        start = 0
+        while True:
+            end = chunk.find(b"\n", start)
+            piece = chunk[start:] if end < 0 else chunk[start:end]
+            size += len(piece)
+            if size <= max_bytes:
+                parts.append(piece)
+            else:
+                # Keep counting, but stop buffering, an oversized line
+                parts.clear()
+            if end < 0:
+                break
+
+            line_no += 1
+            record = complete()
+            if record is not None:
+                yield str(line_no), record
+            parts.clear()
+            size = 0
+            start = end + 1
+
+    record = complete()
+    if record is not None:
+        yield str(line_no + 1), record
+
+
+def iter_zip_records(
+    file: IO[bytes], max_bytes: int
+) -> Iterator[Tuple[str, Record]]:
+    """
+    Read (label, record) pairs from a ZIP export, labelled by metadata
+    file name. Content is read from the sibling content file, or from a
+    "content" key in the metadata.
+    """
+    try:
+        archive = zipfile.ZipFile(file)
+    except zipfile.BadZipFile:
+        yield "archive", ArchiveError("Invalid ZIP archive")
+        return
+
+    with archive:
+        entries = {info.filename: info for info in archive.infolist()}
+
+        def read(info: zipfile.ZipInfo) -> str:
+            if info.file_size > max_bytes:
+                raise ArchiveError("Record is too large")
+            try:
+                return archive.read(info).decode("utf-8")
+            except UnicodeDecodeError:
+                raise ArchiveError(f"{info.filename} is not UTF-8")
+            except (zipfile.BadZipFile, zipfile.LargeZipFile) as e:
+                raise ArchiveError(f"{info.filename}: {e}")
+
+        for name, info in entries.items():
+            if info.is_dir() or posixpath.splitext(name)[1] != ".json":
+                continue
+            try:
+                record = json.loads(read(info))
+                if not isinstance(record, dict):
+                    raise ArchiveError("Record must be a JSON object")
+                if "content" not in record:
+                    stem = posixpath.splitext(name)[0]
+                    for extension in CONTENT_EXTENSIONS.values():
+                        content = entries.get(f"{stem}.{extension}")
+                        if content is not None:
+                            record["content"] = read(content)
+                            break
+            except ArchiveError as e:
+                yield name, e
+                continue
+            except ValueError:
+                yield name, ArchiveError("Invalid JSON")
+                continue
+            yield name, record
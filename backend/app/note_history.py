@@ -0,0 +1,176 @@
+"""
+Content version history for notes.
+
+Every content save records a version in the content store's history,
+keyed by (note_id, revision). An entry holds a reverse delta: positional
+edits, in the same vocabulary as PATCH and WebSocket edits, that turn the
+revision's content back into the content it replaced. Every
+HISTORY_SNAPSHOT_INTERVAL revisions a version also stores the full
+content. An earlier revision is rebuilt from the nearest snapshot at or
+above it (or the current content) by applying only the deltas in
+between, so a historical read never replays more than
+HISTORY_SNAPSHOT_INTERVAL deltas however long a note's history grows.
+
+Content records track the last content revision in ``revision``, the
+latest snapshot in ``snapshot_revision`` and the oldest revision history
+can rebuild in ``history_since``. Notes created before history was
+recorded gain history from their next save.
+"""
+
+from datetime import datetime
+from typing import List, Optional
+from uuid import UUID
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.content_patch import apply_edits
+from app.content_store import ContentRecord, ContentRef, content_store
+from app.schemas import ContentEdit
+
+
+def _common_prefix(a: str, b: str) -> int:
+    """Length of the common prefix, by bisection over slice comparisons."""
+    lo, hi = 0, min(len(a), len(b))
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if a[:mid] == b[:mid]:
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+
+def _common_suffix(a: str, b: str, limit: int) -> int:
+    lo, hi = 0, min(len(a), len(b), limit)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if a[len(a) - mid :] == b[len(b) - mid :]:
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+
+def reverse_delta(old: str, new: str) -> List[dict]:
+    """
+    Edits turning new back into old: a single replace of the span between
+    their common prefix and suffix (none if they are equal).
+    """
+    prefix = _common_prefix(old, new)
+    suffix = _common_suffix(old, new, min(len(old), len(new)) - prefix)
+    replaced = old[prefix : len(old) - suffix]
+    length = len(new) - prefix - suffix
+    if not replaced and not length:
+        return []
+    return [
+        {
+            "operation": "replace",
+            "position": prefix,
+            "length": length,
+            "content": replaced,
+        }
+    ]
+
+
+async def save_content(
+    db: AsyncSession,
+    ref: ContentRef,
+    revision: int,
+    content: str,
+    now: datetime,
+    user_id: Optional[UUID] = None,
+    previous: Optional[ContentRecord] = None,
+):
+    """
+    Replace a note's content with its content at revision, recording the
+    change in the note's history. previous is the current content record,
+    when the caller has already read it; otherwise it comes back from the
+    update itself.
+    """
+    previous = await content_store.replace(
+        db, ref, content, revision, now, previous
+    )
+    if previous is None:
+        return
+
+    version = {
+        "revision": revision,
+        "created_at": now,
+        "user_id": str(user_id) if user_id else None,
+        "size": len(content.encode("utf-8")),
+        "ops": reverse_delta(previous.content, content),
+        "snapshot": False,
+    }
+    fields = {}
+    if previous.history_since is None:
+        # History starts with the content this save replaced
+        fields["history_since"] = revision - 1
+    if (
+        revision - previous.snapshot_revision
+        >= settings.HISTORY_SNAPSHOT_INTERVAL
+    ):
+        version.update(snapshot=True, content=content)
+        fields["snapshot_revision"] = revision
+
+    await content_store.add_version(db, ref, version)
+    if fields:
+        await content_store.set_history_fields(db, ref, **fields)
+
+
+async def content_at(
+    db: AsyncSession,
+    ref: ContentRef,
+    current: ContentRecord,
+    note_revision: int,
+    revision: int,
+) -> Optional[str]:
+    """
+    Content of a note at revision, given its current content record and
+    revision, or None when history does not reach that revision.
+    """
+    if revision > note_revision:
+        return None
+    latest = current.revision
+    if latest is None:
+        # Not saved since history was introduced
+        return current.content if revision == note_revision else None
+    if revision >= latest:
+        return current.content
+    since = latest if current.history_since is None else current.history_since
+    if revision < since:
+        return None
+
+    snapshot = await content_store.find_snapshot(db, ref, revision, latest)
+    content, base_revision = current.content, latest
+    if snapshot is not None:
+        content, base_revision = snapshot["content"], snapshot["revision"]
+        if base_revision == revision:
+            return content
+
+    versions = await content_store.find_versions(
+        db, ref, revision, base_revision
+    )
+    # Every revision from base_revision down to revision + 1 is needed: a
+    # missing entry (e.g. a failed history write) would skip its change
+    if [version["revision"] for version in versions] != list(
+        range(base_revision, revision, -1)
+    ):
+        return None
+
+    for version in versions:
+        content = apply_edits(
+            content, [ContentEdit.model_validate(op) for op in version["ops"]]
+        )
+    return content
+
+
+async def revision_at(
+    db: AsyncSession, ref: ContentRef, at: datetime
+) -> Optional[int]:
+    """
+    Revision whose content was current at time at: the one before the
+    first version saved after it, or None if no version was saved since.
+    """
+    revision = await content_store.first_version_after(db, ref, at)
+    return None if revision is None else revision - 1
@@ -0,0 +1,150 @@
+"""
+Deferred purging of deleted notes' content.
+
+Deleting notes is one PostgreSQL statement (see delete_notes_query): it
+removes the rows (cascading to permissions, and writing change-feed
+tombstones by trigger), queues the notes in ``note_deletions`` and
+releases their owners' note slots. Their content, version history and
+operation log are purged afterwards by ``note_purger``, a background task
+draining the queue in batches with one content store delete_many per
+batch. Since the queue entry commits with the delete, a failed purge is
+retried rather than leaving orphans.
+"""
+
+import asyncio
+import logging
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import DateTime, delete, func, insert, literal, select, update
+
+from app.config import settings
+from app.content_store import ContentRef, content_store
+from app.database import AsyncSessionLocal
+from app.models import Note, NoteDeletion, User
+
+logger = logging.getLogger(__name__)
+
+
+def delete_notes_query(*criteria):
+    """
+    Statement deleting the notes matching criteria, queueing their content
+    for purging and decrementing their owners' note counters. Selects the
+    (id, owner_id, share_token) of the deleted notes.
+    """
+    gone = (
+        delete(Note)
+        .where(*criteria)
+        .returning(
+            Note.id, Note.owner_id, Note.mongodb_content_id, Note.share_token
+        )
+        .cte("gone")
+    )
+    queued = (
+        insert(NoteDeletion)
+        .from_select(
+            ["note_id", "mongodb_content_id", "deleted_at"],
+            select(
+                gone.c.id,
+                gone.c.mongodb_content_id,
+                literal(datetime.utcnow(), DateTime),
+            ),
+        )
+        .cte("queued")
+    )
+    counts = (
+        select(gone.c.owner_id, func.count().label("count"))
+        .group_by(gone.c.owner_id)
+        .subquery("counts")
+    )
+    released = (
+        update(User)
+        .where(User.id == counts.c.owner_id)
+        .values(note_count=func.greatest(User.note_count - counts.c.count, 0))
+        .cte("released")
+    )
+    return select(gone.c.id, gone.c.owner_id, gone.c.share_token).add_cte(
+        queued, released
+    )
+
+
+async def purge_deleted_notes(
+    batch_size: int = settings.NOTE_PURGE_BATCH_SIZE,
+) -> int:
+    """
+    Purge the content of queued deleted notes, oldest first, until the
+    queue is empty. Batches are claimed with SKIP LOCKED, so several
+    processes can drain the queue at once. Returns the number purged.
+    """
+    purged = 0
+    async with AsyncSessionLocal() as db:
+        while True:
+            result = await db.execute(
+                select(NoteDeletion.note_id, NoteDeletion.mongodb_content_id)
+                .order_by(NoteDeletion.deleted_at)
+                .limit(batch_size)
+                .with_for_update(skip_locked=True)
+            )
+            refs = [ContentRef(*row) for row in result.all()]
+            if not refs:
+                await db.rollback()
+                break
+
+            # Deleting content is idempotent, so a batch that fails before
+            # its queue entries are removed is simply purged again
+            await content_store.delete_many(db, refs)
+            await db.execute(
+                delete(NoteDeletion).where(
+                    NoteDeletion.note_id.in_([ref.note_id for ref in refs])
+                )
+            )
+            await db.commit()
+            purged += len(refs)
+    return purged
+
+
+class NotePurger:
+    """
+    Background task draining the deletion queue. Deletes wake it at once;
+    it also polls every NOTE_PURGE_INTERVAL_SECONDS, for deletes made by
+    other processes and batches that failed.
+    """
+
+    def __init__(self):
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    def wake(self):
+        self._wakeup.set()
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            try:
+                purged = await purge_deleted_notes()
+                if purged:
+                    logger.info(f"Purged content of {purged} deleted notes")
+            except Exception as e:
+                logger.error(f"Error purging deleted notes: {e}")
+            try:
+                await asyncio.wait_for(
+                    self._wakeup.wait(),
+                    timeout=settings.NOTE_PURGE_INTERVAL_SECONDS,
+                )
+            except asyncio.TimeoutError:
+                pass
+
+
+note_purger = NotePurger()
@@ -0,0 +1,32 @@
+"""
+Denormalized content metadata on notes (preview, counts and hash), so note
+listings render from PostgreSQL without reading content from MongoDB.
+"""
+
+import hashlib
+
+from app.config import settings
+from app.models import NoteType
+from app.search import extract_text
+
+
+def content_stats(content: str, note_type: NoteType) -> dict:
+    """Values of the notes columns describing the given content."""
+    text = extract_text(content, note_type)
+    if note_type != NoteType.CODE:
+        # One line per non-empty block, with whitespace collapsed
+        text = "\n".join(
+            " ".join(line.split())
+            for line in text.splitlines()
+            if line.strip()
+        )
+
+    words = text.split()
+    preview_length = settings.NOTE_PREVIEW_LENGTH
+    return {
+        "content_preview": " ".join(words[:preview_length])[:preview_length],
+        "char_count": len(text),
+        "line_count": text.count("\n") + 1 if text else 0,
+        "word_count": len(words),
+        "content_hash": hashlib.sha256(content.encode("utf-8")).hexdigest(),
+    }
@@ -0,0 +1,78 @@
+import base64
+import json
+from datetime import datetime
+from typing import NamedTuple, Optional, Tuple
+from uuid import UUID
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def encode_cursor(updated_at: datetime, note_id: UUID) -> str:
+    """
+    Encode the sort key of the last row on a page as an opaque cursor.
+    """
+    raw = json.dumps([updated_at.isoformat(), str(note_id)])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, UUID]:
+    """
+    Decode a cursor produced by encode_cursor.
+    Raises ValueError if the cursor is malformed.
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        updated_at, note_id = json.loads(raw)
+        return datetime.fromisoformat(updated_at), UUID(note_id)
+    except (TypeError, ValueError) as e:
+        raise ValueError("Invalid cursor") from e
+
+
+class SyncPosition(NamedTuple):
+    """
+    Position in the note change feed: changes from transaction since_xid
+    on (None for a full sync), optionally continuing after the (change_xid,
+    id) of a previous page, with floor_xid the token to hand out once the
+    last page is reached.
+    """
+
+    since_xid: Optional[int]
+    floor_xid: Optional[int] = None
+    after: Optional[Tuple[int, UUID]] = None
+    issued_at: Optional[datetime] = None
+
+
+def encode_sync_token(
+    since_xid: Optional[int],
+    floor_xid: Optional[int] = None,
+    after: Optional[Tuple[int, UUID]] = None,
+) -> str:
+    """Encode a change feed position as an opaque sync token."""
+    raw = json.dumps(
+        {
+            "s": since_xid,
+            "f": floor_xid,
+            "a": [after[0], str(after[1])] if after else None,
+            "t": datetime.utcnow().isoformat(),
+        }
+    )
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_sync_token(token: str) -> SyncPosition:
+    """
+    Decode a token produced by encode_sync_token.
+    Raises ValueError if the token is malformed.
+    """
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        data = json.loads(raw)
+        after = data["a"]
+        return SyncPosition(
+            since_xid=None if data["s"] is None else int(data["s"]),
+            floor_xid=None if data["f"] is None else int(data["f"]),
+            after=(int(after[0]), UUID(after[1])) if after else None,
+            issued_at=datetime.fromisoformat(data["t"]),
+        )
+    except (KeyError, IndexError, TypeError, ValueError) as e:
+        raise ValueError("Invalid sync token") from e
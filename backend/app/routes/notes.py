@@ -1,66 +1,305 @@
+import asyncio
+import logging
 import secrets
-from datetime import datetime
-from typing import List, Optional
-from uuid import UUID
+import tempfile
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional, Sequence, Tuple
+from uuid import UUID, uuid4
 
+from bson.objectid import ObjectId
 from fastapi import (
     APIRouter,
     Depends,
     HTTPException,
+    Query,
     Request,
     Response,
     status,
 )
-from sqlalchemy import func, select
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import ValidationError
+from sqlalchemy import (
+    String,
+    Text,
+    false,
+    func,
+    insert,
+    literal,
+    select,
+    text,
+    tuple_,
+    union_all,
+    update,
+)
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import selectinload
-
-from app.auth import get_current_user, get_or_create_anonymous_user
-from app.database import get_db, get_mongo_db
-from app.models import Note, NotePermission, PermissionLevel, User
+from sqlalchemy.orm import joinedload, selectinload
+from sqlalchemy.orm.attributes import set_committed_value
+
+from app.auth import (
+    get_current_user,
+    get_or_create_anonymous_user,
+    new_anonymous_user,
+    set_anonymous_session,
+)
+from app.cache import shared_note_cache
+from app.config import settings
+from app.content_patch import (
+    PatchConflict,
+    PatchError,
+    apply_edits,
+    apply_unified_diff,
+)
+from app.content_store import ContentRef, content_ref, content_store
+from app.database import (
+    AsyncSessionLocal,
+    get_db,
+    get_read_db,
+    read_only_request,
+    read_session,
+    reads_from_primary,
+)
+from app.http_cache import (
+    cache_headers,
+    if_range_matches,
+    is_not_modified,
+    not_modified_response,
+    note_etag,
+    parse_range,
+)
+from app.models import (
+    Note,
+    NotePermission,
+    NoteTombstone,
+    NoteType,
+    PermissionLevel,
+    User,
+)
+from app.note_archive import (
+    ArchiveError,
+    ZipStream,
+    iter_ndjson_records,
+    iter_zip_records,
+    ndjson_line,
+    note_record,
+)
+from app.note_history import content_at, revision_at, save_content
+from app.note_purge import delete_notes_query, note_purger
+from app.note_stats import content_stats
+from app.pagination import (
+    NEXT_CURSOR_HEADER,
+    SyncPosition,
+    decode_cursor,
+    decode_sync_token,
+    encode_cursor,
+    encode_sync_token,
+)
 from app.routes.websocket import manager
 from app.schemas import (
+    NoteBatchCreate,
+    NoteBatchIds,
+    NoteBatchResponse,
+    NoteBatchResult,
+    NoteChangesResponse,
     NoteCreate,
     NoteDetailResponse,
+    NoteImportError,
+    NoteImportResponse,
+    NotePatch,
+    NotePatchResponse,
     NotePermissionResponse,
-    NoteResponse,
+    NoteSearchResult,
+    NoteSummaryResponse,
     NoteUpdate,
+    NoteVersionContentResponse,
+    NoteVersionResponse,
     ShareNoteRequest,
     ShareNoteResponse,
 )
+from app.search import (
+    highlight,
+    plain_text,
+    search_query,
+    search_vector,
+)
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/api/notes", tags=["notes"])
 
+# Media types of raw note content; rich text notes are stored as HTML
+CONTENT_MEDIA_TYPES = {
+    NoteType.STANDARD: "text/html",
+    NoteType.CODE: "text/plain",
+}
+
+# Accepted request body types of POST /api/notes/import
+IMPORT_MEDIA_TYPES = ("application/x-ndjson", "application/zip")
+
+
+def _note_slot_cte(user_id: UUID, count: int = 1):
+    """
+    CTE that increments the owner's note counter if the free-tier limit
+    allows it, returning the owner's id (no row if the limit is reached).
+    The limit check and increment are one conditional UPDATE, so concurrent
+    creates cannot overshoot the limit.
+    """
+    return (
+        update(User)
+        .where(
+            User.id == user_id,
+            User.is_premium.is_(True)
+            | (User.note_count + count <= settings.FREE_NOTE_LIMIT),
+        )
+        .values(note_count=User.note_count + count)
+        .returning(User.id)
+        .cte("slot")
+    )
+
+
+def _check_read_access(note: Note, current_user: Optional[User]):
+    """
+    Raise 403 unless current_user may read the note.
+    Expects note.owner and note.permissions to be loaded.
+    """
+    # Public notes are readable by everyone
+    if note.is_public:
+        return
+
+    if current_user is None:
+        raise HTTPException(status_code=403, detail="Authentication required")
+
+    # Owners can always read their notes
+    if note.owner_id == current_user.id:
+        return
+
+    # Enforce separation: anonymous users can't access
+    # authenticated user notes and vice versa
+    if note.owner:
+        if current_user.is_anonymous != note.owner.is_anonymous:
+            raise HTTPException(status_code=403, detail="Access denied")
+
+    # Check if user has permission
+    if not any(p.user_id == current_user.id for p in note.permissions):
+        raise HTTPException(status_code=403, detail="Access denied")
+
+
+async def _check_write_access(
+    db: AsyncSession, note: Note, current_user: Optional[User]
+):
+    """
+    Raise 403 unless current_user may modify the note.
+    Expects note.owner to be loaded.
+    """
+    # Check permissions
+    has_write_permission = False
+
+    if current_user and note.owner_id == current_user.id:
+        has_write_permission = True
+    elif current_user:
+        # Enforce separation: anonymous users can't modify
+        # authenticated user notes and vice versa
+        if note.owner:
+            if not current_user.is_anonymous and note.owner.is_anonymous:
+                raise HTTPException(status_code=403, detail="Access denied")
+            if current_user.is_anonymous and not note.owner.is_anonymous:
+                raise HTTPException(status_code=403, detail="Access denied")
+        perm_result = await db.execute(
+            select(NotePermission).where(
+                NotePermission.note_id == note.id,
+                NotePermission.user_id == current_user.id,
+                NotePermission.permission_level.in_(
+                    [PermissionLevel.WRITE, PermissionLevel.ADMIN]
+                ),
+            )
+        )
+        permission = perm_result.scalar_one_or_none()
+        has_write_permission = permission is not None
+
+    # If still no permission, check share_permission_level for anonymous users
+    if not has_write_permission and note.share_permission_level:
+        if note.share_permission_level in ["write", "admin"]:
+            has_write_permission = True
+
+    if not has_write_permission:
+        raise HTTPException(
+            status_code=403, detail="Write permission required"
+        )
+
+
+def _check_delete_access(note: Note, current_user: Optional[User]):
+    """
+    Raise 403 unless current_user may delete the note (owner only).
+    Expects note.owner to be loaded.
+    """
+    # Enforce separation: anonymous users can't delete authenticated user notes and vice versa  # noqa: E501
+    if current_user and note.owner:
+        if not current_user.is_anonymous and note.owner.is_anonymous:
+            raise HTTPException(status_code=403, detail="Access denied")
+        if current_user.is_anonymous and not note.owner.is_anonymous:
+            raise HTTPException(status_code=403, detail="Access denied")
+
+    if current_user is None or note.owner_id != current_user.id:
+        raise HTTPException(status_code=403, detail="Only owner can delete")
+
+
+def _owned_by(current_user: Optional[User]):
+    """Criterion for notes current_user owns (none without a user)."""
+    if current_user is None:
+        return false()
+    return Note.owner_id == current_user.id
+
+
+def _accessible_notes_query(current_user: User):
+    """Select the notes listed for current_user."""
+    # Separate data for anonymous vs authenticated users
+    # Anonymous users: only see their own notes
+    # Authenticated users: only see notes from other authenticated users (exclude anonymous)  # noqa: E501
+    if current_user.is_anonymous:
+        # Anonymous users only see their own notes
+        return select(Note).where(Note.owner_id == current_user.id)
+
+    # Authenticated users see their notes and shared notes,
+    # but EXCLUDE anonymous user notes. The two sets are separate index
+    # lookups (ix_notes_owner_id_updated_at_id, ix_note_permissions_user_id)
+    # rather than an OR, which the planner can only serve by scanning all
+    # notes
+    accessible = union_all(
+        select(Note.id).where(Note.owner_id == current_user.id),
+        select(NotePermission.note_id).where(
+            NotePermission.user_id == current_user.id
+        ),
+    )
+    return (
+        select(Note)
+        .join(User, Note.owner_id == User.id)
+        .where(Note.id.in_(accessible), User.is_anonymous.is_(False))
+    )
+
 
 @router.get("/me")
 async def get_current_user_info(
-    request: Request,
     response: Response,
     db: AsyncSession = Depends(get_db),
     current_user: Optional[User] = Depends(get_current_user),
 ):
     """
-    Get current user information, creating anonymous user if needed.
+    Get current user information, issuing an anonymous identity if needed.
     This is used to get the anonymous user ID for WebSocket connections.
+    Anonymous identities are signed tokens; no database row is created here.
     """
     if current_user is None:
-        # Get anonymous user ID from header (frontend localStorage)
-        anonymous_id = request.headers.get("X-Anonymous-User-Id")
-        current_user = await get_or_create_anonymous_user(db, anonymous_id)
-        # Set cookie for anonymous user
-        response.set_cookie(
-            key="anonymous_user_id",
-            value=str(current_user.id),
-            httponly=True,
-            max_age=30 * 24 * 60 * 60,  # 30 days
-            samesite="lax",
-        )
+        current_user = new_anonymous_user()
+
+    anonymous_token = None
+    if current_user.is_anonymous:
+        anonymous_token = set_anonymous_session(response, current_user)
 
     return {
         "id": str(current_user.id),
         "username": current_user.username,
         "email": current_user.email,
         "is_anonymous": current_user.is_anonymous,
+        "anonymous_token": anonymous_token,
     }
 
 
@@ -69,7 +308,6 @@ async def get_current_user_info(
 )
 async def create_note(
     note_data: NoteCreate,
-    request: Request,
     response: Response,
     db: AsyncSession = Depends(get_db),
     current_user: Optional[User] = Depends(get_current_user),
@@ -78,227 +316,577 @@ async def create_note(
     Create a new note.
     Anonymous users create private (non-public) notes by default.
     """
-    # Get or create anonymous user if not authenticated
+    # Issue an anonymous identity if not authenticated
     is_new_anonymous = False
     if current_user is None:
-        # Get anonymous user ID from header (frontend localStorage)
-        anonymous_id = request.headers.get("X-Anonymous-User-Id")
-        current_user = await get_or_create_anonymous_user(db, anonymous_id)
+        current_user = new_anonymous_user()
         is_new_anonymous = True
 
-    # Check note limit for free users
-    if not current_user.is_premium:
-        note_count_query = select(func.count(Note.id)).where(
-            Note.owner_id == current_user.id
+    # IDs are generated here so metadata and content can be written
+    # concurrently, and the response is built without reading anything back
+    note_id = uuid4()
+    content_id = ObjectId()
+    ref = ContentRef(note_id, str(content_id))
+    now = datetime.utcnow()
+
+    async def insert_content():
+        await content_store.insert_many(db, [(ref, note_data.content)], now)
+
+    async def insert_metadata() -> Note:
+        owner = current_user
+        # Anonymous user rows are created lazily, on their first write
+        if owner.is_anonymous:
+            owner = await get_or_create_anonymous_user(db, str(owner.id))
+
+        # Reserving the note slot and inserting the note is one statement
+        slot = _note_slot_cte(owner.id)
+        values = {
+            "id": note_id,
+            "title": note_data.title,
+            "note_type": note_data.note_type,
+            "is_public": note_data.is_public,
+            "mongodb_content_id": str(content_id),
+            "created_at": now,
+            "updated_at": now,
+            **content_stats(note_data.content, note_data.note_type),
+        }
+        columns = Note.__table__.c
+        vector = search_vector(
+            literal(note_data.title, String),
+            literal(plain_text(note_data.content, note_data.note_type), Text),
         )
-        result = await db.execute(note_count_query)
-        note_count = result.scalar()
-
-        if note_count >= 3:
+        stmt = (
+            insert(Note)
+            .from_select(
+                [*values, "search_vector", "owner_id"],
+                select(
+                    *(literal(v, columns[k].type) for k, v in values.items()),
+                    vector,
+                    slot.c.id,
+                ),
+            )
+            .add_cte(slot)
+            .returning(Note)
+        )
+        result = await db.execute(select(Note).from_statement(stmt))
+        note = result.scalar_one_or_none()
+        if note is None:
             raise HTTPException(
                 status_code=403,
                 detail="Note limit reached. Upgrade to premium for unlimited notes.",  # noqa: E501
             )
+        return note
 
-    # Store content in MongoDB
-    mongo_db = get_mongo_db()
-    note_content = {
-        "content": note_data.content,
-        "created_at": datetime.utcnow(),
-        "updated_at": datetime.utcnow(),
-        "operations": [],  # For operational transformation
-    }
-    result = await mongo_db.note_contents.insert_one(note_content)
-    mongodb_content_id = str(result.inserted_id)
-
-    # Create note metadata in PostgreSQL
-    note = Note(
-        title=note_data.title,
-        note_type=note_data.note_type,
-        owner_id=current_user.id,
-        is_public=note_data.is_public,
-        mongodb_content_id=mongodb_content_id,
-    )
-
-    db.add(note)
-    await db.commit()
-    await db.refresh(note)
-
-    # Set cookie for anonymous users
+    try:
+        if content_store.shares_session:
+            # Content is written in the same transaction, after its note
+            note = await insert_metadata()
+            await insert_content()
+        else:
+            content_result, note = await asyncio.gather(
+                insert_content(), insert_metadata(), return_exceptions=True
+            )
+            for result in (note, content_result):
+                if isinstance(result, BaseException):
+                    raise result
+        await db.commit()
+    except BaseException:
+        # Compensate: nothing is committed in PostgreSQL, so only content
+        # in a separate store can be left behind
+        await db.rollback()
+        if not content_store.shares_session:
+            await content_store.delete_many(db, [ref])
+        raise
+
+    # Issue session token for new anonymous users
     if is_new_anonymous:
-        response.set_cookie(
-            key="anonymous_user_id",
-            value=str(current_user.id),
-            max_age=30 * 24 * 60 * 60,  # 30 days
-            httponly=True,
-            samesite="lax",
-        )
-
-    # Load relationships
-    query_result = await db.execute(select(Note).where(Note.id == note.id))
-    note = query_result.scalar_one()
-
-    # Get content from MongoDB using the stored ID
-    from bson import ObjectId
-
-    content_doc = await mongo_db.note_contents.find_one(
-        {"_id": ObjectId(mongodb_content_id)}
-    )
-
-    # Prepare note response data
-    note_dict = note.__dict__.copy()
-    note_dict["note_type"] = note.note_type.value  # Convert enum to string
+        set_anonymous_session(response, current_user)
 
     return NoteDetailResponse(
-        **note_dict,
-        content=content_doc["content"],
+        id=note.id,
+        title=note.title,
+        note_type=note.note_type.value,
+        owner_id=note.owner_id,
+        is_public=note.is_public,
+        share_token=note.share_token,
+        revision=note.revision,
+        share_permission_level=note.share_permission_level,
+        created_at=note.created_at,
+        updated_at=note.updated_at,
+        content=note_data.content,
         owner=current_user,
         permissions=[],
     )
 
 
-@router.get("/", response_model=List[NoteResponse])
+@router.get("/", response_model=List[NoteSummaryResponse])
 async def list_notes(
-    request: Request,
     response: Response,
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
     current_user: Optional[User] = Depends(get_current_user),
     skip: int = 0,
     limit: int = 100,
+    cursor: Optional[str] = None,
 ):
     """
     List all notes accessible to the current user.
     For anonymous users: only their own notes (identified by owner_id).
     For authenticated users: their notes and shared notes.
+
+    Notes are ordered by most recently updated. Pass the X-Next-Cursor
+    response header back as ``cursor`` to fetch the next page (keyset
+    pagination); ``skip`` is still honoured when no cursor is given.
     """
-    is_new_anonymous = False
     if current_user is None:
-        # Get anonymous user ID from header (frontend localStorage)
-        anonymous_id = request.headers.get("X-Anonymous-User-Id")
-        current_user = await get_or_create_anonymous_user(db, anonymous_id)
-        is_new_anonymous = True
+        # A brand-new anonymous visitor cannot own any notes yet
+        set_anonymous_session(response, new_anonymous_user())
+        return []
+
+    query = _accessible_notes_query(current_user)
+    query = query.order_by(Note.updated_at.desc(), Note.id.desc())
+    if cursor:
+        try:
+            cursor_updated_at, cursor_id = decode_cursor(cursor)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        query = query.where(
+            tuple_(Note.updated_at, Note.id)
+            < tuple_(cursor_updated_at, cursor_id)
+        )
+    else:
+        query = query.offset(skip)
 
-    # Set cookie for new anonymous users
-    if is_new_anonymous:
-        response.set_cookie(
-            key="anonymous_user_id",
-            value=str(current_user.id),
-            max_age=30 * 24 * 60 * 60,  # 30 days
-            httponly=True,
-            samesite="lax",
+    result = await db.execute(query.limit(limit))
+    notes = result.scalars().all()
+
+    if notes and len(notes) == limit:
+        last = notes[-1]
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(
+            last.updated_at, last.id
         )
 
-    # Separate data for anonymous vs authenticated users
-    # Anonymous users: only see their own notes
-    # Authenticated users: only see notes from other authenticated users (exclude anonymous)  # noqa: E501
-    if current_user.is_anonymous:
-        # Anonymous users only see their own notes
-        result = await db.execute(
-            select(Note)
-            .where(Note.owner_id == current_user.id)
-            .offset(skip)
-            .limit(limit)
+    return notes
+
+
+@router.get("/changes", response_model=NoteChangesResponse)
+async def list_note_changes(
+    response: Response,
+    since: Optional[str] = None,
+    limit: int = Query(500, ge=1, le=1000),
+    db: AsyncSession = Depends(get_db),
+    current_user: Optional[User] = Depends(get_current_user),
+):
+    """
+    Incremental sync of the note list: notes created or changed (including
+    sharing changes) since the ``since`` token, and the IDs of notes that
+    left the list (deleted or access revoked). Without a token every
+    listed note is returned.
+
+    Follow next_token while has_more is true; the last page's token is the
+    one to keep for the next sync. Tokens older than the tombstone
+    retention get 410, and the client must refetch the list.
+    """
+    position = SyncPosition(since_xid=None)
+    if since:
+        try:
+            position = decode_sync_token(since)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid sync token")
+        max_age = timedelta(days=settings.SYNC_TOKEN_MAX_AGE_DAYS)
+        if position.issued_at < datetime.utcnow() - max_age:
+            raise HTTPException(
+                status_code=410,
+                detail="Sync token expired. Refetch the note list.",
+            )
+
+    floor_xid = position.floor_xid
+    if floor_xid is None:
+        # Every transaction below the snapshot's xmin has finished, so its
+        # changes are visible to the queries below; later ones are picked
+        # up by the next sync
+        floor_xid = await db.scalar(
+            text(
+                "SELECT pg_snapshot_xmin(pg_current_snapshot())::text::bigint"
+            )
         )
-    else:
-        # Authenticated users see their notes and shared notes,
-        # but EXCLUDE anonymous user notes
+
+    if current_user is None:
+        # A brand-new anonymous visitor cannot own any notes yet
+        set_anonymous_session(response, new_anonymous_user())
+        return NoteChangesResponse(
+            notes=[],
+            deleted=[],
+            next_token=encode_sync_token(floor_xid),
+            has_more=False,
+        )
+
+    query = _accessible_notes_query(current_user)
+    if position.since_xid is not None:
+        query = query.where(Note.change_xid >= position.since_xid)
+    if position.after is not None:
+        query = query.where(
+            tuple_(Note.change_xid, Note.id) > tuple_(*position.after)
+        )
+    result = await db.execute(
+        query.order_by(Note.change_xid, Note.id).limit(limit + 1)
+    )
+    notes = result.scalars().all()
+    has_more = len(notes) > limit
+    notes = notes[:limit]
+
+    deleted = []
+    if position.since_xid is not None and position.after is None:
         result = await db.execute(
-            select(Note)
-            .join(User, Note.owner_id == User.id)
-            .where(
-                (
-                    (Note.owner_id == current_user.id)
-                    | (
-                        Note.permissions.any(
-                            NotePermission.user_id == current_user.id
-                        )
+            select(NoteTombstone.note_id).where(
+                NoteTombstone.user_id == current_user.id,
+                NoteTombstone.change_xid >= position.since_xid,
+                # Access may have been granted again since
+                NoteTombstone.note_id.not_in(
+                    _accessible_notes_query(current_user).with_only_columns(
+                        Note.id
                     )
-                )
-                & (User.is_anonymous.is_(False))
+                ),
             )
-            .offset(skip)
-            .limit(limit)
         )
+        deleted = result.scalars().all()
 
-    notes = result.scalars().all()
-    return notes
+    if has_more:
+        last = notes[-1]
+        next_token = encode_sync_token(
+            position.since_xid, floor_xid, (last.change_xid, last.id)
+        )
+    else:
+        next_token = encode_sync_token(floor_xid)
 
+    return NoteChangesResponse(
+        notes=notes, deleted=deleted, next_token=next_token, has_more=has_more
+    )
 
-@router.get("/{note_id}", response_model=NoteDetailResponse)
-async def get_note(
-    note_id: UUID,
-    request: Request,
-    db: AsyncSession = Depends(get_db),
+
+@router.get("/search", response_model=List[NoteSearchResult])
+async def search_notes(
+    response: Response,
+    q: str = Query(..., min_length=1, max_length=256),
+    db: AsyncSession = Depends(get_read_db),
     current_user: Optional[User] = Depends(get_current_user),
+    skip: int = 0,
+    limit: int = 20,
 ):
     """
-    Get a specific note by ID.
+    Full-text search over the titles and content of the notes accessible
+    to the current user (same rules as list_notes). Results are ranked,
+    title matches above content matches, and carry an HTML-safe snippet
+    with the matches wrapped in <mark>.
     """
-    # Get or create anonymous user if not authenticated
     if current_user is None:
-        # Get anonymous user ID from header (frontend localStorage)
-        anonymous_id = request.headers.get("X-Anonymous-User-Id")
-        if anonymous_id:
-            current_user = await get_or_create_anonymous_user(db, anonymous_id)
+        # A brand-new anonymous visitor cannot own any notes yet
+        set_anonymous_session(response, new_anonymous_user())
+        return []
 
+    tsquery = search_query(q)
+    rank = func.ts_rank_cd(Note.search_vector, tsquery)
     result = await db.execute(
-        select(Note)
-        .options(selectinload(Note.owner), selectinload(Note.permissions))
-        .where(Note.id == note_id)
+        _accessible_notes_query(current_user)
+        .add_columns(rank)
+        .where(Note.search_vector.op("@@")(tsquery))
+        .order_by(rank.desc(), Note.updated_at.desc(), Note.id.desc())
+        .offset(skip)
+        .limit(limit)
     )
-    note = result.scalar_one_or_none()
+    rows = result.all()
+    if not rows:
+        return []
 
-    if not note:
-        raise HTTPException(status_code=404, detail="Note not found")
+    # Snippets are cut from the content of the returned page only
+    contents = await content_store.get_many(
+        db, [content_ref(note) for note, _ in rows]
+    )
+    snippets = await highlight(
+        db,
+        q,
+        {
+            note.id: plain_text(contents.get(note.id, ""), note.note_type)
+            for note, _ in rows
+        },
+    )
 
-    # Check permissions for private notes
-    if not note.is_public:
-        # If still no user after trying to create anonymous, deny access
-        if current_user is None:
-            raise HTTPException(
-                status_code=403, detail="Authentication required"
+    return [
+        NoteSearchResult(
+            **NoteSummaryResponse.model_validate(note).model_dump(),
+            rank=note_rank,
+            snippet=snippets.get(note.id),
+        )
+        for note, note_rank in rows
+    ]
+
+
+async def _export_batches(current_user: Optional[User], primary: bool):
+    """
+    Yield the notes accessible to current_user as lists of export records,
+    in primary-key batches with one content store read per batch. Uses its
+    own read-only session (see read_session), since request dependencies
+    are closed before a streaming response body is sent.
+    """
+    if current_user is None:
+        return
+
+    last_id = None
+    async with read_session(primary) as db:
+        while True:
+            query = (
+                _accessible_notes_query(current_user)
+                .order_by(Note.id)
+                .limit(settings.EXPORT_BATCH_SIZE)
+            )
+            if last_id is not None:
+                query = query.where(Note.id > last_id)
+            result = await db.execute(query)
+            notes = result.scalars().all()
+            if not notes:
+                return
+
+            contents = await content_store.get_many(
+                db, [content_ref(note) for note in notes]
             )
+            records = [
+                note_record(note, contents.get(note.id, "")) for note in notes
+            ]
+            last_id = notes[-1].id
 
-        # Check if user owns the note
-        if note.owner_id != current_user.id:
-            # Enforce separation: anonymous users can't access
-            # authenticated user notes and vice versa
-            if current_user and note.owner:
-                # Prevent authenticated users from accessing
-                # anonymous user notes
-                if not current_user.is_anonymous and note.owner.is_anonymous:
-                    raise HTTPException(
-                        status_code=403, detail="Access denied"
-                    )
-                # Prevent anonymous users from accessing
-                # authenticated user notes
-                if current_user.is_anonymous and not note.owner.is_anonymous:
-                    raise HTTPException(
-                        status_code=403, detail="Access denied"
-                    )
+            # Don't hold a transaction or loaded rows while the client reads
+            await db.rollback()
+            db.expunge_all()
+            yield records
 
-            # Check if user has permission
-            perm_result = await db.execute(
-                select(NotePermission).where(
-                    NotePermission.note_id == note_id,
-                    NotePermission.user_id == current_user.id,
-                )
+
+@router.get("/export")
+async def export_notes(
+    request: Request,
+    format: str = Query("ndjson", pattern="^(ndjson|zip)$"),
+    current_user: Optional[User] = Depends(get_current_user),
+):
+    """
+    Export every note accessible to the current user (same rules as
+    list_notes), with content, as NDJSON (one note per line) or a ZIP
+    archive. The body is streamed batch by batch and never buffered whole.
+    """
+    primary = reads_from_primary(request)
+
+    async def ndjson_body():
+        async for records in _export_batches(current_user, primary):
+            yield b"".join(ndjson_line(record) for record in records)
+
+    async def zip_body():
+        archive = ZipStream()
+        async for records in _export_batches(current_user, primary):
+            yield b"".join(archive.add(record) for record in records)
+        yield archive.close()
+
+    headers = {
+        "Content-Disposition": f'attachment; filename="syncpad-notes.{format}"'
+    }
+    if format == "zip":
+        # Entries are already deflated; skip response compression
+        headers["Content-Encoding"] = "identity"
+        return StreamingResponse(
+            zip_body(), media_type="application/zip", headers=headers
+        )
+    return StreamingResponse(
+        ndjson_body(), media_type="application/x-ndjson", headers=headers
+    )
+
+
+@router.post("/import", response_model=NoteImportResponse)
+async def import_notes(
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(get_db),
+    current_user: Optional[User] = Depends(get_current_user),
+):
+    """
+    Import notes from an NDJSON (application/x-ndjson) or ZIP
+    (application/zip) export. Records are read from the request body as
+    it arrives and created in batches of IMPORT_BATCH_SIZE, each committed
+    on its own; imported notes get new ids and the caller as owner.
+    Invalid records, and records beyond a free user's allowance, are
+    reported in errors without stopping the import.
+    """
+    media_type = request.headers.get("content-type", "").split(";")[0]
+    media_type = media_type.strip().lower()
+    if media_type not in IMPORT_MEDIA_TYPES:
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail="Expected application/x-ndjson or application/zip",
+        )
+
+    # Issue an anonymous identity if not authenticated
+    is_new_anonymous = False
+    if current_user is None:
+        current_user = new_anonymous_user()
+        is_new_anonymous = True
+
+    owner = current_user
+    # Anonymous user rows are created lazily, on their first write
+    if owner.is_anonymous:
+        owner = await get_or_create_anonymous_user(db, str(owner.id))
+
+    created = 0
+    errors: List[NoteImportError] = []
+    pending: List[Tuple[str, NoteCreate]] = []
+
+    async def flush():
+        nonlocal created
+        inserted, _ = await _insert_notes(
+            db, owner, [data for _, data in pending]
+        )
+        created += len(inserted)
+        errors.extend(
+            NoteImportError(
+                record=label,
+                status_code=403,
+                detail="Note limit reached. Upgrade to premium for unlimited notes.",  # noqa: E501
             )
-            permission = perm_result.scalar_one_or_none()
-            if not permission:
-                raise HTTPException(status_code=403, detail="Access denied")
+            for label, _ in pending[len(inserted) :]
+        )
+        pending.clear()
 
-    # Get content from MongoDB
-    mongo_db = get_mongo_db()
-    from bson.objectid import ObjectId
+    async def add(label: str, record):
+        if isinstance(record, ArchiveError):
+            errors.append(
+                NoteImportError(
+                    record=label, status_code=400, detail=str(record)
+                )
+            )
+            return
+        try:
+            pending.append((label, NoteCreate.model_validate(record)))
+        except ValidationError as e:
+            error = e.errors()[0]
+            field = ".".join(str(part) for part in error["loc"])
+            errors.append(
+                NoteImportError(
+                    record=label,
+                    status_code=422,
+                    detail=f"{field}: {error['msg']}"
+                    if field
+                    else error["msg"],
+                )
+            )
+            return
+        if len(pending) >= settings.IMPORT_BATCH_SIZE:
+            await flush()
+
+    if media_type == "application/x-ndjson":
+        async for label, record in iter_ndjson_records(
+            request.stream(), settings.IMPORT_MAX_RECORD_BYTES
+        ):
+            await add(label, record)
+    else:
+        # The ZIP central directory is at the end, so the upload is
+        # spooled (to disk once large) before any entry can be read;
+        # its size is capped, so one upload cannot fill the disk
+        too_large = HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=(
+                "ZIP uploads are limited to "
+                f"{settings.IMPORT_MAX_UPLOAD_BYTES} bytes"
+            ),
+        )
+        declared = request.headers.get("content-length", "")
+        if declared.isdigit() and (
+            int(declared) > settings.IMPORT_MAX_UPLOAD_BYTES
+        ):
+            raise too_large
+        with tempfile.SpooledTemporaryFile(
+            max_size=settings.IMPORT_SPOOL_MAX_MEMORY
+        ) as upload:
+            received = 0
+            async for chunk in request.stream():
+                received += len(chunk)
+                if received > settings.IMPORT_MAX_UPLOAD_BYTES:
+                    raise too_large
+                upload.write(chunk)
+            upload.seek(0)
+            for label, record in iter_zip_records(
+                upload, settings.IMPORT_MAX_RECORD_BYTES
+            ):
+                await add(label, record)
+    if pending:
+        await flush()
+
+    # Issue session token for new anonymous users
+    if is_new_anonymous:
+        set_anonymous_session(response, current_user)
 
-    content_doc = await mongo_db.note_contents.find_one(
-        {"_id": ObjectId(note.mongodb_content_id)}
+    logger.info(
+        f"Imported {created} notes for user {owner.id} ({len(errors)} errors)"
     )
+    return NoteImportResponse(created=created, errors=errors)
+
 
-    if not content_doc:
+@router.get("/{note_id}", response_model=NoteDetailResponse)
+async def get_note(
+    note_id: UUID,
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(get_read_db),
+    current_user: Optional[User] = Depends(get_current_user),
+):
+    """
+    Get a specific note by ID.
+    Supports conditional requests (If-None-Match / If-Modified-Since);
+    a 304 is answered from PostgreSQL alone.
+    """
+    # Content is addressed by note_id, so it is fetched concurrently with
+    # the metadata/access query instead of after it, unless the content
+    # store shares this session
+    content_task = None
+    if not content_store.shares_session:
+        content_task = asyncio.create_task(
+            content_store.get(db, ContentRef(note_id))
+        )
+
+    def cancel_content():
+        if content_task is not None:
+            content_task.cancel()
+
+    try:
+        # Note, owner and permissions (used for the access check) in one query
+        result = await db.execute(
+            select(Note)
+            .options(
+                joinedload(Note.owner),
+                joinedload(Note.permissions).joinedload(NotePermission.user),
+            )
+            .where(Note.id == note_id)
+        )
+        note = result.unique().scalar_one_or_none()
+
+        if not note:
+            raise HTTPException(status_code=404, detail="Note not found")
+
+        _check_read_access(note, current_user)
+
+        headers = cache_headers(
+            note_etag(note), note.updated_at, public=note.is_public
+        )
+        if is_not_modified(request, headers["ETag"], note.updated_at):
+            cancel_content()
+            return not_modified_response(headers)
+
+        record = None if content_task is None else await content_task
+    except BaseException:
+        cancel_content()
+        raise
+
+    if record is None:
+        # Documents created before content stored its note_id
+        record = await content_store.get(db, content_ref(note))
+
+    if record is None:
         raise HTTPException(status_code=500, detail="Note content not found")
 
+    response.headers.update(headers)
     return NoteDetailResponse(
         id=note.id,
         title=note.title,
@@ -306,9 +894,10 @@ async def get_note(
         owner_id=note.owner_id,
         is_public=note.is_public,
         share_token=note.share_token,
+        revision=note.revision,
         created_at=note.created_at,
         updated_at=note.updated_at,
-        content=content_doc["content"],
+        content=record.content,
         owner=note.owner,
         permissions=note.permissions,
     )
@@ -318,66 +907,37 @@ async def get_note(
 async def update_note(
     note_id: UUID,
     note_data: NoteUpdate,
-    request: Request,
     db: AsyncSession = Depends(get_db),
-    current_user: Optional[User] = Depends(get_current_user),
-):
-    """
-    Update a note (title, content, or public status).
-    Free users can edit their own notes via this endpoint (save button).
-    Premium users also have real-time WebSocket updates.
-    """
-    # Get or create anonymous user if not authenticated
-    if current_user is None:
-        # Get anonymous user ID from header (frontend localStorage)
-        anonymous_id = request.headers.get("X-Anonymous-User-Id")
-        if anonymous_id:
-            current_user = await get_or_create_anonymous_user(db, anonymous_id)
-
-    result = await db.execute(
-        select(Note)
-        .options(selectinload(Note.owner), selectinload(Note.permissions))
-        .where(Note.id == note_id)
-    )
-    note = result.scalar_one_or_none()
-
-    if not note:
-        raise HTTPException(status_code=404, detail="Note not found")
-
-    # Check permissions
-    has_write_permission = False
-
-    if current_user and note.owner_id == current_user.id:
-        has_write_permission = True
-    elif current_user:
-        # Enforce separation: anonymous users can't modify
-        # authenticated user notes and vice versa
-        if note.owner:
-            if not current_user.is_anonymous and note.owner.is_anonymous:
-                raise HTTPException(status_code=403, detail="Access denied")
-            if current_user.is_anonymous and not note.owner.is_anonymous:
-                raise HTTPException(status_code=403, detail="Access denied")
-        perm_result = await db.execute(
-            select(NotePermission).where(
-                NotePermission.note_id == note_id,
-                NotePermission.user_id == current_user.id,
-                NotePermission.permission_level.in_(
-                    [PermissionLevel.WRITE, PermissionLevel.ADMIN]
-                ),
-            )
-        )
-        permission = perm_result.scalar_one_or_none()
-        has_write_permission = permission is not None
+    current_user: Optional[User] = Depends(get_current_user),
+):
+    """
+    Update a note (title, content, or public status).
+    Free users can edit their own notes via this endpoint (save button).
+    Premium users also have real-time WebSocket updates.
+    """
+    result = await db.execute(
+        select(Note)
+        .options(selectinload(Note.owner), selectinload(Note.permissions))
+        .where(Note.id == note_id)
+    )
+    note = result.scalar_one_or_none()
 
-    # If still no permission, check share_permission_level for anonymous users
-    if not has_write_permission and note.share_permission_level:
-        if note.share_permission_level in ["write", "admin"]:
-            has_write_permission = True
+    if not note:
+        raise HTTPException(status_code=404, detail="Note not found")
 
-    if not has_write_permission:
-        raise HTTPException(
-            status_code=403, detail="Write permission required"
-        )
+    await _check_write_access(db, note, current_user)
+
+    # Indexed text and stats depend on the note type, so a type change
+    # recomputes them, from the stored content if none was sent
+    content = note_data.content
+    type_changed = (
+        note_data.note_type is not None
+        and note_data.note_type != note.note_type
+    )
+    if content is None and type_changed:
+        record = await content_store.get(db, content_ref(note))
+        if record is not None:
+            content = record.content
 
     # Update PostgreSQL metadata
     if note_data.title is not None:
@@ -386,20 +946,31 @@ async def update_note(
         note.note_type = note_data.note_type
     if note_data.is_public is not None:
         note.is_public = note_data.is_public
+    note.revision = Note.revision + 1
+    if note_data.title is not None or content is not None:
+        note.search_vector = search_vector(
+            note.title,
+            None if content is None else plain_text(content, note.note_type),
+        )
+    if content is not None:
+        for column, value in content_stats(content, note.note_type).items():
+            setattr(note, column, value)
+    # Lock the row before writing content, serializing with PATCH saves
+    await db.flush()
 
-    # Update MongoDB content
+    # Update content
     if note_data.content is not None:
-        mongo_db = get_mongo_db()
-        from bson.objectid import ObjectId
-
-        await mongo_db.note_contents.update_one(
-            {"_id": ObjectId(note.mongodb_content_id)},
-            {
-                "$set": {
-                    "content": note_data.content,
-                    "updated_at": datetime.utcnow(),
-                }
-            },
+        result = await db.execute(
+            select(Note.revision, Note.updated_at).where(Note.id == note.id)
+        )
+        revision, updated_at = result.one()
+        await save_content(
+            db,
+            content_ref(note),
+            revision,
+            note_data.content,
+            updated_at,
+            user_id=current_user.id if current_user else None,
         )
 
         # Clear WebSocket in-memory cache to ensure fresh content is fetched
@@ -408,14 +979,10 @@ async def update_note(
 
     await db.commit()
     await db.refresh(note)
+    await shared_note_cache.invalidate(note.share_token)
 
     # Get updated content
-    mongo_db = get_mongo_db()
-    from bson.objectid import ObjectId
-
-    content_doc = await mongo_db.note_contents.find_one(
-        {"_id": ObjectId(note.mongodb_content_id)}
-    )
+    record = await content_store.get(db, content_ref(note))
 
     return NoteDetailResponse(
         id=note.id,
@@ -424,32 +991,30 @@ async def update_note(
         owner_id=note.owner_id,
         is_public=note.is_public,
         share_token=note.share_token,
+        revision=note.revision,
         share_permission_level=note.share_permission_level,
         created_at=note.created_at,
         updated_at=note.updated_at,
-        content=content_doc["content"],
+        content=record.content if record else "",
         owner=note.owner,
         permissions=note.permissions,
     )
 
 
-@router.delete("/{note_id}", status_code=status.HTTP_204_NO_CONTENT)
-async def delete_note(
+@router.patch("/{note_id}", response_model=NotePatchResponse)
+async def patch_note(
     note_id: UUID,
-    request: Request,
+    patch: NotePatch,
     db: AsyncSession = Depends(get_db),
     current_user: Optional[User] = Depends(get_current_user),
 ):
     """
-    Delete a note. Only owner can delete.
+    Apply a content delta (positional edits or a unified diff) against
+    base_revision, so a save costs the size of the change rather than the
+    note. Returns 409 if the note has changed since base_revision or the
+    delta does not match its content, 422 if the delta is malformed, and
+    only the new revision on success.
     """
-    # Get or create anonymous user if not authenticated
-    if current_user is None:
-        # Get anonymous user ID from header (frontend localStorage)
-        anonymous_id = request.headers.get("X-Anonymous-User-Id")
-        if anonymous_id:
-            current_user = await get_or_create_anonymous_user(db, anonymous_id)
-
     result = await db.execute(
         select(Note)
         .options(selectinload(Note.owner))
@@ -460,36 +1025,407 @@ async def delete_note(
     if not note:
         raise HTTPException(status_code=404, detail="Note not found")
 
-    # Enforce separation: anonymous users can't delete authenticated user notes and vice versa  # noqa: E501
-    if current_user and note.owner:
-        if not current_user.is_anonymous and note.owner.is_anonymous:
-            raise HTTPException(status_code=403, detail="Access denied")
-        if current_user.is_anonymous and not note.owner.is_anonymous:
-            raise HTTPException(status_code=403, detail="Access denied")
+    await _check_write_access(db, note, current_user)
 
-    if current_user is None or note.owner_id != current_user.id:
-        raise HTTPException(status_code=403, detail="Only owner can delete")
+    # The conditional bump locks the row until commit, so concurrent saves
+    # against the same base revision cannot both apply
+    now = datetime.utcnow()
+    result = await db.execute(
+        update(Note)
+        .where(Note.id == note_id, Note.revision == patch.base_revision)
+        .values(revision=Note.revision + 1, updated_at=now)
+        .returning(Note.revision)
+        .execution_options(synchronize_session=False)
+    )
+    revision = result.scalar_one_or_none()
+    if revision is None:
+        raise HTTPException(
+            status_code=409, detail="Note has changed since base revision"
+        )
+
+    ref = content_ref(note)
+    record = await content_store.get(db, ref)
+    if record is None:
+        raise HTTPException(status_code=500, detail="Note content not found")
+
+    try:
+        if patch.edits is not None:
+            content = apply_edits(record.content, patch.edits)
+        else:
+            content = apply_unified_diff(record.content, patch.diff)
+    except PatchConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except PatchError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+    await db.execute(
+        update(Note)
+        .where(Note.id == note.id)
+        .values(
+            search_vector=search_vector(
+                note.title, plain_text(content, note.note_type)
+            ),
+            updated_at=now,
+            **content_stats(content, note.note_type),
+        )
+        .execution_options(synchronize_session=False)
+    )
+
+    await save_content(
+        db,
+        ref,
+        revision,
+        content,
+        now,
+        user_id=current_user.id if current_user else None,
+        previous=record,
+    )
+
+    # Clear WebSocket in-memory cache to ensure fresh content is fetched
+    manager.current_content.pop(str(note.id), None)
+
+    await db.commit()
+    await shared_note_cache.invalidate(note.share_token)
 
-    # Delete from MongoDB
-    mongo_db = get_mongo_db()
-    from bson.objectid import ObjectId
+    return NotePatchResponse(id=note.id, revision=revision, updated_at=now)
 
-    await mongo_db.note_contents.delete_one(
-        {"_id": ObjectId(note.mongodb_content_id)}
+
+@router.delete("/{note_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def delete_note(
+    note_id: UUID,
+    db: AsyncSession = Depends(get_db),
+    current_user: Optional[User] = Depends(get_current_user),
+):
+    """
+    Delete a note. Only owner can delete.
+    The note is deleted and queued for content purging in one statement;
+    its content is purged in the background (see app.note_purge).
+    """
+    result = await db.execute(
+        delete_notes_query(Note.id == note_id, _owned_by(current_user))
     )
+    deleted = result.one_or_none()
+
+    if deleted is None:
+        # Nothing deleted: tell a missing note from a forbidden one
+        await db.rollback()
+        result = await db.execute(
+            select(Note)
+            .options(selectinload(Note.owner))
+            .where(Note.id == note_id)
+        )
+        note = result.scalar_one_or_none()
+        if note:
+            _check_delete_access(note, current_user)
+        raise HTTPException(status_code=404, detail="Note not found")
 
-    # Delete from PostgreSQL (cascades to permissions)
-    await db.delete(note)
     await db.commit()
+    note_purger.wake()
+
+    await shared_note_cache.invalidate(deleted.share_token)
 
     return None
 
 
+@router.post(
+    "/batch-get",
+    response_model=NoteBatchResponse,
+    dependencies=[Depends(read_only_request)],
+)
+async def batch_get_notes(
+    batch: NoteBatchIds,
+    db: AsyncSession = Depends(get_read_db),
+    current_user: Optional[User] = Depends(get_current_user),
+):
+    """
+    Get several notes in one request. Notes, owners and permissions are
+    loaded in one query and content in one MongoDB read; every requested
+    ID gets its own result.
+    """
+    note_ids = list(dict.fromkeys(batch.note_ids))
+    result = await db.execute(
+        select(Note)
+        .options(
+            joinedload(Note.owner),
+            joinedload(Note.permissions).joinedload(NotePermission.user),
+        )
+        .where(Note.id.in_(note_ids))
+    )
+    notes = {note.id: note for note in result.unique().scalars()}
+
+    results = {}
+    readable = []
+    for note_id in note_ids:
+        note = notes.get(note_id)
+        if note is None:
+            results[note_id] = NoteBatchResult(
+                id=note_id, status_code=404, detail="Note not found"
+            )
+            continue
+        try:
+            _check_read_access(note, current_user)
+        except HTTPException as e:
+            results[note_id] = NoteBatchResult(
+                id=note_id, status_code=e.status_code, detail=e.detail
+            )
+            continue
+        readable.append(note)
+
+    contents = await content_store.get_many(
+        db, [content_ref(note) for note in readable]
+    )
+
+    for note in readable:
+        content = contents.get(note.id)
+        if content is None:
+            results[note.id] = NoteBatchResult(
+                id=note.id, status_code=500, detail="Note content not found"
+            )
+            continue
+        results[note.id] = NoteBatchResult(
+            id=note.id,
+            status_code=200,
+            note=NoteDetailResponse(
+                id=note.id,
+                title=note.title,
+                note_type=note.note_type.value,
+                owner_id=note.owner_id,
+                is_public=note.is_public,
+                share_token=note.share_token,
+                revision=note.revision,
+                share_permission_level=note.share_permission_level,
+                created_at=note.created_at,
+                updated_at=note.updated_at,
+                content=content,
+                owner=note.owner,
+                permissions=note.permissions,
+            ),
+        )
+
+    return NoteBatchResponse(results=[results[i] for i in note_ids])
+
+
+async def _insert_notes(
+    db: AsyncSession, owner: User, notes: Sequence[NoteCreate]
+) -> Tuple[List[Tuple[UUID, NoteCreate]], datetime]:
+    """
+    Create notes for owner with one multi-row insert in PostgreSQL and one
+    content store insert_many, committing on success. Free users get as many
+    notes as their remaining allowance permits. Returns the created
+    (note_id, data) pairs, in order, and their creation time.
+    """
+    # Reserve all granted slots with one conditional counter update
+    granted = len(notes)
+    if not owner.is_premium:
+        granted = max(
+            min(granted, settings.FREE_NOTE_LIMIT - (owner.note_count or 0)),
+            0,
+        )
+    if granted:
+        slot = _note_slot_cte(owner.id, granted)
+        result = await db.execute(select(slot.c.id))
+        if result.scalar_one_or_none() is None:
+            granted = 0
+        else:
+            set_committed_value(
+                owner, "note_count", (owner.note_count or 0) + granted
+            )
+
+    now = datetime.utcnow()
+    items = [(uuid4(), ObjectId(), data) for data in notes[:granted]]
+
+    async def insert_contents():
+        await content_store.insert_many(
+            db,
+            [
+                (ContentRef(note_id, str(content_id)), data.content)
+                for note_id, content_id, data in items
+            ],
+            now,
+        )
+
+    async def insert_metadata():
+        # One multi-row VALUES insert, so each row can carry its search
+        # vector expression and notes are written once, as in create_note
+        await db.execute(
+            insert(Note).values(
+                [
+                    {
+                        "id": note_id,
+                        "title": data.title,
+                        "note_type": data.note_type,
+                        "is_public": data.is_public,
+                        "owner_id": owner.id,
+                        "mongodb_content_id": str(content_id),
+                        "created_at": now,
+                        "updated_at": now,
+                        "search_vector": search_vector(
+                            data.title,
+                            plain_text(data.content, data.note_type),
+                        ),
+                        **content_stats(data.content, data.note_type),
+                    }
+                    for note_id, content_id, data in items
+                ]
+            )
+        )
+
+    if items:
+        try:
+            if content_store.shares_session:
+                # Content is written in the same transaction, after its notes
+                await insert_metadata()
+                await insert_contents()
+            else:
+                content_result, metadata_result = await asyncio.gather(
+                    insert_contents(),
+                    insert_metadata(),
+                    return_exceptions=True,
+                )
+                for result in (metadata_result, content_result):
+                    if isinstance(result, BaseException):
+                        raise result
+            await db.commit()
+        except BaseException:
+            # Compensate: nothing is committed in PostgreSQL, so only content
+            # in a separate store can be left behind
+            await db.rollback()
+            if not content_store.shares_session:
+                await content_store.delete_many(
+                    db,
+                    [
+                        ContentRef(note_id, str(content_id))
+                        for note_id, content_id, _ in items
+                    ],
+                )
+            raise
+
+    return [(note_id, data) for note_id, _, data in items], now
+
+
+@router.post("/batch-create", response_model=NoteBatchResponse)
+async def batch_create_notes(
+    batch: NoteBatchCreate,
+    response: Response,
+    db: AsyncSession = Depends(get_db),
+    current_user: Optional[User] = Depends(get_current_user),
+):
+    """
+    Create several notes in one request, with one multi-row insert in
+    PostgreSQL and one content store insert_many. Free users get as many
+    notes as their remaining allowance permits; the rest are rejected
+    with 403 in their results.
+    """
+    # Issue an anonymous identity if not authenticated
+    is_new_anonymous = False
+    if current_user is None:
+        current_user = new_anonymous_user()
+        is_new_anonymous = True
+
+    owner = current_user
+    # Anonymous user rows are created lazily, on their first write
+    if owner.is_anonymous:
+        owner = await get_or_create_anonymous_user(db, str(owner.id))
+
+    created, now = await _insert_notes(db, owner, batch.notes)
+    granted = len(created)
+
+    # Issue session token for new anonymous users
+    if is_new_anonymous:
+        set_anonymous_session(response, current_user)
+
+    results = [
+        NoteBatchResult(
+            id=note_id,
+            status_code=201,
+            note=NoteDetailResponse(
+                id=note_id,
+                title=data.title,
+                note_type=data.note_type.value,
+                owner_id=owner.id,
+                is_public=data.is_public,
+                share_token=None,
+                revision=1,
+                created_at=now,
+                updated_at=now,
+                content=data.content,
+                owner=owner,
+                permissions=[],
+            ),
+        )
+        for note_id, data in created
+    ]
+    results.extend(
+        NoteBatchResult(
+            status_code=403,
+            detail="Note limit reached. Upgrade to premium for unlimited notes.",  # noqa: E501
+        )
+        for _ in batch.notes[granted:]
+    )
+    return NoteBatchResponse(results=results)
+
+
+@router.post("/batch-delete", response_model=NoteBatchResponse)
+async def batch_delete_notes(
+    batch: NoteBatchIds,
+    db: AsyncSession = Depends(get_db),
+    current_user: Optional[User] = Depends(get_current_user),
+):
+    """
+    Delete several notes in one request. Only owners can delete; every
+    requested ID gets its own result. The owned notes are deleted and
+    queued for content purging in one statement (see app.note_purge).
+    """
+    note_ids = list(dict.fromkeys(batch.note_ids))
+    result = await db.execute(
+        delete_notes_query(Note.id.in_(note_ids), _owned_by(current_user))
+    )
+    deleted = {row.id: row.share_token for row in result}
+    await db.commit()
+
+    # Only notes that were not deleted need a reason
+    notes = {}
+    if len(deleted) < len(note_ids):
+        result = await db.execute(
+            select(Note)
+            .options(selectinload(Note.owner))
+            .where(Note.id.in_([i for i in note_ids if i not in deleted]))
+        )
+        notes = {note.id: note for note in result.scalars()}
+
+    results = []
+    for note_id in note_ids:
+        if note_id in deleted:
+            results.append(NoteBatchResult(id=note_id, status_code=204))
+            continue
+        note = notes.get(note_id)
+        try:
+            if note is not None:
+                _check_delete_access(note, current_user)
+            raise HTTPException(status_code=404, detail="Note not found")
+        except HTTPException as e:
+            results.append(
+                NoteBatchResult(
+                    id=note_id, status_code=e.status_code, detail=e.detail
+                )
+            )
+
+    if deleted:
+        note_purger.wake()
+        await asyncio.gather(
+            *(
+                shared_note_cache.invalidate(share_token)
+                for share_token in deleted.values()
+            )
+        )
+
+    return NoteBatchResponse(results=results)
+
+
 @router.post("/{note_id}/share", response_model=ShareNoteResponse)
 async def share_note(
     note_id: UUID,
     share_data: ShareNoteRequest,
-    request: Request,
     response: Response,
     db: AsyncSession = Depends(get_db),
     current_user: Optional[User] = Depends(get_current_user),
@@ -498,12 +1434,10 @@ async def share_note(
     Share a note with another user or generate a share link.
     Anonymous users can only generate share links, not share with specific users.  # noqa: E501
     """
-    # Get or create anonymous user if not authenticated
+    # Issue an anonymous identity if not authenticated
     is_new_anonymous = False
     if current_user is None:
-        # Get anonymous user ID from header (frontend localStorage)
-        anonymous_id = request.headers.get("X-Anonymous-User-Id")
-        current_user = await get_or_create_anonymous_user(db, anonymous_id)
+        current_user = new_anonymous_user()
         is_new_anonymous = True
 
     result = await db.execute(select(Note).where(Note.id == note_id))
@@ -515,15 +1449,9 @@ async def share_note(
     if note.owner_id != current_user.id:
         raise HTTPException(status_code=403, detail="Only owner can share")
 
-    # Set cookie for new anonymous users
+    # Issue session token for new anonymous users
     if is_new_anonymous:
-        response.set_cookie(
-            key="anonymous_user_id",
-            value=str(current_user.id),
-            max_age=30 * 24 * 60 * 60,  # 30 days
-            httponly=True,
-            samesite="lax",
-        )
+        set_anonymous_session(response, current_user)
 
     response = ShareNoteResponse()
 
@@ -539,8 +1467,10 @@ async def share_note(
             # Store the default permission level for share links
             note.share_permission_level = share_data.permission_level.value
 
+        note.revision = Note.revision + 1
         await db.commit()
         await db.refresh(note)
+        await shared_note_cache.invalidate(note.share_token)
 
         response.share_token = note.share_token
         response.share_url = f"/notes/shared/{note.share_token}"
@@ -581,7 +1511,10 @@ async def share_note(
             )
             db.add(permission)
 
+        # The note's permission list is part of its representation
+        note.revision = Note.revision + 1
         await db.commit()
+        await shared_note_cache.invalidate(note.share_token)
 
         # Get the permission with user info
         perm_result = await db.execute(
@@ -597,46 +1530,271 @@ async def share_note(
     return response
 
 
+async def _load_shared_note(share_token: str) -> Optional[dict]:
+    """
+    Render a shared note for the response cache.
+    Uses its own session, since the load may outlive the request that
+    triggered it when concurrent requests are coalesced. Loads stay on the
+    primary: a lagging replica read right after an invalidation would be
+    cached, and the cache already absorbs the repeated reads.
+    """
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(
+            select(Note)
+            .options(
+                joinedload(Note.owner),
+                joinedload(Note.permissions).joinedload(NotePermission.user),
+            )
+            .where(Note.share_token == share_token)
+        )
+        note = result.unique().scalar_one_or_none()
+
+        if not note:
+            return None
+
+        record = await content_store.get(db, content_ref(note))
+
+        if record is None:
+            raise HTTPException(
+                status_code=500, detail="Note content not found"
+            )
+
+        body = NoteDetailResponse(
+            id=note.id,
+            title=note.title,
+            note_type=note.note_type.value,
+            owner_id=note.owner_id,
+            is_public=note.is_public,
+            share_token=note.share_token,
+            revision=note.revision,
+            share_permission_level=note.share_permission_level,
+            created_at=note.created_at,
+            updated_at=note.updated_at,
+            content=record.content,
+            owner=note.owner,
+            permissions=note.permissions,
+        )
+
+        return {
+            "etag": note_etag(note),
+            "last_modified": note.updated_at.isoformat(),
+            "body": body.model_dump(mode="json"),
+        }
+
+
 @router.get("/shared/{share_token}", response_model=NoteDetailResponse)
-async def get_shared_note(
-    share_token: str,
-    db: AsyncSession = Depends(get_db),
-):
+async def get_shared_note(share_token: str, request: Request):
     """
     Access a note via share token.
+    Rendered responses are served from a read-through cache that coalesces
+    concurrent misses; conditional requests are answered with 304.
+    """
+    entry = await shared_note_cache.get_or_load(
+        share_token, lambda: _load_shared_note(share_token)
+    )
+
+    if entry is None:
+        raise HTTPException(status_code=404, detail="Note not found")
+
+    # Anyone holding the link may read it, so shared caches may store it
+    last_modified = datetime.fromisoformat(entry["last_modified"])
+    headers = cache_headers(entry["etag"], last_modified, public=True)
+    if is_not_modified(request, headers["ETag"], last_modified):
+        return not_modified_response(headers)
+
+    return JSONResponse(entry["body"], headers=headers)
+
+
+@router.get("/{note_id}/content")
+async def get_note_content(
+    note_id: UUID,
+    request: Request,
+    db: AsyncSession = Depends(get_read_db),
+    current_user: Optional[User] = Depends(get_current_user),
+):
+    """
+    Raw note content, streamed in chunks with the media type of the note's
+    type. Supports a single byte range (Range / If-Range) and conditional
+    requests, so editors can load very large notes lazily.
     """
     result = await db.execute(
         select(Note)
-        .options(selectinload(Note.owner), selectinload(Note.permissions))
-        .where(Note.share_token == share_token)
+        .options(joinedload(Note.owner), joinedload(Note.permissions))
+        .where(Note.id == note_id)
     )
-    note = result.scalar_one_or_none()
+    note = result.unique().scalar_one_or_none()
 
     if not note:
         raise HTTPException(status_code=404, detail="Note not found")
 
-    # Get content from MongoDB
-    mongo_db = get_mongo_db()
-    from bson.objectid import ObjectId
+    _check_read_access(note, current_user)
+
+    etag = note_etag(note)
+    headers = cache_headers(etag, note.updated_at, public=note.is_public)
+    if is_not_modified(request, etag, note.updated_at):
+        return not_modified_response(headers)
+
+    content = await content_store.open_stream(db, content_ref(note))
+    if content is None:
+        raise HTTPException(status_code=500, detail="Note content not found")
+
+    size = content.size
+    media_type = CONTENT_MEDIA_TYPES[note.note_type]
+    headers["Accept-Ranges"] = "bytes"
+    headers["X-Content-Type-Options"] = "nosniff"
+    # User-authored HTML must not run scripts on the API origin
+    headers["Content-Security-Policy"] = "sandbox"
+
+    byte_range = None
+    if if_range_matches(request, etag, note.updated_at):
+        try:
+            byte_range = parse_range(request.headers.get("range"), size)
+        except ValueError:
+            headers["Content-Range"] = f"bytes */{size}"
+            return Response(
+                status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+                headers=headers,
+            )
+
+    if byte_range is None:
+        headers["Content-Length"] = str(size)
+        return StreamingResponse(
+            content.read(0, None), media_type=media_type, headers=headers
+        )
+
+    first, last = byte_range
+    headers["Content-Range"] = f"bytes {first}-{last}/{size}"
+    headers["Content-Length"] = str(last - first + 1)
+    # Offsets refer to the identity encoding, so skip response compression
+    headers["Content-Encoding"] = "identity"
+    return StreamingResponse(
+        content.read(first, last + 1),
+        status_code=status.HTTP_206_PARTIAL_CONTENT,
+        media_type=media_type,
+        headers=headers,
+    )
+
 
-    content_doc = await mongo_db.note_contents.find_one(
-        {"_id": ObjectId(note.mongodb_content_id)}
+async def _load_note_for_history(
+    db: AsyncSession, note_id: UUID, current_user: Optional[User]
+) -> Note:
+    result = await db.execute(
+        select(Note)
+        .options(joinedload(Note.owner), joinedload(Note.permissions))
+        .where(Note.id == note_id)
     )
+    note = result.unique().scalar_one_or_none()
 
-    if not content_doc:
+    if not note:
+        raise HTTPException(status_code=404, detail="Note not found")
+
+    _check_read_access(note, current_user)
+    return note
+
+
+async def _version_content(db: AsyncSession, note: Note, revision: int) -> str:
+    """Content of note at revision, rebuilt from its history, or 404."""
+    ref = content_ref(note)
+    current = await content_store.get(db, ref)
+    if current is None:
         raise HTTPException(status_code=500, detail="Note content not found")
 
-    return NoteDetailResponse(
-        id=note.id,
-        title=note.title,
-        note_type=note.note_type.value,
-        owner_id=note.owner_id,
-        is_public=note.is_public,
-        share_token=note.share_token,
-        share_permission_level=note.share_permission_level,
-        created_at=note.created_at,
-        updated_at=note.updated_at,
-        content=content_doc["content"],
-        owner=note.owner,
-        permissions=note.permissions,
+    content = await content_at(db, ref, current, note.revision, revision)
+    if content is None:
+        raise HTTPException(status_code=404, detail="Revision not available")
+    return content
+
+
+@router.get("/{note_id}/versions", response_model=List[NoteVersionResponse])
+async def list_note_versions(
+    note_id: UUID,
+    response: Response,
+    db: AsyncSession = Depends(get_read_db),
+    current_user: Optional[User] = Depends(get_current_user),
+    before: Optional[int] = None,
+    limit: int = Query(50, ge=1, le=500),
+):
+    """
+    List the saved content revisions of a note, newest first. Pass the
+    X-Next-Cursor response header back as ``before`` for the next page.
+    """
+    note = await _load_note_for_history(db, note_id, current_user)
+    versions = await content_store.list_versions(
+        db, content_ref(note), before, limit
+    )
+
+    if versions and len(versions) == limit:
+        response.headers[NEXT_CURSOR_HEADER] = str(versions[-1]["revision"])
+
+    return [
+        NoteVersionResponse(
+            revision=version["revision"],
+            created_at=version["created_at"],
+            user_id=version.get("user_id"),
+            size=version["size"],
+            snapshot=version.get("snapshot", False),
+        )
+        for version in versions
+    ]
+
+
+@router.get(
+    "/{note_id}/versions/content", response_model=NoteVersionContentResponse
+)
+async def get_note_version_content(
+    note_id: UUID,
+    db: AsyncSession = Depends(get_read_db),
+    current_user: Optional[User] = Depends(get_current_user),
+    revision: Optional[int] = Query(None, ge=1),
+    at: Optional[datetime] = None,
+):
+    """
+    Content of a note as of a revision, or as of a point in time (``at``).
+    The content is rebuilt from the nearest snapshot by applying only the
+    deltas recorded since, so the cost is bounded whatever the revision.
+    """
+    if (revision is None) == (at is None):
+        raise HTTPException(
+            status_code=400, detail="Provide exactly one of revision or at"
+        )
+
+    note = await _load_note_for_history(db, note_id, current_user)
+
+    if at is not None:
+        if at.tzinfo is not None:
+            at = at.astimezone(timezone.utc).replace(tzinfo=None)
+        if at < note.created_at:
+            raise HTTPException(
+                status_code=404, detail="Note did not exist at that time"
+            )
+        revision = await revision_at(db, content_ref(note), at)
+        if revision is None:
+            revision = note.revision
+
+    content = await _version_content(db, note, revision)
+    return NoteVersionContentResponse(
+        id=note.id, revision=revision, content=content
+    )
+
+
+@router.post(
+    "/{note_id}/versions/{revision}/restore",
+    response_model=NoteDetailResponse,
+)
+async def restore_note_version(
+    note_id: UUID,
+    revision: int,
+    db: AsyncSession = Depends(get_db),
+    current_user: Optional[User] = Depends(get_current_user),
+):
+    """
+    Restore a note's content to an earlier revision. The restored content
+    is saved as a new revision, so the restore itself can be undone.
+    """
+    note = await _load_note_for_history(db, note_id, current_user)
+    await _check_write_access(db, note, current_user)
+
+    content = await _version_content(db, note, revision)
+    return await update_note(
+        note_id, NoteUpdate(content=content), db=db, current_user=current_user
     )
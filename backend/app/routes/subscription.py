@@ -4,17 +4,20 @@ from typing import Optional
 
 import stripe
 from fastapi import APIRouter, Depends, Header, HTTPException, Request
-from sqlalchemy import func, select
+from sqlalchemy import select, update
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm.attributes import set_committed_value
 
 from app.auth import get_current_user
-from app.database import get_db
-from app.models import Note, Subscription, SubscriptionStatus, User
+from app.config import settings
+from app.database import get_db, get_read_db
+from app.models import Subscription, SubscriptionStatus, User
 from app.schemas import (
     CheckoutSessionRequest,
     CheckoutSessionResponse,
     SubscriptionResponse,
 )
+from app.stripe_client import get_stripe_client, idempotency_key
 
 router = APIRouter()
 
@@ -25,6 +28,27 @@ STRIPE_WEBHOOK_SECRET = os.getenv("STRIPE_WEBHOOK_SECRET")
 FRONTEND_URL = os.getenv("FRONTEND_URL", "http://localhost:3000")
 
 
+def _stripe_failure(action: str, e: stripe.error.StripeError):
+    """HTTP error for a failed Stripe call, by the kind of failure."""
+    if isinstance(e, stripe.error.CardError):
+        return HTTPException(
+            status_code=402, detail=f"{action}: {e.user_message}"
+        )
+    if isinstance(e, stripe.error.RateLimitError):
+        return HTTPException(
+            status_code=503,
+            detail=f"{action}: payment provider is busy, try again later",
+        )
+    if isinstance(e, (stripe.error.APIConnectionError, stripe.error.APIError)):
+        return HTTPException(
+            status_code=502,
+            detail=f"{action}: payment provider unavailable",
+        )
+    # Invalid request, authentication, permission or idempotency errors
+    # mean our own request or configuration is wrong
+    return HTTPException(status_code=500, detail=f"{action}: {e}")
+
+
 @router.post(
     "/create-checkout-session", response_model=CheckoutSessionResponse
 )
@@ -48,15 +72,31 @@ async def create_checkout_session(
     try:
         # Create or get Stripe customer
         if not current_user.stripe_customer_id:
-            customer = stripe.Customer.create(
-                email=current_user.email,
-                metadata={"user_id": str(current_user.id)},
+            # A retried request gets the customer its first attempt made
+            params = {
+                "email": current_user.email,
+                "metadata": {"user_id": str(current_user.id)},
+            }
+            customer = await get_stripe_client().create_customer(
+                idempotency_key=idempotency_key(
+                    "customer", current_user.id, params
+                ),
+                **params,
+            )
+            # current_user may come from a read session, so is not
+            # written through this one
+            await db.execute(
+                update(User)
+                .where(User.id == current_user.id)
+                .values(stripe_customer_id=customer.id)
             )
-            current_user.stripe_customer_id = customer.id
             await db.commit()
+            set_committed_value(
+                current_user, "stripe_customer_id", customer.id
+            )
 
         # Create checkout session
-        checkout_session = stripe.checkout.Session.create(
+        checkout_session = await get_stripe_client().create_checkout_session(
             customer=current_user.stripe_customer_id,
             payment_method_types=["card"],
             line_items=[
@@ -74,6 +114,8 @@ async def create_checkout_session(
         return CheckoutSessionResponse(
             checkout_url=checkout_session.url, session_id=checkout_session.id
         )
+    except stripe.error.StripeError as e:
+        raise _stripe_failure("Failed to create checkout session", e)
     except Exception as e:
         raise HTTPException(
             status_code=500,
@@ -101,28 +143,30 @@ async def get_subscription(
 @router.get("/note-limit")
 async def get_note_limit(
     current_user: Optional[User] = Depends(get_current_user),
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
 ):
     """Get note limit information for current user"""
     # If no user (not even anonymous), return default limits
     if current_user is None:
         return {
             "note_count": 0,
-            "limit": 3,
+            "limit": settings.FREE_NOTE_LIMIT,
             "can_create_more": True,
             "is_premium": False,
         }
 
-    # Count user's notes
-    note_count_query = select(func.count(Note.id)).where(
-        Note.owner_id == current_user.id
+    # Maintained counter (primary-key lookup); anonymous users without a
+    # row yet have no notes
+    result = await db.execute(
+        select(User.note_count).where(User.id == current_user.id)
     )
-    result = await db.execute(note_count_query)
-    note_count = result.scalar()
+    note_count = result.scalar_one_or_none() or 0
 
-    # Free users have a limit of 3 notes
-    limit = 3 if not current_user.is_premium else None
-    can_create_more = current_user.is_premium or (note_count < 3)
+    # Free users have a limit of FREE_NOTE_LIMIT notes
+    limit = settings.FREE_NOTE_LIMIT if not current_user.is_premium else None
+    can_create_more = current_user.is_premium or (
+        note_count < settings.FREE_NOTE_LIMIT
+    )
 
     return {
         "note_count": note_count,
@@ -150,7 +194,7 @@ async def cancel_subscription(
 
     try:
         # Cancel at period end in Stripe
-        stripe.Subscription.modify(
+        await get_stripe_client().modify_subscription(
             subscription.stripe_subscription_id, cancel_at_period_end=True
         )
 
@@ -160,6 +204,8 @@ async def cancel_subscription(
         return {
             "message": "Subscription will be canceled at the end of the billing period"  # noqa: E501
         }
+    except stripe.error.StripeError as e:
+        raise _stripe_failure("Failed to cancel subscription", e)
     except Exception as e:
         raise HTTPException(
             status_code=500, detail=f"Failed to cancel subscription: {str(e)}"
@@ -190,7 +236,7 @@ async def stripe_webhook(
         user_id = session["metadata"]["user_id"]
 
         # Get subscription details from Stripe
-        stripe_subscription = stripe.Subscription.retrieve(
+        stripe_subscription = await get_stripe_client().retrieve_subscription(
             session["subscription"]
         )
 
@@ -4,13 +4,25 @@ import logging
 from datetime import datetime
 from typing import Dict, Optional, Set
 
-from bson.objectid import ObjectId
-from fastapi import APIRouter, Query, WebSocket, WebSocketDisconnect
-from sqlalchemy import select
+from fastapi import (
+    APIRouter,
+    HTTPException,
+    Query,
+    WebSocket,
+    WebSocketDisconnect,
+)
+from sqlalchemy import select, update
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.database import get_db, get_mongo_db
+from app.auth import get_current_user_ws
+from app.cache import shared_note_cache
+from app.config import settings
+from app.content_store import ContentRef, content_ref, content_store
+from app.database import AsyncSessionLocal, get_db
 from app.models import Note, NotePermission, PermissionLevel, User
+from app.note_history import save_content
+from app.note_stats import content_stats
+from app.search import plain_text, search_vector
 
 logger = logging.getLogger(__name__)
 
@@ -25,6 +37,8 @@ class ConnectionManager:
         self.active_connections: Dict[str, Set[tuple]] = {}
         # note_id -> current content (in-memory state for real-time sync)
         self.current_content: Dict[str, str] = {}
+        # note_id -> pending write of current_content to MongoDB
+        self.flush_tasks: Dict[str, asyncio.Task] = {}
         self.lock = asyncio.Lock()
 
     async def connect(
@@ -125,6 +139,36 @@ class ConnectionManager:
             }
         )
 
+    def schedule_flush(self, note_id: str):
+        """
+        Persist the note's in-memory content once edits have been quiet for
+        CONTENT_FLUSH_DELAY_SECONDS, so a burst of keystrokes is one write.
+        """
+        task = self.flush_tasks.get(note_id)
+        if task is not None:
+            task.cancel()
+        self.flush_tasks[note_id] = asyncio.create_task(
+            self._flush_later(note_id)
+        )
+
+    async def _flush_later(self, note_id: str):
+        await asyncio.sleep(settings.CONTENT_FLUSH_DELAY_SECONDS)
+        # Once writing, a newer edit schedules a new flush instead of
+        # cancelling this one
+        if self.flush_tasks.get(note_id) is asyncio.current_task():
+            del self.flush_tasks[note_id]
+        await materialize_content(note_id)
+
+    async def flush_all(self):
+        """Write all pending content immediately (on shutdown)."""
+        pending = list(self.flush_tasks)
+        for task in self.flush_tasks.values():
+            task.cancel()
+        self.flush_tasks.clear()
+        await asyncio.gather(
+            *(materialize_content(note_id) for note_id in pending)
+        )
+
     def get_active_users(self, note_id: str) -> list:
         """Get list of active users for a note."""
         if note_id not in self.active_connections:
@@ -139,6 +183,69 @@ class ConnectionManager:
 manager = ConnectionManager()
 
 
+async def materialize_content(note_id: str):
+    """
+    Write a real-time session's in-memory content to the content store,
+    bumping the note's revision and search index like an HTTP save, and
+    drop the note's cached shared view now that storage has changed.
+    """
+    if note_id not in manager.current_content:
+        return
+
+    from uuid import UUID
+
+    now = datetime.utcnow()
+    try:
+        async with AsyncSessionLocal() as db:
+            # Locks the row, serializing with HTTP saves until commit
+            result = await db.execute(
+                update(Note)
+                .where(Note.id == UUID(note_id))
+                .values(revision=Note.revision + 1, updated_at=now)
+                .returning(
+                    Note.revision,
+                    Note.title,
+                    Note.note_type,
+                    Note.mongodb_content_id,
+                    Note.share_token,
+                )
+                .execution_options(synchronize_session=False)
+            )
+            row = result.one_or_none()
+            # Read under the lock: an HTTP save that committed meanwhile
+            # has cleared the in-memory content, and wins
+            content = manager.current_content.get(note_id)
+            if row is None or content is None:
+                return
+            revision, title, note_type, content_id, share_token = row
+
+            await db.execute(
+                update(Note)
+                .where(Note.id == UUID(note_id))
+                .values(
+                    search_vector=search_vector(
+                        title, plain_text(content, note_type)
+                    ),
+                    updated_at=now,
+                    **content_stats(content, note_type),
+                )
+                .execution_options(synchronize_session=False)
+            )
+
+            await save_content(
+                db,
+                ContentRef(UUID(note_id), content_id),
+                revision,
+                content,
+                now,
+            )
+            await db.commit()
+
+        await shared_note_cache.invalidate(share_token)
+    except Exception as e:
+        logger.error(f"Error persisting content for note {note_id}: {e}")
+
+
 async def verify_note_access(
     note_id: str, user_id: Optional[str], db: AsyncSession
 ) -> bool:
@@ -246,54 +353,29 @@ async def websocket_endpoint(
     websocket: WebSocket,
     note_id: str,
     token: Optional[str] = Query(None),
-    user_id: Optional[str] = Query(None),
+    anonymous_token: Optional[str] = Query(None),
     username: Optional[str] = Query("Anonymous"),
 ):
     """
     WebSocket endpoint for real-time collaboration on a note.
     Real-time collaboration is only available for premium users.
+    Users are identified by a Keycloak token or a signed anonymous token
+    (see get_current_user_ws), never by a bare user id.
     """
     # Get database session
     async for db in get_db():
-        # If token provided but no user_id, authenticate using token
-        actual_user_id = user_id
-        actual_username = username
-
-        if token and (not user_id or user_id == ""):
-            from fastapi import Response
-            from fastapi.security import HTTPAuthorizationCredentials
-
-            from app.auth import get_current_user
-
-            # Create a mock request with the token
-            class MockRequest:
-                def __init__(self, token):
-                    self._token = token
-                    self.headers = {"Authorization": f"Bearer {token}"}
-                    self.cookies = {}
-
-                def headers_get(self, key):
-                    return self.headers.get(key)
-
-            try:
-                mock_request = MockRequest(token)
-                mock_response = Response()
-                credentials = HTTPAuthorizationCredentials(
-                    scheme="Bearer", credentials=token
-                )
+        try:
+            user = await get_current_user_ws(
+                websocket, db, token, anonymous_token
+            )
+        except HTTPException:
+            await websocket.close(code=1008, reason="Access denied")
+            return
 
-                # Get user from token
-                authenticated_user = await get_current_user(
-                    mock_request, mock_response, credentials, db
-                )
-                if authenticated_user:
-                    actual_user_id = str(authenticated_user.id)
-                    actual_username = authenticated_user.username or "User"
-                    logger.info(
-                        f"WebSocket authenticated via token: user_id={actual_user_id}"  # noqa: E501
-                    )
-            except Exception as e:
-                logger.error(f"Error authenticating WebSocket via token: {e}")
+        actual_user_id = str(user.id) if user else None
+        actual_username = username
+        if user and not user.is_anonymous:
+            actual_username = user.username or "User"
 
         # Verify access
         has_access = await verify_note_access(note_id, actual_user_id, db)
@@ -350,7 +432,7 @@ async def websocket_endpoint(
 
                     # Verify write permission
                     has_write = await verify_write_permission(
-                        note_id, user_id, db
+                        note_id, actual_user_id, db
                     )
 
                     if not has_write:
@@ -362,8 +444,7 @@ async def websocket_endpoint(
                         )
                         continue
 
-                    # Store operation in MongoDB for operational transformation
-                    mongo_db = get_mongo_db()
+                    # Store operation for operational transformation
                     from uuid import UUID
 
                     note_result = await db.execute(
@@ -377,18 +458,19 @@ async def websocket_endpoint(
                             "position": message.get("position"),
                             "content": message.get("content"),
                             "length": message.get("length"),
-                            "user_id": user_id,
+                            "user_id": actual_user_id,
                             "timestamp": datetime.utcnow(),
                         }
 
-                        # Update note content and add operation
-                        await mongo_db.note_contents.update_one(
-                            {"_id": ObjectId(note.mongodb_content_id)},
-                            {
-                                "$push": {"operations": operation},
-                                "$set": {"updated_at": datetime.utcnow()},
-                            },
+                        # Add operation to the note's operation log
+                        await content_store.append_operation(
+                            db, content_ref(note), operation
                         )
+                        await db.commit()
+
+                        # Only content seeded from storage (get_content) is
+                        # complete enough to be kept and written back
+                        seeded = note_id in manager.current_content
 
                         # Apply operation to in-memory content
                         current = manager.current_content.get(note_id, "")
@@ -408,15 +490,17 @@ async def websocket_endpoint(
                                 + current[pos + length :]
                             )
 
-                        manager.current_content[note_id] = current
+                        if seeded:
+                            manager.current_content[note_id] = current
+                            manager.schedule_flush(note_id)
 
                         # Broadcast edit to other users
                         await manager.broadcast_to_note(
                             note_id,
                             {
                                 "type": "edit",
-                                "user_id": user_id,
-                                "username": username,
+                                "user_id": actual_user_id,
+                                "username": actual_username,
                                 "operation": message.get("operation"),
                                 "position": message.get("position"),
                                 "content": message.get("content"),
@@ -442,8 +526,8 @@ async def websocket_endpoint(
                         note_id,
                         {
                             "type": "cursor",
-                            "user_id": user_id,
-                            "username": username,
+                            "user_id": actual_user_id,
+                            "username": actual_username,
                             "position": message.get("position"),
                             "selection_end": message.get("selection_end"),
                             "timestamp": datetime.utcnow().isoformat(),
@@ -452,9 +536,8 @@ async def websocket_endpoint(
                     )
 
                 elif message_type == "get_content":
-                    # Always fetch fresh content from MongoDB to avoid stale cache  # noqa: E501
+                    # Always fetch fresh content from storage to avoid stale cache  # noqa: E501
                     # This is important for free users who save via HTTP PUT
-                    mongo_db = get_mongo_db()
                     from uuid import UUID
 
                     note_result = await db.execute(
@@ -464,12 +547,10 @@ async def websocket_endpoint(
 
                     content = ""
                     if note:
-                        content_doc = await mongo_db.note_contents.find_one(
-                            {"_id": ObjectId(note.mongodb_content_id)}
-                        )
+                        record = await content_store.get(db, content_ref(note))
 
-                        if content_doc:
-                            content = content_doc.get("content", "")
+                        if record:
+                            content = record.content
                             # Update in-memory cache for premium users' real-time sync  # noqa: E501
                             manager.current_content[note_id] = content
 
@@ -491,9 +572,13 @@ async def websocket_endpoint(
                     )
 
         except WebSocketDisconnect:
-            await manager.disconnect(websocket, note_id, user_id, username)
+            await manager.disconnect(
+                websocket, note_id, actual_user_id, actual_username
+            )
         except Exception as e:
             logger.error(f"WebSocket error: {e}")
-            await manager.disconnect(websocket, note_id, user_id, username)
+            await manager.disconnect(
+                websocket, note_id, actual_user_id, actual_username
+            )
 
         break
@@ -3,7 +3,7 @@ from enum import Enum
 from typing import List, Optional
 from uuid import UUID
 
-from pydantic import BaseModel, ConfigDict, EmailStr, Field
+from pydantic import BaseModel, ConfigDict, EmailStr, Field, model_validator
 
 
 class PermissionLevel(str, Enum):
@@ -24,6 +24,12 @@ class NoteType(str, Enum):
     CODE = "code"
 
 
+class EditOperation(str, Enum):
+    INSERT = "insert"
+    DELETE = "delete"
+    REPLACE = "replace"
+
+
 # User Schemas
 class UserBase(BaseModel):
     email: Optional[EmailStr] = None
@@ -81,6 +87,36 @@ class NoteUpdate(BaseModel):
     is_public: Optional[bool] = None
 
 
+class ContentEdit(BaseModel):
+    operation: EditOperation
+    position: int = Field(..., ge=0)
+    content: Optional[str] = None
+    length: Optional[int] = Field(None, ge=0)
+
+
+class NotePatch(BaseModel):
+    """
+    Content delta against base_revision: either positional edits or a
+    unified diff.
+    """
+
+    base_revision: int
+    edits: Optional[List[ContentEdit]] = None
+    diff: Optional[str] = None
+
+    @model_validator(mode="after")
+    def check_one_delta(self):
+        if (self.edits is None) == (self.diff is None):
+            raise ValueError("Provide exactly one of edits or diff")
+        return self
+
+
+class NotePatchResponse(BaseModel):
+    id: UUID
+    revision: int
+    updated_at: datetime
+
+
 class NoteResponse(BaseModel):
     id: UUID
     title: str
@@ -89,18 +125,41 @@ class NoteResponse(BaseModel):
     is_public: bool
     share_token: Optional[str]
     share_permission_level: Optional[str] = None
+    revision: int
     created_at: datetime
     updated_at: datetime
 
     model_config = ConfigDict(from_attributes=True)
 
 
+class NoteSummaryResponse(NoteResponse):
+    """Listing entry; previews and stats are stored on the note row."""
+
+    content_preview: Optional[str] = None
+    char_count: int
+    line_count: int
+    word_count: int
+    content_hash: Optional[str] = None
+
+
 class NoteDetailResponse(NoteResponse):
     content: str
     owner: Optional[UserResponse] = None
     permissions: List["NotePermissionResponse"] = []
 
 
+class NoteChangesResponse(BaseModel):
+    notes: List[NoteSummaryResponse]
+    deleted: List[UUID]
+    next_token: str
+    has_more: bool
+
+
+class NoteSearchResult(NoteSummaryResponse):
+    rank: float
+    snippet: Optional[str] = None
+
+
 # Permission Schemas
 class NotePermissionCreate(BaseModel):
     user_id: Optional[UUID] = None
@@ -130,6 +189,62 @@ class ShareNoteResponse(BaseModel):
     permission: Optional[NotePermissionResponse] = None
 
 
+# Batch Schemas
+MAX_BATCH_SIZE = 1000
+
+
+class NoteBatchIds(BaseModel):
+    note_ids: List[UUID] = Field(..., min_length=1, max_length=MAX_BATCH_SIZE)
+
+
+class NoteBatchCreate(BaseModel):
+    notes: List[NoteCreate] = Field(
+        ..., min_length=1, max_length=MAX_BATCH_SIZE
+    )
+
+
+class NoteBatchResult(BaseModel):
+    """Outcome of one batch item, in request order."""
+
+    id: Optional[UUID] = None
+    status_code: int
+    detail: Optional[str] = None
+    note: Optional[NoteDetailResponse] = None
+
+
+class NoteBatchResponse(BaseModel):
+    results: List[NoteBatchResult]
+
+
+class NoteVersionResponse(BaseModel):
+    """A saved content revision; snapshot versions store the full content."""
+
+    revision: int
+    created_at: datetime
+    user_id: Optional[UUID] = None
+    size: int
+    snapshot: bool = False
+
+
+class NoteVersionContentResponse(BaseModel):
+    id: UUID
+    revision: int
+    content: str
+
+
+class NoteImportError(BaseModel):
+    """A rejected import record, labelled by NDJSON line or ZIP entry."""
+
+    record: str
+    status_code: int
+    detail: str
+
+
+class NoteImportResponse(BaseModel):
+    created: int
+    errors: List[NoteImportError]
+
+
 # WebSocket Schemas
 class WSMessage(BaseModel):
     type: str  # "join", "leave", "edit", "cursor", "user_list"
@@ -0,0 +1,170 @@
+"""
+Full-text search over note titles and content.
+
+notes.search_vector holds the title (weight A) and the plain text of the
+content (weight B). Content lives in MongoDB, so the application rebuilds
+the vector whenever the title or content changes.
+"""
+
+import html
+from html.parser import HTMLParser
+from typing import Dict, Iterable, Tuple
+from uuid import UUID
+
+from sqlalchemy import (
+    String,
+    Text,
+    column,
+    func,
+    literal_column,
+    select,
+    update,
+    values,
+)
+from sqlalchemy.dialects.postgresql import TSVECTOR
+from sqlalchemy.dialects.postgresql import UUID as PG_UUID
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.models import Note, NoteType
+
+# Highlight delimiters for ts_headline (private-use characters, stripped
+# from the text beforehand), replaced by <mark> once the snippet is escaped
+_START_SEL = "\ue000"
+_STOP_SEL = "\ue001"
+_HEADLINE_OPTIONS = (
+    f"StartSel={_START_SEL}, StopSel={_STOP_SEL}, "
+    'MaxWords=35, MinWords=15, MaxFragments=2, FragmentDelimiter=" … "'
+)
+
+
+# Tags that start a new line of text; inline tags (<b>, <a>, ...) may split
+# a word
+_BLOCK_TAGS = set(
+    "blockquote br div h1 h2 h3 h4 h5 h6 hr li ol p pre td th tr ul".split()
+)
+
+
+class _TextExtractor(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag in _BLOCK_TAGS:
+            self.parts.append("\n")
+
+    def handle_endtag(self, tag):
+        if tag in _BLOCK_TAGS:
+            self.parts.append("\n")
+
+    def handle_data(self, data):
+        self.parts.append(data)
+
+
+def extract_text(content: str, note_type: NoteType) -> str:
+    """Text of note content; rich-text HTML is reduced to its text."""
+    if note_type == NoteType.CODE:
+        return content
+    extractor = _TextExtractor()
+    extractor.feed(content)
+    extractor.close()
+    return "".join(extractor.parts)
+
+
+def plain_text(content: str, note_type: NoteType) -> str:
+    """Searchable text of note content, up to SEARCH_MAX_CONTENT_CHARS."""
+    return extract_text(content, note_type)[
+        : settings.SEARCH_MAX_CONTENT_CHARS
+    ]
+
+
+def search_vector(title, text=None):
+    """
+    SQL expression for notes.search_vector. Without text, the indexed
+    content is kept and only the title part is rebuilt.
+    """
+    config = settings.SEARCH_TEXT_CONFIG
+    vector = func.setweight(
+        func.to_tsvector(config, title), literal_column("'A'")
+    )
+    if text is None:
+        content_vector = func.ts_filter(
+            func.coalesce(Note.search_vector, literal_column("''::tsvector")),
+            literal_column("'{b}'"),
+        )
+    else:
+        content_vector = func.setweight(
+            func.to_tsvector(config, text), literal_column("'B'")
+        )
+    return vector.op("||", return_type=TSVECTOR)(content_vector)
+
+
+def search_query(q: str):
+    """tsquery for user input (quoted phrases, OR and -negation)."""
+    return func.websearch_to_tsquery(settings.SEARCH_TEXT_CONFIG, q)
+
+
+async def index_notes(db: AsyncSession, docs: Iterable[Tuple[UUID, str, str]]):
+    """
+    Rebuild search vectors from (note_id, title, plain text) rows in one
+    UPDATE. Takes effect on commit.
+    """
+    rows = list(docs)
+    if not rows:
+        return
+    data = values(
+        column("id", PG_UUID(as_uuid=True)),
+        column("title", String),
+        column("body", Text),
+        name="docs",
+    ).data(rows)
+    await db.execute(
+        update(Note)
+        .where(Note.id == data.c.id)
+        .values(
+            search_vector=search_vector(data.c.title, data.c.body),
+            # Reindexing alone is not a modification of the note
+            updated_at=Note.updated_at,
+        )
+        .execution_options(synchronize_session=False)
+    )
+
+
+async def highlight(
+    db: AsyncSession, q: str, docs: Dict[UUID, str]
+) -> Dict[UUID, str]:
+    """
+    HTML-safe snippets of each document's plain text around the matches of
+    q, with matches wrapped in <mark>. Uses PostgreSQL's ts_headline so
+    highlighted words agree with what the search matched (stemming).
+    """
+    if not docs:
+        return {}
+    data = values(
+        column("id", PG_UUID(as_uuid=True)),
+        column("body", Text),
+        name="docs",
+    ).data(
+        [
+            (note_id, body.replace(_START_SEL, "").replace(_STOP_SEL, ""))
+            for note_id, body in docs.items()
+        ]
+    )
+    result = await db.execute(
+        select(
+            data.c.id,
+            func.ts_headline(
+                settings.SEARCH_TEXT_CONFIG,
+                data.c.body,
+                search_query(q),
+                _HEADLINE_OPTIONS,
+            ),
+        )
+    )
+    return {
+        note_id: html.escape(" ".join(snippet.split()))
+        .replace(_START_SEL, "<mark>")
+        .replace(_STOP_SEL, "</mark>")
+        for note_id, snippet in result.all()
+    }
@@ -0,0 +1,258 @@
+import asyncio
+import hashlib
+import json
+import logging
+import uuid
+from typing import Any, List, Optional, Tuple
+from urllib.parse import urlencode
+
+import httpx
+import stripe
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Seconds before the first retry, doubling for each further one
+RETRY_BASE_DELAY = 0.5
+
+
+def _encode_params(params: dict, prefix: str = "") -> List[Tuple[str, str]]:
+    """
+    Flatten params into Stripe's form encoding, e.g.
+    {"metadata": {"user_id": "1"}} -> [("metadata[user_id]", "1")].
+    """
+    pairs: List[Tuple[str, str]] = []
+    for key, value in params.items():
+        name = f"{prefix}[{key}]" if prefix else str(key)
+        if value is None:
+            continue
+        if isinstance(value, dict):
+            pairs.extend(_encode_params(value, name))
+        elif isinstance(value, (list, tuple)):
+            pairs.extend(
+                _encode_params(dict(enumerate(value)), name)
+                if value
+                else [(name, "")]
+            )
+        elif isinstance(value, bool):
+            pairs.append((name, "true" if value else "false"))
+        else:
+            pairs.append((name, str(value)))
+    return pairs
+
+
+def idempotency_key(scope: str, user_id: Any, params: dict) -> str:
+    """
+    Idempotency key for a create call made for a user, derived from the
+    request. Repeating the same request (same user and parameters) gets the
+    first result back. A changed one, e.g. after an email change, gets a new
+    key instead of the IdempotencyError Stripe raises when a key is reused
+    with different parameters within its 24 hour window.
+    """
+    request = json.dumps([str(user_id), params], sort_keys=True, default=str)
+    return f"{scope}-{hashlib.sha256(request.encode()).hexdigest()}"
+
+
+def _should_retry(response: httpx.Response) -> bool:
+    """Stripe's retry rules: its explicit hint, else conflicts and 5xx."""
+    hint = response.headers.get("Stripe-Should-Retry")
+    if hint is not None:
+        return hint == "true"
+    return response.status_code == 409 or response.status_code >= 500
+
+
+def _api_error(
+    response: httpx.Response, body: Any, error: dict
+) -> stripe.error.StripeError:
+    """
+    The SDK exception for an error response, as the SDK itself maps them,
+    so callers can tell card, invalid request, authentication and rate
+    limit errors apart.
+    """
+    status = response.status_code
+    message = error.get("message", "Stripe request failed")
+    details = dict(
+        http_body=response.text,
+        http_status=status,
+        json_body=body,
+        headers=dict(response.headers),
+    )
+    if status == 429 or (status == 400 and error.get("code") == "rate_limit"):
+        return stripe.error.RateLimitError(message, **details)
+    if status in (400, 404):
+        if error.get("type") == "idempotency_error":
+            return stripe.error.IdempotencyError(message, **details)
+        return stripe.error.InvalidRequestError(
+            message, error.get("param"), error.get("code"), **details
+        )
+    if status == 401:
+        return stripe.error.AuthenticationError(message, **details)
+    if status == 402:
+        return stripe.error.CardError(
+            message, error.get("param"), error.get("code"), **details
+        )
+    if status == 403:
+        return stripe.error.PermissionError(message, **details)
+    return stripe.error.APIError(message, **details)
+
+
+class StripeClient:
+    """
+    Non-blocking Stripe API client.
+
+    The Stripe SDK is synchronous, so calling it from an async handler
+    blocks the event loop (and every WebSocket on the pod) for the whole
+    HTTP round trip. This client talks to the same REST API over a pooled
+    httpx.AsyncClient with timeouts, and returns SDK StripeObjects so
+    callers keep attribute access. Point STRIPE_API_BASE at stripe-mock
+    to run against a local fake server.
+    """
+
+    def __init__(
+        self,
+        api_key: Optional[str],
+        base_url: str = settings.STRIPE_API_BASE,
+        timeout: float = settings.STRIPE_TIMEOUT_SECONDS,
+        max_connections: int = settings.STRIPE_MAX_CONNECTIONS,
+        max_retries: int = settings.STRIPE_MAX_RETRIES,
+    ):
+        self.api_key = api_key
+        self.base_url = base_url
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self.max_retries = max_retries
+        self._client: Optional[httpx.AsyncClient] = None
+
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                timeout=httpx.Timeout(self.timeout),
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections,
+                ),
+            )
+        return self._client
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def _request(
+        self,
+        method: str,
+        path: str,
+        params: Optional[dict] = None,
+        idempotency_key: Optional[str] = None,
+    ) -> Any:
+        """
+        Send a request to the Stripe API, retrying connection errors and
+        responses Stripe marks as retryable. POSTs carry an idempotency
+        key (a fresh one unless given), reused by the retries, so a retry
+        never creates a second object or charge.
+        """
+        headers = {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/x-www-form-urlencoded",
+            "Stripe-Version": stripe.api_version,
+        }
+        if method == "POST":
+            headers["Idempotency-Key"] = idempotency_key or str(uuid.uuid4())
+        content = urlencode(_encode_params(params or {}))
+
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                await asyncio.sleep(
+                    min(RETRY_BASE_DELAY * 2 ** (attempt - 1), 2.0)
+                )
+            try:
+                response = await self._get_client().request(
+                    method, path, content=content, headers=headers
+                )
+            except httpx.HTTPError as e:
+                if attempt < self.max_retries:
+                    continue
+                reason = (
+                    "timed out"
+                    if isinstance(e, httpx.TimeoutException)
+                    else "failed"
+                )
+                raise stripe.error.APIConnectionError(
+                    f"Request to Stripe {reason}: {e}"
+                )
+            if attempt < self.max_retries and _should_retry(response):
+                continue
+            return self._interpret(method, path, response)
+
+    def _interpret(self, method: str, path: str, response) -> Any:
+        try:
+            body = response.json()
+        except ValueError:
+            raise stripe.error.APIError(
+                "Invalid response from Stripe",
+                http_body=response.text,
+                http_status=response.status_code,
+            )
+
+        if response.is_error:
+            error = body.get("error", {}) if isinstance(body, dict) else {}
+            logger.error(
+                f"Stripe {method} {path} failed ({response.status_code}, "
+                f"{error.get('type')}): {error.get('message')}"
+            )
+            raise _api_error(response, body, error)
+
+        return stripe.util.convert_to_stripe_object(body, self.api_key)
+
+    async def create_customer(
+        self, idempotency_key: Optional[str] = None, **params
+    ) -> Any:
+        return await self._request(
+            "POST", "/v1/customers", params, idempotency_key
+        )
+
+    async def create_checkout_session(
+        self, idempotency_key: Optional[str] = None, **params
+    ) -> Any:
+        return await self._request(
+            "POST", "/v1/checkout/sessions", params, idempotency_key
+        )
+
+    async def retrieve_subscription(self, subscription_id: str) -> Any:
+        return await self._request(
+            "GET", f"/v1/subscriptions/{subscription_id}"
+        )
+
+    async def modify_subscription(
+        self,
+        subscription_id: str,
+        idempotency_key: Optional[str] = None,
+        **params,
+    ) -> Any:
+        return await self._request(
+            "POST",
+            f"/v1/subscriptions/{subscription_id}",
+            params,
+            idempotency_key,
+        )
+
+
+_stripe_client: Optional[StripeClient] = None
+
+
+def get_stripe_client() -> StripeClient:
+    """The process's Stripe client, built from settings on first use."""
+    global _stripe_client
+    if _stripe_client is None:
+        _stripe_client = StripeClient(api_key=settings.STRIPE_SECRET_KEY)
+    return _stripe_client
+
+
+async def close_stripe_client():
+    global _stripe_client
+    if _stripe_client is not None:
+        await _stripe_client.close()
+        _stripe_client = None
@@ -0,0 +1,74 @@
+"""
+Shared test fixtures.
+
+Tests that need PostgreSQL run against the database in TEST_DATABASE_URL
+(which they migrate to the latest revision and empty between tests) and
+are skipped when it is not set. Never point it at a database whose data
+you want to keep.
+"""
+
+import os
+from pathlib import Path
+
+import pytest
+
+TEST_DATABASE_URL = os.environ.get("TEST_DATABASE_URL")
+
+# Configure the app before anything imports app.config
+os.environ.setdefault("ENVIRONMENT", "test")
+if TEST_DATABASE_URL:
+    os.environ["DATABASE_URL"] = TEST_DATABASE_URL
+
+from sqlalchemy import text  # noqa: E402
+from sqlalchemy.ext.asyncio import (  # noqa: E402
+    AsyncSession,
+    async_sessionmaker,
+    create_async_engine,
+)
+
+from app.database import Base  # noqa: E402
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+
+@pytest.fixture(scope="session")
+def migrated_database():
+    """Migrate the test database to the latest revision, once per run."""
+    if not TEST_DATABASE_URL:
+        pytest.skip("TEST_DATABASE_URL is not set")
+
+    from alembic import command
+    from alembic.config import Config
+
+    config = Config(str(BACKEND_DIR / "alembic.ini"))
+    config.set_main_option("script_location", str(BACKEND_DIR / "alembic"))
+    command.upgrade(config, "head")
+    return TEST_DATABASE_URL
+
+
+@pytest.fixture
+async def db_engine(migrated_database):
+    """An engine on the emptied test database."""
+    engine = create_async_engine(
+        migrated_database.replace("postgresql://", "postgresql+asyncpg://"),
+        pool_size=20,
+        max_overflow=30,
+    )
+    tables = ", ".join(table.name for table in Base.metadata.sorted_tables)
+    async with engine.begin() as conn:
+        await conn.execute(text(f"TRUNCATE {tables} CASCADE"))
+    yield engine
+    await engine.dispose()
+
+
+@pytest.fixture
+def session_factory(db_engine):
+    return async_sessionmaker(
+        db_engine, class_=AsyncSession, expire_on_commit=False
+    )
+
+
+@pytest.fixture
+async def db(session_factory):
+    async with session_factory() as session:
+        yield session
@@ -0,0 +1,113 @@
+"""
+Response cache coalescing and invalidation across processes.
+
+Two ResponseCache instances on one backend stand in for two pods sharing
+Redis. The Redis tests are skipped unless TEST_REDIS_URL points at a
+scratch Redis server.
+"""
+
+import asyncio
+import os
+import uuid
+
+import pytest
+
+from app.cache import MemoryCacheBackend, RedisCacheBackend, ResponseCache
+
+TEST_REDIS_URL = os.environ.get("TEST_REDIS_URL")
+
+
+@pytest.fixture
+async def memory_backend():
+    return MemoryCacheBackend(max_entries=100)
+
+
+@pytest.fixture
+async def redis_backends():
+    if not TEST_REDIS_URL:
+        pytest.skip("TEST_REDIS_URL is not set")
+    backends = [RedisCacheBackend(TEST_REDIS_URL) for _ in range(2)]
+    yield backends
+    for backend in backends:
+        await backend.close()
+
+
+@pytest.fixture(params=["memory", "redis"])
+def shared_backends(request):
+    """Backends of two pods that share their cache storage."""
+    if request.param == "memory":
+        backend = request.getfixturevalue("memory_backend")
+        return backend, backend
+    return tuple(request.getfixturevalue("redis_backends"))
+
+
+def _pods(backends):
+    prefix = f"test:{uuid.uuid4()}:"
+    return [ResponseCache(backend, prefix, ttl=60) for backend in backends]
+
+
+async def test_concurrent_misses_share_one_load(memory_backend):
+    (cache,) = _pods([memory_backend])
+    calls = 0
+    release = asyncio.Event()
+
+    async def loader():
+        nonlocal calls
+        calls += 1
+        await release.wait()
+        return {"title": "a"}
+
+    waiters = [
+        asyncio.ensure_future(cache.get_or_load("k", loader)) for _ in range(5)
+    ]
+    await asyncio.sleep(0)
+    release.set()
+
+    assert await asyncio.gather(*waiters) == [{"title": "a"}] * 5
+    assert calls == 1
+
+
+async def test_load_started_before_another_pods_invalidation_is_not_stored(
+    shared_backends,
+):
+    pod_a, pod_b = _pods(shared_backends)
+    loading = asyncio.Event()
+    release = asyncio.Event()
+
+    async def stale_loader():
+        loading.set()
+        await release.wait()
+        return {"title": "old"}
+
+    load = asyncio.ensure_future(pod_a.get_or_load("k", stale_loader))
+    await loading.wait()
+    # Pod B saves the note and invalidates while pod A is still loading
+    await pod_b.invalidate("k")
+    release.set()
+
+    assert await load == {"title": "old"}
+
+    async def fresh_loader():
+        return {"title": "new"}
+
+    assert await pod_a.get_or_load("k", fresh_loader) == {"title": "new"}
+    assert await pod_b.get_or_load("k", fresh_loader) == {"title": "new"}
+
+
+async def test_invalidation_drops_cached_value_for_every_pod(
+    shared_backends,
+):
+    pod_a, pod_b = _pods(shared_backends)
+
+    async def old():
+        return {"title": "old"}
+
+    async def new():
+        return {"title": "new"}
+
+    assert await pod_a.get_or_load("k", old) == {"title": "old"}
+    assert await pod_b.get_or_load("k", new) == {"title": "old"}
+
+    await pod_b.invalidate("k")
+
+    assert await pod_a.get_or_load("k", new) == {"title": "new"}
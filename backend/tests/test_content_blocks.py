@@ -0,0 +1,103 @@
+"""
+Splitting large content into content-defined blocks.
+"""
+
+import random
+
+import pytest
+
+from app.config import settings
+from app.content_blocks import split_blocks
+
+TARGET = 256
+MINIMUM, MAXIMUM = TARGET // 4, TARGET * 4
+
+
+@pytest.fixture(autouse=True)
+def block_size(monkeypatch):
+    monkeypatch.setattr(settings, "CONTENT_BLOCK_SIZE", TARGET)
+
+
+def _document(lines: int = 2000, seed: int = 1) -> str:
+    rng = random.Random(seed)
+    words = ["note", "block", "é", "content", "日本語", "line", "edit", "x"]
+    return "".join(
+        " ".join(rng.choices(words, k=rng.randint(0, 12))) + "\n"
+        for _ in range(lines)
+    )
+
+
+@pytest.mark.parametrize(
+    "content",
+    [
+        "",
+        "one line without newline",
+        "\n\n\n",
+        _document(),
+        _document()[:-1],
+        "x" * (MAXIMUM * 3 + 7),
+        "a\r\nb\rc d\x0ce\n" * 300,
+    ],
+)
+def test_blocks_join_back_to_content(content):
+    assert "".join(split_blocks(content)) == content
+
+
+def test_blocks_respect_minimum_and_maximum_size():
+    blocks = split_blocks(_document())
+
+    assert len(blocks) > 10
+    # Only the final block may fall short of the minimum
+    assert all(MINIMUM <= len(block) <= MAXIMUM for block in blocks[:-1])
+    assert len(blocks[-1]) <= MAXIMUM
+
+
+def test_blocks_average_about_the_target_size():
+    content = _document(lines=10000)
+    average = len(content) / len(split_blocks(content))
+
+    assert TARGET / 2 < average < TARGET * 2
+
+
+def test_long_line_is_cut_at_the_maximum():
+    content = "short\n" + "y" * (MAXIMUM * 2 + 10) + "\nshort\n"
+    blocks = split_blocks(content)
+
+    assert max(len(block) for block in blocks) == MAXIMUM
+    assert "".join(blocks) == content
+
+
+def test_block_size_follows_setting(monkeypatch):
+    content = _document()
+    small = split_blocks(content)
+    monkeypatch.setattr(settings, "CONTENT_BLOCK_SIZE", TARGET * 4)
+    large = split_blocks(content)
+
+    assert len(large) < len(small)
+    assert all(len(block) <= TARGET * 16 for block in large)
+
+
+@pytest.mark.parametrize(
+    "edit",
+    [
+        lambda lines: lines.__setitem__(1000, "an edited line\n"),
+        lambda lines: lines.insert(1000, "an inserted line\n"),
+        lambda lines: lines.__delitem__(1000),
+    ],
+    ids=["replace", "insert", "delete"],
+)
+def test_local_edit_changes_only_nearby_blocks(edit):
+    lines = _document().splitlines(keepends=True)
+    before = split_blocks("".join(lines))
+    edit(lines)
+    after = split_blocks("".join(lines))
+
+    # Boundaries depend only on nearby lines, so the chunking falls back
+    # into step shortly after the edit
+    changed = set(after) - set(before)
+    assert 1 <= len(changed) <= 3
+    common_prefix = next(
+        i for i, (a, b) in enumerate(zip(before, after)) if a != b
+    )
+    assert before[:common_prefix] == after[:common_prefix]
+    assert before[-10:] == after[-10:]
@@ -0,0 +1,255 @@
+"""
+Applying positional edits and unified diffs to note content.
+"""
+
+import difflib
+import uuid
+from datetime import datetime
+
+import httpx
+import pytest
+
+from app import note_history
+from app.auth import issue_anonymous_token
+from app.content_patch import (
+    PatchConflict,
+    PatchError,
+    apply_edits,
+    apply_unified_diff,
+)
+from app.content_store import ContentRecord, MemoryContentStore
+from app.models import Note, User
+from app.routes import notes
+from app.schemas import ContentEdit
+
+OLD = "".join(f"line {n}\n" for n in range(1, 21))
+NO_NEWLINE = "\\ No newline at end of file"
+
+
+def _diff(old: str, new: str, n: int = 3) -> str:
+    """A unified diff as diff -u writes it, with no-newline markers."""
+    lines = difflib.unified_diff(
+        old.splitlines(keepends=True),
+        new.splitlines(keepends=True),
+        "a/note",
+        "b/note",
+        n=n,
+    )
+    return "".join(
+        line if line.endswith("\n") else f"{line}\n{NO_NEWLINE}\n"
+        for line in lines
+    )
+
+
+def _edit(operation, position, length=None, content=None):
+    return ContentEdit(
+        operation=operation,
+        position=position,
+        length=length,
+        content=content,
+    )
+
+
+def test_multi_hunk_diff_applies_every_hunk():
+    new = (
+        OLD.replace("line 2\n", "line two\n")
+        .replace("line 10\n", "")
+        .replace("line 19\n", "line 19\nline 19.5\n")
+    )
+    diff = _diff(OLD, new)
+
+    assert diff.count("@@ -") == 3
+    assert apply_unified_diff(OLD, diff) == new
+
+
+def test_hunks_without_context_apply():
+    new = OLD.replace("line 5\n", "line five\n").replace("line 15\n", "")
+
+    assert apply_unified_diff(OLD, _diff(OLD, new, n=0)) == new
+
+
+def test_insert_only_hunk_applies_after_its_line():
+    diff = "@@ -3,0 +4 @@\n+inserted\n"
+
+    assert apply_unified_diff("a\nb\nc\nd\n", diff) == "a\nb\nc\ninserted\nd\n"
+
+
+def test_insert_at_start_of_content():
+    diff = "@@ -0,0 +1 @@\n+first\n"
+
+    assert apply_unified_diff("a\n", diff) == "first\na\n"
+
+
+def test_context_mismatch_is_a_conflict():
+    diff = _diff(OLD, OLD.replace("line 8\n", "line eight\n"))
+    edited = OLD.replace("line 7\n", "line seven\n")
+
+    with pytest.raises(PatchConflict, match="does not apply at line 7"):
+        apply_unified_diff(edited, diff)
+
+
+def test_removed_line_mismatch_is_a_conflict():
+    diff = _diff(OLD, OLD.replace("line 8\n", ""))
+    edited = OLD.replace("line 8\n", "line eight\n")
+
+    with pytest.raises(PatchConflict, match="does not apply at line 8"):
+        apply_unified_diff(edited, diff)
+
+
+def test_hunk_past_end_of_content_is_a_conflict():
+    diff = _diff(OLD, OLD.replace("line 20\n", "line twenty\n"))
+
+    with pytest.raises(PatchConflict):
+        apply_unified_diff("line 1\n", diff)
+
+
+@pytest.mark.parametrize(
+    "old, new",
+    [
+        ("a\nb\n", "a\nb"),
+        ("a\nb", "a\nb\n"),
+        ("a\nb", "a\nc"),
+        ("a\nb", "a\nb\nc"),
+        ("", "only"),
+        ("only", ""),
+    ],
+)
+def test_no_newline_marker(old, new):
+    diff = _diff(old, new)
+
+    assert NO_NEWLINE in diff
+    assert apply_unified_diff(old, diff) == new
+
+
+def test_no_newline_marker_from_diff_u():
+    diff = (
+        "--- a/note\n"
+        "+++ b/note\n"
+        "@@ -1,2 +1,2 @@\n"
+        " a\n"
+        "-b\n"
+        f"{NO_NEWLINE}\n"
+        "+b\n"
+    )
+
+    assert apply_unified_diff("a\nb", diff) == "a\nb\n"
+
+
+def test_misplaced_no_newline_marker_is_rejected():
+    diff = f"@@ -1 +1 @@\n{NO_NEWLINE}\n-a\n+b\n"
+
+    with pytest.raises(PatchError, match="Misplaced"):
+        apply_unified_diff("a\n", diff)
+
+
+@pytest.mark.parametrize(
+    "diff, message",
+    [
+        ("", "no hunks"),
+        ("--- a/note\n+++ b/note\n", "no hunks"),
+        ("@@ -1,2 +1,2 @@\n line 1", "truncated"),
+        ("@@ -1 +1 @@\n*line 1\n", "Invalid diff line"),
+        (
+            "@@ -5 +5 @@\n-line 5\n+five\n@@ -2 +2 @@\n-line 2\n+two\n",
+            "out of order",
+        ),
+    ],
+)
+def test_malformed_diff_is_not_a_conflict(diff, message):
+    with pytest.raises(PatchError, match=message) as raised:
+        apply_unified_diff(OLD, diff)
+
+    assert not isinstance(raised.value, PatchConflict)
+
+
+def test_edits_apply_in_order():
+    edits = [
+        _edit("insert", 5, content=","),
+        _edit("replace", 7, 5, "there"),
+        _edit("delete", 0, 1),
+        _edit("insert", 0, content="H"),
+    ]
+
+    assert apply_edits("hello world", edits) == "Hello, there"
+
+
+@pytest.mark.parametrize("position, length", [(6, None), (3, 3)])
+def test_edit_out_of_range_is_a_conflict(position, length):
+    operation = "insert" if length is None else "delete"
+
+    with pytest.raises(PatchConflict, match="out of range"):
+        apply_edits("hello", [_edit(operation, position, length)])
+
+
+@pytest.fixture
+def store(monkeypatch):
+    store = MemoryContentStore()
+    monkeypatch.setattr(notes, "content_store", store)
+    monkeypatch.setattr(note_history, "content_store", store)
+    return store
+
+
+@pytest.fixture
+async def owned_note(db, store):
+    owner = User(
+        id=uuid.uuid4(),
+        is_anonymous=True,
+        is_premium=False,
+        created_at=datetime.utcnow(),
+    )
+    note = Note(
+        title="Patched",
+        owner_id=owner.id,
+        mongodb_content_id=str(uuid.uuid4()),
+    )
+    db.add(owner)
+    await db.flush()
+    db.add(note)
+    await db.commit()
+    store.records[note.id] = ContentRecord(OLD, 1, 1)
+    return owner, note
+
+
+async def _patch(owner, note, body):
+    from app.main import app
+
+    async with httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=app), base_url="http://test"
+    ) as client:
+        return await client.patch(
+            f"/api/notes/{note.id}",
+            json={"base_revision": note.revision, **body},
+            headers={"X-Anonymous-Token": issue_anonymous_token(owner)},
+        )
+
+
+async def test_route_applies_diff(owned_note, store):
+    owner, note = owned_note
+    new = OLD.replace("line 3\n", "line three\n")
+
+    response = await _patch(owner, note, {"diff": _diff(OLD, new)})
+
+    assert response.status_code == 200
+    assert response.json()["revision"] == note.revision + 1
+    assert store.records[note.id].content == new
+
+
+async def test_route_answers_context_mismatch_with_409(owned_note, store):
+    owner, note = owned_note
+    store.records[note.id] = ContentRecord(
+        OLD.replace("line 2\n", "line two\n"), 1, 1
+    )
+    diff = _diff(OLD, OLD.replace("line 3\n", "line three\n"))
+
+    response = await _patch(owner, note, {"diff": diff})
+
+    assert response.status_code == 409
+    assert "does not apply" in response.json()["detail"]
+
+
+async def test_route_answers_malformed_diff_with_422(owned_note):
+    owner, note = owned_note
+
+    response = await _patch(owner, note, {"diff": "not a diff"})
+
+    assert response.status_code == 422
@@ -0,0 +1,227 @@
+"""
+Conditional request helpers, per-encoding ETags and byte ranges.
+"""
+
+import uuid
+from datetime import datetime
+
+import httpx
+import pytest
+from fastapi import FastAPI, Request
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import PlainTextResponse
+
+from app.config import settings
+from app.content_store import ContentRecord, MemoryContentStore
+from app.http_cache import EncodedETagMiddleware, is_not_modified, parse_range
+from app.models import Note, User
+from app.routes import notes
+
+ETAG = '"abc.3"'
+BODY = "note content " * 200
+
+
+@pytest.fixture
+def client():
+    app = FastAPI()
+    app.add_middleware(GZipMiddleware, minimum_size=100)
+    app.add_middleware(EncodedETagMiddleware)
+
+    @app.get("/note")
+    async def note(request: Request):
+        if is_not_modified(request, ETAG, None):
+            return PlainTextResponse(
+                status_code=304, content="", headers={"ETag": ETAG}
+            )
+        return PlainTextResponse(BODY, headers={"ETag": ETAG})
+
+    return httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=app), base_url="http://test"
+    )
+
+
+async def test_gzip_and_identity_responses_have_different_etags(client):
+    async with client:
+        gzipped = await client.get(
+            "/note", headers={"Accept-Encoding": "gzip"}
+        )
+        identity = await client.get(
+            "/note", headers={"Accept-Encoding": "identity"}
+        )
+
+    assert gzipped.headers["content-encoding"] == "gzip"
+    assert gzipped.headers["etag"] == '"abc.3-gzip"'
+    assert "content-encoding" not in identity.headers
+    assert identity.headers["etag"] == ETAG
+    assert gzipped.text == identity.text == BODY
+
+
+@pytest.mark.parametrize("tag", [ETAG, '"abc.3-gzip"', 'W/"abc.3"'])
+async def test_either_etag_revalidates(client, tag):
+    async with client:
+        response = await client.get(
+            "/note",
+            headers={"Accept-Encoding": "gzip", "If-None-Match": tag},
+        )
+
+    assert response.status_code == 304
+
+
+async def test_other_revision_does_not_revalidate(client):
+    async with client:
+        response = await client.get(
+            "/note", headers={"If-None-Match": '"abc.2-gzip"'}
+        )
+
+    assert response.status_code == 200
+
+
+@pytest.mark.parametrize(
+    "header, expected",
+    [
+        ("bytes=0-9", (0, 9)),
+        ("bytes=10-10", (10, 10)),
+        # Bounded ranges past the end are clamped
+        ("bytes=90-200", (90, 99)),
+        # Open-ended: from an offset to the end
+        ("bytes=40-", (40, 99)),
+        ("bytes=99-", (99, 99)),
+        # Suffix: the final N bytes, all of them if N exceeds the size
+        ("bytes=-1", (99, 99)),
+        ("bytes=-30", (70, 99)),
+        ("bytes=-500", (0, 99)),
+        ("bytes= 5-6 ", (5, 6)),
+    ],
+)
+def test_parse_range(header, expected):
+    assert parse_range(header, 100) == expected
+
+
+@pytest.mark.parametrize(
+    "header, size",
+    [
+        ("bytes=100-", 100),
+        ("bytes=100-200", 100),
+        ("bytes=-0", 100),
+        ("bytes=0-", 0),
+        ("bytes=-5", 0),
+    ],
+)
+def test_unsatisfiable_range_raises(header, size):
+    with pytest.raises(ValueError):
+        parse_range(header, size)
+
+
+@pytest.mark.parametrize(
+    "header",
+    [
+        None,
+        "",
+        # Multi-range requests fall back to the full body
+        "bytes=0-9,20-29",
+        "bytes=-5,0-1",
+        "items=0-9",
+        "bytes=",
+        "bytes=5",
+        "bytes=-",
+        "bytes=a-b",
+        "bytes=9-0",
+        "bytes=--5",
+    ],
+)
+def test_unusable_range_is_ignored(header):
+    assert parse_range(header, 100) is None
+
+
+# Multi-byte characters, so byte offsets differ from character offsets
+CONTENT = "é note, in bytes " * 10
+CONTENT_BYTES = CONTENT.encode("utf-8")
+
+
+@pytest.fixture
+async def public_note(db, monkeypatch):
+    store = MemoryContentStore()
+    monkeypatch.setattr(notes, "content_store", store)
+    # Small chunks, so ranges start and end mid-chunk
+    monkeypatch.setattr(settings, "CONTENT_STREAM_CHUNK_SIZE", 16)
+
+    owner = User(
+        id=uuid.uuid4(),
+        is_anonymous=True,
+        is_premium=False,
+        created_at=datetime.utcnow(),
+    )
+    note = Note(
+        title="Ranged",
+        owner_id=owner.id,
+        is_public=True,
+        mongodb_content_id=str(uuid.uuid4()),
+    )
+    db.add(owner)
+    await db.flush()
+    db.add(note)
+    await db.commit()
+    store.records[note.id] = ContentRecord(CONTENT, 1, 1)
+    return note
+
+
+async def _get_content(note, headers):
+    from app.main import app
+
+    async with httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=app), base_url="http://test"
+    ) as client:
+        return await client.get(
+            f"/api/notes/{note.id}/content", headers=headers
+        )
+
+
+async def test_range_request_gets_partial_content(public_note):
+    response = await _get_content(
+        public_note, {"Range": "bytes=5-40", "Accept-Encoding": "gzip"}
+    )
+    size = len(CONTENT_BYTES)
+
+    assert response.status_code == 206
+    assert response.headers["content-range"] == f"bytes 5-40/{size}"
+    assert response.headers["content-length"] == "36"
+    assert response.headers["content-encoding"] == "identity"
+    assert response.headers["accept-ranges"] == "bytes"
+    assert response.content == CONTENT_BYTES[5:41]
+
+
+async def test_suffix_range_gets_the_final_bytes(public_note):
+    response = await _get_content(public_note, {"Range": "bytes=-7"})
+    size = len(CONTENT_BYTES)
+
+    assert response.status_code == 206
+    assert response.headers["content-range"] == (
+        f"bytes {size - 7}-{size - 1}/{size}"
+    )
+    assert response.content == CONTENT_BYTES[-7:]
+
+
+async def test_unsatisfiable_range_gets_416(public_note):
+    size = len(CONTENT_BYTES)
+
+    response = await _get_content(public_note, {"Range": f"bytes={size}-"})
+
+    assert response.status_code == 416
+    assert response.headers["content-range"] == f"bytes */{size}"
+
+
+async def test_multi_range_gets_the_full_body(public_note):
+    response = await _get_content(public_note, {"Range": "bytes=0-1,5-6"})
+
+    assert response.status_code == 200
+    assert "content-range" not in response.headers
+    assert response.content == CONTENT_BYTES
+
+
+async def test_stale_if_range_gets_the_full_body(public_note):
+    response = await _get_content(
+        public_note, {"Range": "bytes=0-9", "If-Range": '"stale.1"'}
+    )
+
+    assert response.status_code == 200
+    assert response.content == CONTENT_BYTES
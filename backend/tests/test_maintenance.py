@@ -0,0 +1,71 @@
+"""
+Maintenance jobs racing with concurrent writes.
+"""
+
+import asyncio
+import uuid
+
+from sqlalchemy import insert, select, update
+
+from app import maintenance
+from app.models import Note, User
+
+
+async def test_reconcile_does_not_overwrite_concurrent_note_insert(
+    session_factory, db, monkeypatch
+):
+    monkeypatch.setattr(maintenance, "AsyncSessionLocal", session_factory)
+    user_id = uuid.uuid4()
+    db.add(User(id=user_id, is_anonymous=False, note_count=0))
+    await db.commit()
+
+    # A note insert in flight: the owner's count is bumped and the note
+    # inserted in one transaction, as create_note does
+    async with session_factory() as writer:
+        await writer.execute(
+            update(User)
+            .where(User.id == user_id)
+            .values(note_count=User.note_count + 1)
+        )
+        await writer.execute(
+            insert(Note).values(
+                title="racing",
+                owner_id=user_id,
+                mongodb_content_id=str(uuid.uuid4()),
+            )
+        )
+
+        reconcile = asyncio.ensure_future(maintenance.reconcile_note_counts())
+        await asyncio.sleep(0.5)
+        assert not reconcile.done()
+        await writer.commit()
+
+    await reconcile
+
+    result = await db.execute(
+        select(User.note_count).where(User.id == user_id)
+    )
+    assert result.scalar_one() == 1
+
+
+async def test_reconcile_repairs_drift(session_factory, db, monkeypatch):
+    monkeypatch.setattr(maintenance, "AsyncSessionLocal", session_factory)
+    user_id = uuid.uuid4()
+    db.add(User(id=user_id, is_anonymous=False, note_count=5))
+    await db.flush()
+    db.add(
+        Note(
+            title="only",
+            owner_id=user_id,
+            mongodb_content_id=str(uuid.uuid4()),
+        )
+    )
+    await db.commit()
+
+    assert await maintenance.reconcile_note_counts() == 1
+
+    db.expire_all()
+    result = await db.execute(
+        select(User.note_count).where(User.id == user_id)
+    )
+    assert result.scalar_one() == 1
@@ -0,0 +1,70 @@
+"""
+NDJSON import parsing.
+"""
+
+import json
+
+from app.note_archive import ArchiveError, iter_ndjson_records
+
+
+async def _records(chunks, max_bytes=1024):
+    async def stream():
+        for chunk in chunks:
+            yield chunk
+
+    return [
+        (label, record)
+        async for label, record in iter_ndjson_records(stream(), max_bytes)
+    ]
+
+
+async def test_records_split_across_chunks():
+    body = b'{"title": "a"}\n\n{"title": "b"}\n{"title": "c"}'
+    chunks = [body[i : i + 3] for i in range(0, len(body), 3)]
+
+    records = await _records(chunks)
+
+    assert records == [
+        ("1", {"title": "a"}),
+        ("3", {"title": "b"}),
+        ("4", {"title": "c"}),
+    ]
+
+
+async def test_invalid_lines_are_reported_by_line_number():
+    records = await _records([b'not json\n[1, 2]\n{"title": "ok"}\n'])
+
+    assert [label for label, _ in records] == ["1", "2", "3"]
+    assert isinstance(records[0][1], ArchiveError)
+    assert isinstance(records[1][1], ArchiveError)
+    assert records[2][1] == {"title": "ok"}
+
+
+async def test_oversized_line_is_rejected_and_parsing_resumes():
+    big = json.dumps({"content": "x" * 5000}).encode()
+    chunks = [big[i : i + 100] for i in range(0, len(big), 100)]
+    chunks += [b'\n{"title": "after"}\n']
+
+    records = await _records(chunks, max_bytes=1024)
+
+    assert len(records) == 2
+    assert isinstance(records[0][1], ArchiveError)
+    assert str(records[0][1]) == "Record is too large"
+    assert records[1] == ("2", {"title": "after"})
+
+
+async def test_oversized_last_line_without_newline():
+    records = await _records([b"x" * 600, b"x" * 600], max_bytes=1024)
+
+    assert len(records) == 1
+    assert isinstance(records[0][1], ArchiveError)
+
+
+async def test_many_small_chunks_of_one_large_record():
+    content = "y" * 200_000
+    body = json.dumps({"content": content}).encode() + b"\n"
+    chunks = [body[i : i + 7] for i in range(0, len(body), 7)]
+
+    records = await _records(chunks, max_bytes=len(body))
+
+    assert records == [("1", {"content": content})]
@@ -0,0 +1,133 @@
+"""
+Reverse deltas, snapshots and rebuilding historical content.
+"""
+
+import uuid
+from datetime import datetime
+
+import pytest
+
+from app import note_history
+from app.config import settings
+from app.content_patch import apply_edits
+from app.content_store import ContentRecord, ContentRef, MemoryContentStore
+from app.note_history import content_at, reverse_delta, save_content
+from app.schemas import ContentEdit
+
+REVISIONS = ["", "hello", "hello world", "Hello world", "Hello, world!", "x"]
+
+
+def _undo(new: str, ops) -> str:
+    return apply_edits(new, [ContentEdit.model_validate(op) for op in ops])
+
+
+@pytest.mark.parametrize(
+    "old, new",
+    [
+        ("", ""),
+        ("same", "same"),
+        ("", "added"),
+        ("removed", ""),
+        ("abc", "abXc"),
+        ("abXc", "abc"),
+        ("aaaa", "aa"),
+        ("start", "the start"),
+        ("the end", "the end."),
+        ("héllo wörld", "hello world"),
+    ],
+)
+def test_reverse_delta_turns_new_back_into_old(old, new):
+    assert _undo(new, reverse_delta(old, new)) == old
+
+
+def test_reverse_delta_is_empty_for_equal_content():
+    assert reverse_delta("same", "same") == []
+
+
+def test_reverse_delta_replaces_only_the_changed_span():
+    assert reverse_delta("hello world", "hello there world") == [
+        {"operation": "replace", "position": 6, "length": 6, "content": ""}
+    ]
+
+
+@pytest.fixture
+def store(monkeypatch):
+    store = MemoryContentStore()
+    monkeypatch.setattr(note_history, "content_store", store)
+    monkeypatch.setattr(settings, "HISTORY_SNAPSHOT_INTERVAL", 3)
+    return store
+
+
+async def _note_with_history(store, contents):
+    """A note saved once per entry of contents, from revision 1."""
+    ref = ContentRef(uuid.uuid4())
+    store.records[ref.note_id] = ContentRecord(contents[0], 1, 1)
+    for revision, content in enumerate(contents[1:], start=2):
+        await save_content(None, ref, revision, content, datetime.utcnow())
+    return ref
+
+
+async def _content_at(store, ref, revision):
+    current = store.records[ref.note_id]
+    return await content_at(None, ref, current, current.revision, revision)
+
+
+async def test_every_revision_is_rebuilt(store):
+    ref = await _note_with_history(store, REVISIONS)
+
+    for revision, content in enumerate(REVISIONS, start=1):
+        assert await _content_at(store, ref, revision) == content
+
+
+async def test_snapshots_are_taken_every_interval(store):
+    ref = await _note_with_history(store, REVISIONS)
+
+    snapshots = {
+        revision: version["content"]
+        for revision, version in store.versions[ref.note_id].items()
+        if version["snapshot"]
+    }
+
+    assert snapshots == {3: REVISIONS[2], 6: REVISIONS[5]}
+    assert store.records[ref.note_id].snapshot_revision == 6
+
+
+async def test_rebuild_starts_from_nearest_snapshot(store):
+    ref = await _note_with_history(store, REVISIONS)
+    # Deltas above the snapshot at revision 3 are not needed for it
+    del store.versions[ref.note_id][5]
+
+    assert await _content_at(store, ref, 3) == REVISIONS[2]
+    assert await _content_at(store, ref, 2) == REVISIONS[1]
+
+
+async def test_gap_in_the_chain_returns_none(store):
+    ref = await _note_with_history(store, REVISIONS)
+    # A version whose write failed, between the snapshot and the target
+    del store.versions[ref.note_id][5]
+
+    assert await _content_at(store, ref, 4) is None
+    assert await _content_at(store, ref, 6) == REVISIONS[5]
+
+
+async def test_missing_newest_version_returns_none(store):
+    ref = await _note_with_history(store, REVISIONS[:3])
+    del store.versions[ref.note_id][3]
+
+    assert await _content_at(store, ref, 2) is None
+
+
+async def test_revisions_outside_history_return_none(store):
+    ref = await _note_with_history(store, REVISIONS[:3])
+    current = store.records[ref.note_id]
+
+    assert await content_at(None, ref, current, 3, 0) is None
+    assert await content_at(None, ref, current, 3, 4) is None
+
+
+async def test_note_without_history_only_has_current_content(store):
+    ref = ContentRef(uuid.uuid4())
+    current = ContentRecord("legacy")
+
+    assert await content_at(None, ref, current, 7, 7) == "legacy"
+    assert await content_at(None, ref, current, 7, 6) is None
@@ -0,0 +1,64 @@
+"""
+Writes pin the client to the primaries; read-only POSTs do not.
+"""
+
+import httpx
+import pytest
+from fastapi import Depends, FastAPI
+
+from app import main
+from app.database import (
+    PRIMARY_PIN_COOKIE,
+    get_db,
+    get_read_db,
+    read_only_request,
+)
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(main, "READ_REPLICAS_ENABLED", True)
+
+    app = FastAPI()
+    app.middleware("http")(main.pin_writers_to_primary)
+
+    # Sessions connect lazily, so these never touch the database
+    @app.post("/read", dependencies=[Depends(read_only_request)])
+    async def read(db=Depends(get_read_db)):
+        return {}
+
+    @app.post("/write")
+    async def write(db=Depends(get_db)):
+        return {}
+
+    # Like a write whose user is looked up on a read session
+    @app.post("/write-with-read-lookup")
+    async def write_with_read_lookup(
+        db=Depends(get_db), lookup=Depends(get_read_db)
+    ):
+        return {}
+
+    @app.get("/get")
+    async def get(db=Depends(get_db)):
+        return {}
+
+    return httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=app), base_url="http://test"
+    )
+
+
+@pytest.mark.parametrize("path", ["/write", "/write-with-read-lookup"])
+async def test_write_pins_client_to_primary(client, path):
+    async with client:
+        response = await client.post(path)
+
+    assert PRIMARY_PIN_COOKIE in response.cookies
+
+
+@pytest.mark.parametrize("method, path", [("POST", "/read"), ("GET", "/get")])
+async def test_reads_do_not_pin_client(client, method, path):
+    async with client:
+        response = await client.request(method, path)
+
+    assert response.status_code == 200
+    assert PRIMARY_PIN_COOKIE not in response.cookies
@@ -0,0 +1,200 @@
+"""
+Query-plan regression tests: with a realistically sized dataset, the hot
+note and permission queries must be served by their indexes, not by
+sequential scans.
+"""
+
+import uuid
+
+import pytest
+from sqlalchemy import func, select
+from sqlalchemy.dialects import postgresql
+
+from app.models import Note, NotePermission, NoteType, PermissionLevel, User
+from app.routes.notes import _accessible_notes_query
+
+USERS = 5000
+NOTES_PER_USER = 40
+
+SEED = [
+    f"""
+    INSERT INTO users (id, username, email, is_anonymous, is_premium,
+                       created_at, updated_at)
+    SELECT gen_random_uuid(), 'user' || i, 'user' || i || '@example.com',
+           false, false, now(), now()
+    FROM generate_series(1, {USERS}) AS i
+    """,
+    f"""
+    INSERT INTO notes (id, title, note_type, owner_id, is_public,
+                       mongodb_content_id, created_at, updated_at)
+    SELECT gen_random_uuid(), 'Note ' || n, 'standard', u.id, false,
+           md5(u.id::text || n), now() - random() * interval '365 days',
+           now() - random() * interval '365 days'
+    FROM users u, generate_series(1, {NOTES_PER_USER}) AS n
+    """,
+    # About a quarter of the notes shared with one other user
+    f"""
+    WITH numbered AS (
+        SELECT id, row_number() OVER (ORDER BY id) AS rn FROM users
+    )
+    INSERT INTO note_permissions (id, note_id, user_id, permission_level,
+                                  granted_at)
+    SELECT gen_random_uuid(), n.id, b.id, 'READ', now()
+    FROM notes n
+    JOIN numbered a ON a.id = n.owner_id
+    JOIN numbered b ON b.rn = a.rn % {USERS} + 1
+    WHERE random() < 0.25
+    """,
+]
+
+
+@pytest.fixture
+async def seeded(db):
+    """
+    The seeded dataset plus one user owning three notes and holding
+    permissions on two others. Returns (user, ids of their notes).
+    """
+    conn = await db.connection()
+    for statement in SEED:
+        await conn.exec_driver_sql(statement)
+
+    result = await db.execute(select(Note.id).limit(2))
+    shared = result.scalars().all()
+
+    user = User(id=uuid.uuid4(), username="probe", is_anonymous=False)
+    owned = [
+        Note(
+            title=f"Owned {i}",
+            note_type=NoteType.STANDARD,
+            owner=user,
+            mongodb_content_id=uuid.uuid4().hex,
+        )
+        for i in range(3)
+    ]
+    db.add_all([user, *owned])
+    db.add_all(
+        NotePermission(
+            note_id=note_id, user=user, permission_level=PermissionLevel.READ
+        )
+        for note_id in shared
+    )
+    await db.commit()
+
+    await conn.exec_driver_sql("ANALYZE")
+    return user, {note.id for note in owned} | set(shared)
+
+
+async def explain(db, query) -> dict:
+    sql = query.compile(
+        dialect=postgresql.dialect(),
+        compile_kwargs={"literal_binds": True},
+    )
+    conn = await db.connection()
+    result = await conn.exec_driver_sql(f"EXPLAIN (FORMAT JSON) {sql}")
+    return result.scalar()[0]["Plan"]
+
+
+def _nodes(plan: dict):
+    yield plan
+    for child in plan.get("Plans", []):
+        yield from _nodes(child)
+
+
+def seq_scans(plan: dict) -> set:
+    return {
+        node["Relation Name"]
+        for node in _nodes(plan)
+        if node["Node Type"] == "Seq Scan"
+    }
+
+
+def indexes_used(plan: dict) -> set:
+    return {
+        node["Index Name"] for node in _nodes(plan) if "Index Name" in node
+    }
+
+
+async def test_note_listing_uses_owner_and_permission_indexes(db, seeded):
+    user, expected = seeded
+    query = (
+        _accessible_notes_query(user)
+        .order_by(Note.updated_at.desc(), Note.id.desc())
+        .limit(100)
+    )
+
+    plan = await explain(db, query)
+
+    assert not seq_scans(plan) & {"notes", "note_permissions"}
+    assert {
+        "ix_notes_owner_id_updated_at_id",
+        "ix_note_permissions_user_id",
+    } <= indexes_used(plan)
+    result = await db.execute(query)
+    assert {note.id for note in result.scalars()} == expected
+
+
+async def test_anonymous_listing_uses_owner_index(db, seeded):
+    user = User(id=seeded[0].id, is_anonymous=True)
+    query = (
+        _accessible_notes_query(user)
+        .order_by(Note.updated_at.desc(), Note.id.desc())
+        .limit(100)
+    )
+
+    plan = await explain(db, query)
+
+    assert "notes" not in seq_scans(plan)
+    assert "ix_notes_owner_id_updated_at_id" in indexes_used(plan)
+
+
+async def test_owned_note_count_uses_owner_index(db, seeded):
+    user, _ = seeded
+    query = select(func.count(Note.id)).where(Note.owner_id == user.id)
+
+    plan = await explain(db, query)
+
+    assert "notes" not in seq_scans(plan)
+    assert "ix_notes_owner_id_updated_at_id" in indexes_used(plan)
+
+
+async def test_permission_check_uses_note_user_index(db, seeded):
+    user, notes = seeded
+    query = select(NotePermission).where(
+        NotePermission.note_id == next(iter(notes)),
+        NotePermission.user_id == user.id,
+    )
+
+    plan = await explain(db, query)
+
+    assert "note_permissions" not in seq_scans(plan)
+    assert "ix_note_permissions_note_id_user_id" in indexes_used(plan)
+
+
+async def test_change_feed_uses_indexes(db, seeded):
+    user, _ = seeded
+    query = (
+        _accessible_notes_query(user)
+        .where(Note.change_xid >= 0)
+        .order_by(Note.change_xid, Note.id)
+        .limit(501)
+    )
+
+    plan = await explain(db, query)
+
+    assert not seq_scans(plan) & {"notes", "note_permissions"}
+
+
+def test_plan_helpers_walk_nested_nodes():
+    plan = {
+        "Node Type": "Limit",
+        "Plans": [
+            {"Node Type": "Seq Scan", "Relation Name": "notes"},
+            {
+                "Node Type": "Index Scan",
+                "Relation Name": "note_permissions",
+                "Index Name": "ix_note_permissions_user_id",
+            },
+        ],
+    }
+    assert seq_scans(plan) == {"notes"}
+    assert indexes_used(plan) == {"ix_note_permissions_user_id"}
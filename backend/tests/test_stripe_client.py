@@ -0,0 +1,276 @@
+"""
+Stripe client error mapping, retries and idempotency keys.
+
+The stripe-mock tests are skipped unless STRIPE_MOCK_URL points at a
+running stripe-mock (docker-compose.local.yml starts one on port 12111).
+"""
+
+import os
+
+import httpx
+import pytest
+import stripe
+
+from app import stripe_client as stripe_client_module
+from app.config import settings
+from app.stripe_client import (
+    StripeClient,
+    close_stripe_client,
+    get_stripe_client,
+    idempotency_key,
+)
+
+STRIPE_MOCK_URL = os.getenv("STRIPE_MOCK_URL")
+
+requires_stripe_mock = pytest.mark.skipif(
+    not STRIPE_MOCK_URL, reason="STRIPE_MOCK_URL is not set"
+)
+
+
+@pytest.fixture(autouse=True)
+def no_retry_delay(monkeypatch):
+    monkeypatch.setattr(stripe_client_module, "RETRY_BASE_DELAY", 0)
+
+
+def _client(handler, max_retries=2):
+    client = StripeClient(api_key="sk_test_123", max_retries=max_retries)
+    client._client = httpx.AsyncClient(
+        base_url="https://stripe.test",
+        transport=httpx.MockTransport(handler),
+    )
+    return client
+
+
+def _error(status, **error):
+    def handler(request):
+        return httpx.Response(status, json={"error": error})
+
+    return handler
+
+
+@pytest.mark.parametrize(
+    "status, error, expected",
+    [
+        (
+            402,
+            {"type": "card_error", "code": "card_declined"},
+            stripe.error.CardError,
+        ),
+        (
+            400,
+            {"type": "invalid_request_error", "param": "email"},
+            stripe.error.InvalidRequestError,
+        ),
+        (
+            404,
+            {"type": "invalid_request_error"},
+            stripe.error.InvalidRequestError,
+        ),
+        (
+            400,
+            {"type": "idempotency_error"},
+            stripe.error.IdempotencyError,
+        ),
+        (
+            401,
+            {"type": "invalid_request_error"},
+            stripe.error.AuthenticationError,
+        ),
+        (403, {"type": "invalid_request_error"}, stripe.error.PermissionError),
+        (429, {"type": "invalid_request_error"}, stripe.error.RateLimitError),
+        (500, {"type": "api_error"}, stripe.error.APIError),
+    ],
+)
+async def test_error_responses_map_to_sdk_exceptions(status, error, expected):
+    client = _client(_error(status, message="nope", **error), max_retries=0)
+
+    with pytest.raises(expected) as raised:
+        await client.create_customer(email="a@example.com")
+
+    assert raised.value.http_status == status
+    assert raised.value.user_message == "nope"
+
+
+async def test_card_error_keeps_param_and_code():
+    client = _client(
+        _error(402, type="card_error", code="card_declined", param="card"),
+        max_retries=0,
+    )
+
+    with pytest.raises(stripe.error.CardError) as raised:
+        await client.modify_subscription("sub_123", cancel_at_period_end=True)
+
+    assert raised.value.code == "card_declined"
+    assert raised.value.param == "card"
+
+
+async def test_post_retries_reuse_one_idempotency_key():
+    keys = []
+
+    def handler(request):
+        keys.append(request.headers.get("Idempotency-Key"))
+        if len(keys) < 3:
+            return httpx.Response(500, json={"error": {"type": "api_error"}})
+        return httpx.Response(
+            200, json={"id": "cus_123", "object": "customer"}
+        )
+
+    customer = await _client(handler).create_customer(email="a@example.com")
+
+    assert customer.id == "cus_123"
+    assert len(keys) == 3
+    assert keys[0] and len(set(keys)) == 1
+
+
+async def test_given_idempotency_key_is_sent():
+    seen = []
+
+    def handler(request):
+        seen.append(request.headers.get("Idempotency-Key"))
+        return httpx.Response(
+            200, json={"id": "cus_123", "object": "customer"}
+        )
+
+    client = _client(handler)
+    await client.create_customer(idempotency_key="customer-1", email="a@b.c")
+    await client.create_customer(email="a@b.c")
+
+    assert seen[0] == "customer-1"
+    assert seen[1] and seen[1] != "customer-1"
+
+
+async def test_get_requests_carry_no_idempotency_key():
+    seen = []
+
+    def handler(request):
+        seen.append(request.headers.get("Idempotency-Key"))
+        return httpx.Response(
+            200, json={"id": "sub_123", "object": "subscription"}
+        )
+
+    await _client(handler).retrieve_subscription("sub_123")
+
+    assert seen == [None]
+
+
+async def test_client_errors_are_not_retried():
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        return httpx.Response(
+            400, json={"error": {"type": "invalid_request_error"}}
+        )
+
+    with pytest.raises(stripe.error.InvalidRequestError):
+        await _client(handler).create_customer(email="a@example.com")
+
+    assert len(calls) == 1
+
+
+async def test_should_retry_header_overrides_status():
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        return httpx.Response(
+            500,
+            headers={"Stripe-Should-Retry": "false"},
+            json={"error": {"type": "api_error"}},
+        )
+
+    with pytest.raises(stripe.error.APIError):
+        await _client(handler).create_customer(email="a@example.com")
+
+    assert len(calls) == 1
+
+
+async def test_connection_errors_are_retried_then_raised():
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        raise httpx.ConnectError("connection refused", request=request)
+
+    with pytest.raises(stripe.error.APIConnectionError):
+        await _client(handler, max_retries=2).create_customer(email="a@b.c")
+
+    assert len(calls) == 3
+
+
+def test_idempotency_key_is_stable_for_the_same_request():
+    params = {"email": "a@example.com", "metadata": {"user_id": "1"}}
+
+    assert idempotency_key("customer", 1, params) == idempotency_key(
+        "customer", 1, dict(reversed(params.items()))
+    )
+
+
+def test_idempotency_key_changes_with_the_request():
+    params = {"email": "a@example.com"}
+    key = idempotency_key("customer", 1, params)
+
+    assert idempotency_key("customer", 1, {"email": "b@example.com"}) != key
+    assert idempotency_key("customer", 2, params) != key
+    assert idempotency_key("checkout", 1, params) != key
+
+
+async def test_client_is_built_from_settings_on_first_use(monkeypatch):
+    await close_stripe_client()
+    monkeypatch.setattr(settings, "STRIPE_SECRET_KEY", "sk_test_from_settings")
+    try:
+        client = get_stripe_client()
+
+        assert client.api_key == "sk_test_from_settings"
+        assert get_stripe_client() is client
+    finally:
+        await close_stripe_client()
+
+
+@requires_stripe_mock
+async def test_stripe_mock_create_customer():
+    client = StripeClient(api_key="sk_test_123", base_url=STRIPE_MOCK_URL)
+    try:
+        customer = await client.create_customer(
+            idempotency_key="customer-1",
+            email="a@example.com",
+            metadata={"user_id": "1"},
+        )
+    finally:
+        await client.close()
+
+    assert customer.id.startswith("cus_")
+    assert customer.object == "customer"
+
+
+@requires_stripe_mock
+async def test_stripe_mock_modify_subscription():
+    client = StripeClient(api_key="sk_test_123", base_url=STRIPE_MOCK_URL)
+    try:
+        subscription = await client.modify_subscription(
+            "sub_123", cancel_at_period_end=True
+        )
+    finally:
+        await client.close()
+
+    assert subscription.object == "subscription"
+
+
+@requires_stripe_mock
+async def test_stripe_mock_rejects_unknown_parameter():
+    client = StripeClient(api_key="sk_test_123", base_url=STRIPE_MOCK_URL)
+    try:
+        with pytest.raises(stripe.error.InvalidRequestError):
+            await client.create_customer(not_a_customer_field="x")
+    finally:
+        await client.close()
+
+
+@requires_stripe_mock
+async def test_stripe_mock_rejects_bad_api_key():
+    client = StripeClient(api_key="not-a-key", base_url=STRIPE_MOCK_URL)
+    try:
+        with pytest.raises(stripe.error.AuthenticationError):
+            await client.retrieve_subscription("sub_123")
+    finally:
+        await client.close()
@@ -0,0 +1,105 @@
+"""
+Concurrent first requests must provision exactly one user row.
+"""
+
+import asyncio
+import uuid
+
+from sqlalchemy import func, select
+
+from app import auth
+from app.auth import get_or_create_anonymous_user, get_or_create_keycloak_user
+from app.database import READ_ONLY
+from app.models import User
+
+CONCURRENT_REQUESTS = 200
+
+
+async def _count_users(db, *criteria) -> int:
+    result = await db.execute(
+        select(func.count()).select_from(User).where(*criteria)
+    )
+    return result.scalar_one()
+
+
+async def test_concurrent_first_anonymous_requests_create_one_user(
+    session_factory, db
+):
+    anonymous_id = str(uuid.uuid4())
+
+    async def first_request():
+        async with session_factory() as session:
+            user = await get_or_create_anonymous_user(session, anonymous_id)
+            return user.id
+
+    ids = await asyncio.gather(
+        *(first_request() for _ in range(CONCURRENT_REQUESTS))
+    )
+
+    assert set(ids) == {uuid.UUID(anonymous_id)}
+    assert await _count_users(db) == 1
+
+
+async def test_concurrent_first_logins_create_one_user(session_factory, db):
+    keycloak_id = str(uuid.uuid4())
+
+    async def first_login():
+        async with session_factory() as session:
+            user = await get_or_create_keycloak_user(
+                session, keycloak_id, "first@example.com", "first"
+            )
+            return user.id
+
+    ids = await asyncio.gather(
+        *(first_login() for _ in range(CONCURRENT_REQUESTS))
+    )
+
+    assert len(set(ids)) == 1
+    assert await _count_users(db, User.keycloak_id == keycloak_id) == 1
+
+
+async def test_known_keycloak_user_is_only_selected(
+    session_factory, monkeypatch
+):
+    keycloak_id = str(uuid.uuid4())
+    async with session_factory() as session:
+        created = await get_or_create_keycloak_user(
+            session, keycloak_id, "known@example.com", "known"
+        )
+
+    async def no_upsert(*args, **kwargs):
+        raise AssertionError("known users must not be upserted")
+
+    monkeypatch.setattr(auth, "_provision_user", no_upsert)
+    async with session_factory() as session:
+        user = await get_or_create_keycloak_user(
+            session, keycloak_id, "known@example.com", "known"
+        )
+    assert user.id == created.id
+
+
+async def test_users_are_provisioned_on_primary_from_read_session(
+    session_factory, db, monkeypatch
+):
+    keycloak_id = str(uuid.uuid4())
+    provisioned_on = []
+    provision_user = auth._provision_user
+
+    async def recording_provision_user(session, *args):
+        provisioned_on.append(session)
+        return await provision_user(session, *args)
+
+    monkeypatch.setattr(auth, "AsyncSessionLocal", session_factory)
+    monkeypatch.setattr(auth, "_provision_user", recording_provision_user)
+    async with session_factory(info={READ_ONLY: True}) as read_session:
+        user = await get_or_create_keycloak_user(
+            read_session, keycloak_id, "replica@example.com", "replica"
+        )
+        again = await get_or_create_keycloak_user(
+            read_session, keycloak_id, "replica@example.com", "replica"
+        )
+
+    assert again.id == user.id
+    assert len(provisioned_on) == 1
+    assert provisioned_on[0] is not read_session
+    assert await _count_users(db, User.keycloak_id == keycloak_id) == 1
@@ -0,0 +1,121 @@
+"""
+WebSocket connections are identified by signed tokens, never bare ids.
+"""
+
+import uuid
+from datetime import datetime
+
+import pytest
+from starlette.testclient import TestClient
+from starlette.websockets import WebSocketDisconnect
+
+from app.auth import (
+    ANONYMOUS_TOKEN_COOKIE,
+    _b64encode,
+    get_current_user_ws,
+    issue_anonymous_token,
+)
+from app.models import Note, User
+
+
+class FakeWebSocket:
+    def __init__(self, cookies=None):
+        self.cookies = cookies or {}
+
+
+def _anonymous_user() -> User:
+    return User(
+        id=uuid.uuid4(),
+        is_anonymous=True,
+        is_premium=False,
+        created_at=datetime.utcnow(),
+    )
+
+
+async def test_signed_anonymous_token_identifies_user():
+    user = _anonymous_user()
+
+    found = await get_current_user_ws(
+        FakeWebSocket(), None, anonymous_token=issue_anonymous_token(user)
+    )
+
+    assert found.id == user.id
+    assert found.is_anonymous
+
+
+async def test_signed_anonymous_token_cookie_identifies_user():
+    user = _anonymous_user()
+    websocket = FakeWebSocket(
+        {ANONYMOUS_TOKEN_COOKIE: issue_anonymous_token(user)}
+    )
+
+    found = await get_current_user_ws(websocket, None)
+
+    assert found.id == user.id
+
+
+async def test_bare_user_id_is_rejected():
+    user = _anonymous_user()
+
+    found = await get_current_user_ws(
+        FakeWebSocket(), None, anonymous_token=str(user.id)
+    )
+
+    assert found is None
+
+
+async def test_token_with_forged_signature_is_rejected():
+    user = _anonymous_user()
+    payload = issue_anonymous_token(user).partition(".")[0]
+
+    found = await get_current_user_ws(
+        FakeWebSocket(),
+        None,
+        anonymous_token=f"{payload}.{_b64encode(b'forged')}",
+    )
+
+    assert found is None
+
+
+@pytest.fixture
+async def private_note(db):
+    owner = _anonymous_user()
+    note = Note(
+        title="Private",
+        owner_id=owner.id,
+        is_public=False,
+        mongodb_content_id=str(uuid.uuid4()),
+    )
+    db.add(owner)
+    await db.flush()
+    db.add(note)
+    await db.commit()
+    return owner, note
+
+
+def test_endpoint_rejects_unsigned_user_id(private_note):
+    from app.main import app
+
+    owner, note = private_note
+
+    with pytest.raises(WebSocketDisconnect) as closed:
+        with TestClient(app).websocket_connect(
+            f"/ws/notes/{note.id}?user_id={owner.id}"
+        ) as websocket:
+            websocket.receive_json()
+
+    assert closed.value.code == 1008
+
+
+def test_endpoint_accepts_signed_anonymous_token(private_note):
+    from app.main import app
+
+    owner, note = private_note
+    token = issue_anonymous_token(owner)
+
+    with TestClient(app).websocket_connect(
+        f"/ws/notes/{note.id}?anonymous_token={token}"
+    ) as websocket:
+        message = websocket.receive_json()
+
+    assert message["type"] == "user_list"
@@ -7,5 +7,6 @@ db.createCollection('note_contents');
 // Create indexes for better performance
 db.note_contents.createIndex({ "created_at": -1 });
 db.note_contents.createIndex({ "updated_at": -1 });
+db.note_contents.createIndex({ "note_id": 1 });
 
 print('MongoDB initialized successfully');
@@ -386,10 +386,18 @@ const NoteList = () => {
                       </Space>
                     }
                     description={
-                      <Text type="secondary" style={{ fontSize: 12 }}>
-                        {new Date(note.updated_at).toLocaleDateString()} at{' '}
-                        {new Date(note.updated_at).toLocaleTimeString()}
-                      </Text>
+                      <Space orientation="vertical" size={4} style={{ width: '100%' }}>
+                        {note.content_preview && (
+                          <Text type="secondary" ellipsis={{ tooltip: note.content_preview }}>
+                            {note.content_preview}
+                          </Text>
+                        )}
+                        <Text type="secondary" style={{ fontSize: 12 }}>
+                          {new Date(note.updated_at).toLocaleDateString()} at{' '}
+                          {new Date(note.updated_at).toLocaleTimeString()}
+                          {note.word_count !== undefined && ` · ${note.word_count} words`}
+                        </Text>
+                      </Space>
                     }
                   />
                 </Card>
@@ -57,6 +57,7 @@ export const AuthProvider = ({ children, isDarkMode, toggleTheme }: AuthProvider
 
         // Clear anonymous user data when logging in
         localStorage.removeItem('anonymousUserId');
+        localStorage.removeItem('anonymousToken');
 
         // Use token claims directly instead of loading profile to avoid CORS issues
         const profile = {
@@ -172,6 +173,7 @@ export const AuthProvider = ({ children, isDarkMode, toggleTheme }: AuthProvider
     // Clear token and anonymous ID on logout
     localStorage.removeItem('token');
     localStorage.removeItem('anonymousUserId');
+    localStorage.removeItem('anonymousToken');
     // Generate a new anonymous ID for the logged-out state
     const newAnonId = crypto.randomUUID();
     localStorage.setItem('anonymousUserId', newAnonId);
@@ -16,10 +16,17 @@ api.interceptors.request.use(
     if (token) {
       config.headers.Authorization = `Bearer ${token}`;
     } else {
-      // For anonymous users, send the ID from localStorage as a custom header
-      const anonymousId = localStorage.getItem('anonymousUserId');
-      if (anonymousId) {
-        config.headers['X-Anonymous-User-Id'] = anonymousId;
+      // For anonymous users, send the signed session token issued by the backend
+      const anonymousToken = localStorage.getItem('anonymousToken');
+      if (anonymousToken) {
+        config.headers['X-Anonymous-Token'] = anonymousToken;
+      } else {
+        // Legacy raw ID, only sent until the backend has issued a token
+        // (honoured only while the backend enables ANONYMOUS_LEGACY_IDS)
+        const anonymousId = localStorage.getItem('anonymousUserId');
+        if (anonymousId) {
+          config.headers['X-Anonymous-User-Id'] = anonymousId;
+        }
       }
     }
 
@@ -40,7 +47,14 @@ api.interceptors.request.use(
 
 // Response interceptor for error handling
 api.interceptors.response.use(
-  (response) => response,
+  (response) => {
+    // Keep the anonymous session token fresh when the backend reissues it
+    const anonymousToken = response.headers['x-anonymous-token'];
+    if (anonymousToken && !localStorage.getItem('token')) {
+      localStorage.setItem('anonymousToken', anonymousToken);
+    }
+    return response;
+  },
   (error) => {
     if (error.response?.status === 401) {
       // Handle unauthorized
@@ -3,6 +3,15 @@ import type {
   Note,
   CreateNoteRequest,
   UpdateNoteRequest,
+  PatchNoteRequest,
+  PatchNoteResponse,
+  NoteBatchResponse,
+  NoteChangesResponse,
+  NoteExportFormat,
+  NoteImportResponse,
+  NoteSearchResult,
+  NoteVersion,
+  NoteVersionContent,
   ShareNoteRequest,
   ShareNoteResponse,
 } from '../types';
@@ -14,6 +23,7 @@ export const noteService = {
     username: string;
     email: string | null;
     is_anonymous: boolean;
+    anonymous_token: string | null;
   }> => {
     const response = await api.get('/api/notes/me');
     const userData = response.data;
@@ -21,6 +31,9 @@ export const noteService = {
     // Store anonymous user ID in localStorage if user is anonymous
     if (userData.is_anonymous && userData.id) {
       localStorage.setItem('anonymousUserId', userData.id);
+      if (userData.anonymous_token) {
+        localStorage.setItem('anonymousToken', userData.anonymous_token);
+      }
       console.log('[NoteService] Stored anonymous user ID:', userData.id);
     }
 
@@ -51,11 +64,93 @@ export const noteService = {
     return response.data;
   },
 
+  // Apply a content delta against a base revision (409 if it has changed)
+  patchNote: async (noteId: string, patchData: PatchNoteRequest): Promise<PatchNoteResponse> => {
+    const response = await api.patch<PatchNoteResponse>(`/api/notes/${noteId}`, patchData);
+    return response.data;
+  },
+
   // Delete a note
   deleteNote: async (noteId: string): Promise<void> => {
     await api.delete(`/api/notes/${noteId}`);
   },
 
+  // Notes changed or removed since a sync token (all notes without one).
+  // Follow next_token while has_more; a 410 means the list must be refetched.
+  getNoteChanges: async (since?: string): Promise<NoteChangesResponse> => {
+    const response = await api.get<NoteChangesResponse>('/api/notes/changes', {
+      params: since ? { since } : {},
+    });
+    return response.data;
+  },
+
+  // Full-text search over accessible notes, best matches first
+  searchNotes: async (query: string, skip = 0, limit = 20): Promise<NoteSearchResult[]> => {
+    const response = await api.get<NoteSearchResult[]>('/api/notes/search', {
+      params: { q: query, skip, limit },
+    });
+    return response.data;
+  },
+
+  // Batch operations: one result per item, in request order
+  batchGetNotes: async (noteIds: string[]): Promise<NoteBatchResponse> => {
+    const response = await api.post<NoteBatchResponse>('/api/notes/batch-get', { note_ids: noteIds });
+    return response.data;
+  },
+
+  batchCreateNotes: async (notes: CreateNoteRequest[]): Promise<NoteBatchResponse> => {
+    const response = await api.post<NoteBatchResponse>('/api/notes/batch-create', { notes });
+    return response.data;
+  },
+
+  batchDeleteNotes: async (noteIds: string[]): Promise<NoteBatchResponse> => {
+    const response = await api.post<NoteBatchResponse>('/api/notes/batch-delete', { note_ids: noteIds });
+    return response.data;
+  },
+
+  // List saved content revisions, newest first
+  getNoteVersions: async (noteId: string, before?: number, limit = 50): Promise<NoteVersion[]> => {
+    const response = await api.get<NoteVersion[]>(`/api/notes/${noteId}/versions`, {
+      params: { before, limit },
+    });
+    return response.data;
+  },
+
+  // Get a note's content as of a revision or a point in time (ISO 8601)
+  getNoteVersionContent: async (
+    noteId: string,
+    at: { revision: number } | { at: string }
+  ): Promise<NoteVersionContent> => {
+    const response = await api.get<NoteVersionContent>(`/api/notes/${noteId}/versions/content`, {
+      params: at,
+    });
+    return response.data;
+  },
+
+  // Restore a note's content to an earlier revision (saved as a new revision)
+  restoreNoteVersion: async (noteId: string, revision: number): Promise<Note> => {
+    const response = await api.post<Note>(`/api/notes/${noteId}/versions/${revision}/restore`);
+    return response.data;
+  },
+
+  // Export all accessible notes as an NDJSON or ZIP file
+  exportNotes: async (format: NoteExportFormat = 'ndjson'): Promise<Blob> => {
+    const response = await api.get<Blob>('/api/notes/export', {
+      params: { format },
+      responseType: 'blob',
+    });
+    return response.data;
+  },
+
+  // Import notes from an NDJSON or ZIP export
+  importNotes: async (file: File): Promise<NoteImportResponse> => {
+    const contentType = file.name.endsWith('.zip') ? 'application/zip' : 'application/x-ndjson';
+    const response = await api.post<NoteImportResponse>('/api/notes/import', file, {
+      headers: { 'Content-Type': contentType },
+    });
+    return response.data;
+  },
+
   // Share a note
   shareNote: async (noteId: string, shareData: ShareNoteRequest): Promise<ShareNoteResponse> => {
     const response = await api.post<ShareNoteResponse>(`/api/notes/${noteId}/share`, shareData);
@@ -20,7 +20,14 @@ class WebSocketService {
     this.username = username;
     this.token = token || null;
 
-    const wsUrl = `${config.wsUrl}/ws/notes/${noteId}?user_id=${userId}&username=${encodeURIComponent(username)}${token ? `&token=${token}` : ''}`;
+    // The server identifies users by their signed token only, never by id
+    const anonymousToken = token ? null : localStorage.getItem('anonymousToken');
+    const credentials = token
+      ? `&token=${encodeURIComponent(token)}`
+      : anonymousToken
+        ? `&anonymous_token=${encodeURIComponent(anonymousToken)}`
+        : '';
+    const wsUrl = `${config.wsUrl}/ws/notes/${noteId}?username=${encodeURIComponent(username)}${credentials}`;
 
     this.ws = new WebSocket(wsUrl);
 
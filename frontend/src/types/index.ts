@@ -16,6 +16,13 @@ export interface Note {
   is_public: boolean;
   share_token?: string | null;
   share_permission_level?: string | null;
+  revision: number;
+  // Listing fields, stored on the note row
+  content_preview?: string | null;
+  char_count?: number;
+  line_count?: number;
+  word_count?: number;
+  content_hash?: string | null;
   created_at: string;
   updated_at: string;
   permissions?: NotePermission[];
@@ -43,6 +50,76 @@ export interface UpdateNoteRequest {
   is_public?: boolean;
 }
 
+export interface ContentEdit {
+  operation: 'insert' | 'delete' | 'replace';
+  position: number;
+  content?: string;
+  length?: number;
+}
+
+export interface PatchNoteRequest {
+  base_revision: number;
+  edits?: ContentEdit[];
+  diff?: string;
+}
+
+export interface NoteChangesResponse {
+  notes: Note[];
+  deleted: string[];
+  next_token: string;
+  has_more: boolean;
+}
+
+export interface NoteVersion {
+  revision: number;
+  created_at: string;
+  user_id: string | null;
+  size: number;
+  snapshot: boolean;
+}
+
+export interface NoteVersionContent {
+  id: string;
+  revision: number;
+  content: string;
+}
+
+export type NoteExportFormat = 'ndjson' | 'zip';
+
+export interface NoteImportError {
+  record: string;
+  status_code: number;
+  detail: string;
+}
+
+export interface NoteImportResponse {
+  created: number;
+  errors: NoteImportError[];
+}
+
+export interface NoteSearchResult extends Note {
+  rank: number;
+  // HTML-escaped excerpt with matches wrapped in <mark>
+  snippet?: string | null;
+}
+
+export interface NoteBatchResult {
+  id?: string | null;
+  status_code: number;
+  detail?: string | null;
+  note?: Note | null;
+}
+
+export interface NoteBatchResponse {
+  results: NoteBatchResult[];
+}
+
+export interface PatchNoteResponse {
+  id: string;
+  revision: number;
+  updated_at: string;
+}
+
 export interface ShareNoteRequest {
   user_email?: string;
   permission_level: 'read' | 'write' | 'admin';